@@ -0,0 +1,85 @@
+"""Invoice and folio rendering.
+
+Runs in worker processes, so it only depends on the standard library and
+works on plain dicts prepared by server.invoice_documents().
+"""
+from html import escape
+
+STYLE = """
+body { font-family: Helvetica, Arial, sans-serif; color: #111827; margin: 40px; }
+h1 { font-size: 22px; margin: 0; }
+h2 { font-size: 16px; color: #4b5563; margin: 4px 0 24px; }
+table { width: 100%; border-collapse: collapse; margin-top: 16px; }
+th, td { padding: 6px 8px; border-bottom: 1px solid #e5e7eb; text-align: left; }
+td.amount, th.amount { text-align: right; }
+.summary td { border: none; }
+.total td { font-weight: bold; border-top: 2px solid #111827; }
+"""
+
+
+def money(symbol: str, amount: float) -> str:
+    sign = "-" if amount < 0 else ""
+    return f"{sign}{escape(symbol)}{abs(amount):,.2f}"
+
+
+def render_document(document: dict) -> str:
+    """Render an invoice (charges and payments) or folio (full ledger) as HTML."""
+    settings = document["settings"]
+    symbol = settings["currency_symbol"]
+    booking = document["booking"]
+    guest = document["guest"]
+    folio = document["folio"]
+    title = "Invoice" if document["kind"] == "invoice" else "Guest Folio"
+
+    rows = []
+    if document["kind"] == "invoice":
+        for entry in document["entries"]:
+            if entry["entry_type"] != "charge":
+                continue
+            rows.append(
+                f"<tr><td>{escape(entry['created_at'][:10])}</td>"
+                f"<td>{escape(entry['description'] or entry['category'].title())}</td>"
+                f"<td class=\"amount\">{money(symbol, entry['amount'])}</td></tr>"
+            )
+        header = "<tr><th>Date</th><th>Description</th><th class=\"amount\">Amount</th></tr>"
+    else:
+        for entry in document["entries"]:
+            signed = entry["amount"] if entry["entry_type"] == "charge" else -entry["amount"]
+            rows.append(
+                f"<tr><td>{entry['sequence']}</td><td>{escape(entry['created_at'][:10])}</td>"
+                f"<td>{escape(entry['category'].title())}</td>"
+                f"<td>{escape(entry['description'])}</td><td>{escape(entry['payment_method'])}</td>"
+                f"<td class=\"amount\">{money(symbol, signed)}</td>"
+                f"<td class=\"amount\">{money(symbol, entry['balance_after'])}</td></tr>"
+            )
+        header = ("<tr><th>#</th><th>Date</th><th>Type</th><th>Description</th><th>Method</th>"
+                  "<th class=\"amount\">Amount</th><th class=\"amount\">Balance</th></tr>")
+
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title} {escape(document['number'])}</title>
+<style>{STYLE}</style></head>
+<body>
+<h1>{escape(settings['hotel_name'])}</h1>
+<h2>{title} {escape(document['number'])}</h2>
+<table class="summary">
+<tr><td>Guest</td><td>{escape(guest['name'])}</td><td>Room</td><td>{escape(document['room_number'])}</td></tr>
+<tr><td>Email</td><td>{escape(guest['email'])}</td><td>Stay</td>
+<td>{escape(booking['check_in'])} to {escape(booking['check_out'])}</td></tr>
+<tr><td>Booking</td><td>{escape(booking['booking_id'])}</td><td>Currency</td><td>{escape(settings['currency'])}</td></tr>
+</table>
+<table>
+{header}
+{"".join(rows)}
+</table>
+<table class="summary">
+<tr><td>Charges</td><td class="amount">{money(symbol, folio['charges_total'])}</td></tr>
+<tr><td>Payments</td><td class="amount">{money(symbol, folio['payments_total'])}</td></tr>
+<tr class="total"><td>Balance due</td><td class="amount">{money(symbol, folio['balance'])}</td></tr>
+</table>
+</body></html>
+"""
+
+
+def render_documents(documents: list) -> list:
+    """Render a batch in one worker call to amortise the process round trip."""
+    return [render_document(document) for document in documents]
@@ -1,29 +1,425 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.middleware.gzip import GZipMiddleware
 import os
+import sys
+import json
+import math
+import time
+import gzip
+import copy
+import hmac
+import queue
+import bisect
+import hashlib
+import atexit
+import asyncio
+import random
 import logging
+import logging.handlers
+import contextvars
+import importlib.util
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
+from collections import Counter, OrderedDict, defaultdict
 import uuid
 from datetime import datetime, date, timedelta
 import bcrypt
 import jwt
 from jwt.exceptions import InvalidTokenError
 
+import invoices
+
+try:
+    import brotli
+except ImportError:  # optional: responses fall back to gzip
+    brotli = None
+
+def lazy_import(name: str):
+    """Defer executing a module until its first attribute access.
+
+    Keeps heavy dependencies out of the API's import time; see
+    `python backend_benchmark.py startup` for the import budget report.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+np = lazy_import("numpy")
+pymongo = lazy_import("pymongo")
+motor_asyncio = lazy_import("motor.motor_asyncio")
+httpx = lazy_import("httpx")
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Structured logging
+# Loggers only enqueue records; a QueueListener thread formats them as JSON
+# lines and writes them out. The queue is bounded, and a record that finds
+# it full is dropped and counted rather than blocking the event loop. Errors
+# repeated from one call site are sampled: LOG_ERROR_BURST per window, with
+# the number suppressed reported on the next record from that site.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # "json" or "text"
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_ERROR_BURST = int(os.environ.get("LOG_ERROR_BURST", "10"))
+LOG_ERROR_WINDOW = float(os.environ.get("LOG_ERROR_WINDOW", "60"))
+# Fields of the current request or job, attached to every record logged under it
+log_context = contextvars.ContextVar("log_context", default=None)
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+            **getattr(record, "fields", {}),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class ErrorSampler(logging.Filter):
+    """Passes the first `burst` errors per call site in each window and counts the rest."""
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.sites = {}  # (pathname, lineno) -> [window start, errors, suppressed]
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        site = self.sites.get(key)
+        if site is None or record.created - site[0] >= self.window:
+            if site and site[2]:
+                record.suppressed = site[2]
+            self.sites[key] = [record.created, 1, 0]
+            return True
+        site[1] += 1
+        if site[1] <= self.burst:
+            return True
+        site[2] += 1
+        self.suppressed += 1
+        return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records that find the queue full are dropped and counted."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Runs in the caller, where the request's context variables are visible
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self.exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        context = log_context.get()
+        if context is not None:
+            fields = {key: value for key, value in context.items() if key != "scope"}
+            scope = context.get("scope")
+            if scope is not None:
+                # The route template once routing has matched, else the raw path
+                fields["route"] = scope["route"].path if "route" in scope else scope["path"]
+            fields.setdefault("property_id", current_property.get())
+            record.context = fields
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+log_handler = DroppingQueueHandler(log_queue)
+error_sampler = ErrorSampler(LOG_ERROR_BURST, LOG_ERROR_WINDOW)
+log_handler.addFilter(error_sampler)
+log_output = logging.StreamHandler()
+log_output.setFormatter(
+    JsonFormatter() if LOG_FORMAT == "json"
+    else logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+)
+log_listener = logging.handlers.QueueListener(log_queue, log_output)
+log_listener.start()
+
+def stop_log_listener():
+    # Write out what is still queued before the interpreter exits
+    try:
+        log_listener.stop()
+    except queue.Full:
+        pass
+
+atexit.register(stop_log_listener)
+logging.basicConfig(level=LOG_LEVEL, handlers=[log_handler])
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger(f"{__name__}.access")
+
+# Multi-property tenancy
+DEFAULT_PROPERTY_ID = os.environ.get("DEFAULT_PROPERTY_ID", "default")
+current_property = contextvars.ContextVar("current_property", default=DEFAULT_PROPERTY_ID)
+
+# Collections shared by every property, e.g. the job outbox drained by one worker pool
+GLOBAL_COLLECTIONS = {"jobs"}
+
+class TenantRouter:
+    """Maps property ids to the database that stores their documents.
+
+    TENANT_ROUTES is a JSON object of property_id -> {"mongo_url", "db_name"};
+    either key may be omitted, and properties without a route share the
+    default database. It is also the registry of properties: only the
+    default property and the routed ones are served. Clients are created
+    once per distinct mongo_url.
+    """
+
+    def __init__(self, default_url: str, default_db_name: str, routes: dict):
+        self.default_url = default_url
+        self.default_db_name = default_db_name
+        self.routes = routes
+        self.clients = {}
+        self.collections = {}
+
+    def client_for(self, url: str):
+        if url not in self.clients:
+            self.clients[url] = motor_asyncio.AsyncIOMotorClient(url)
+        return self.clients[url]
+
+    def location(self, property_id: str):
+        route = self.routes.get(property_id, {})
+        return route.get("mongo_url", self.default_url), route.get("db_name", self.default_db_name)
+
+    def database(self, property_id: str):
+        url, db_name = self.location(property_id)
+        return self.client_for(url)[db_name]
+
+    def collection(self, property_id: str, name: str, secondary: bool = False):
+        """A property's collection with its configured write concern and read preference."""
+        url, db_name = self.location(property_id)
+        key = (url, db_name, name, secondary)
+        if key not in self.collections:
+            options = {}
+            if name in MAJORITY_WRITE_COLLECTIONS:
+                options["write_concern"] = pymongo.WriteConcern(w=MONGO_WRITE_CONCERN, wtimeout=MONGO_WRITE_TIMEOUT_MS)
+            if secondary:
+                options["read_preference"] = secondary_read_preference()
+            self.collections[key] = self.client_for(url)[db_name].get_collection(name, **options)
+        return self.collections[key]
+
+    def default_database(self):
+        return self.client_for(self.default_url)[self.default_db_name]
+
+    def databases(self):
+        locations = {(self.default_url, self.default_db_name)}
+        locations.update(self.location(property_id) for property_id in self.routes)
+        return [self.client_for(url)[db_name] for url, db_name in sorted(locations)]
+
+    def close(self):
+        for routed_client in self.clients.values():
+            routed_client.close()
+
+class ScopedCollection:
+    """Collection wrapper that confines every operation to one property.
+
+    Filters get a property_id condition, inserted documents get a property_id
+    field, aggregations start with a property_id $match and indexes lead with
+    property_id. $lookup stages inside a pipeline are not rewritten.
+    """
+
+    def __init__(self, collection, property_id: str):
+        self.collection = collection
+        self.property_id = property_id
+
+    def scoped(self, filter: Optional[dict] = None) -> dict:
+        return {**(filter or {}), "property_id": self.property_id}
+
+    def find(self, filter: Optional[dict] = None, *args, **kwargs):
+        return self.collection.find(self.scoped(filter), *args, **kwargs)
+
+    async def find_one(self, filter: Optional[dict] = None, *args, **kwargs):
+        return await self.collection.find_one(self.scoped(filter), *args, **kwargs)
+
+    async def count_documents(self, filter: dict, **kwargs):
+        return await self.collection.count_documents(self.scoped(filter), **kwargs)
+
+    async def distinct(self, key: str, filter: Optional[dict] = None, **kwargs):
+        return await self.collection.distinct(key, self.scoped(filter), **kwargs)
+
+    async def insert_one(self, document: dict, **kwargs):
+        document["property_id"] = self.property_id
+        return await self.collection.insert_one(document, **kwargs)
+
+    async def insert_many(self, documents: List[dict], **kwargs):
+        for document in documents:
+            document["property_id"] = self.property_id
+        return await self.collection.insert_many(documents, **kwargs)
+
+    async def update_one(self, filter: dict, update, **kwargs):
+        return await self.collection.update_one(self.scoped(filter), update, **kwargs)
+
+    async def update_many(self, filter: dict, update, **kwargs):
+        return await self.collection.update_many(self.scoped(filter), update, **kwargs)
+
+    async def find_one_and_update(self, filter: dict, update, **kwargs):
+        return await self.collection.find_one_and_update(self.scoped(filter), update, **kwargs)
+
+    async def find_one_and_delete(self, filter: dict, **kwargs):
+        return await self.collection.find_one_and_delete(self.scoped(filter), **kwargs)
+
+    async def delete_one(self, filter: dict, **kwargs):
+        return await self.collection.delete_one(self.scoped(filter), **kwargs)
+
+    async def delete_many(self, filter: dict, **kwargs):
+        return await self.collection.delete_many(self.scoped(filter), **kwargs)
+
+    def aggregate(self, pipeline: List[dict], **kwargs):
+        return self.collection.aggregate([{"$match": {"property_id": self.property_id}}] + pipeline, **kwargs)
+
+class ScopedDatabase:
+    """Database facade resolving the current property's collections on access."""
+
+    def __init__(self, router: TenantRouter):
+        self.router = router
+
+    def __getitem__(self, name: str):
+        if name in GLOBAL_COLLECTIONS:
+            return self.router.default_database()[name]
+        property_id = current_property.get()
+        return ScopedCollection(self.router.collection(property_id, name, secondary_reads.get()), property_id)
+
+    def __getattr__(self, name: str):
+        return self[name]
+
+class PerProperty:
+    """Lazily created per-property instances of in-process state.
+
+    Attribute access is forwarded to the instance of the current property.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.instances = {}
+
+    def get(self):
+        property_id = current_property.get()
+        if property_id not in self.instances:
+            self.instances[property_id] = self.factory()
+        return self.instances[property_id]
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
+
+# Read and write routing
+# Booking and payment collections are written with an explicit majority write
+# concern so an acknowledged booking survives a primary failover. Read-only
+# reporting endpoints may be served by secondaries that lag the primary by at
+# most MONGO_MAX_STALENESS_SECONDS (MongoDB's minimum is 90; -1 means no bound).
+MONGO_WRITE_CONCERN = os.environ.get("MONGO_WRITE_CONCERN", "majority")
+MONGO_WRITE_TIMEOUT_MS = int(os.environ.get("MONGO_WRITE_TIMEOUT_MS", "5000"))
+MAJORITY_WRITE_COLLECTIONS = set(filter(None, os.environ.get(
+    "MONGO_MAJORITY_COLLECTIONS", "bookings,room_nights,folios,folio_entries,sales"
+).split(",")))
+MONGO_SECONDARY_READ_PREFERENCE = os.environ.get("MONGO_SECONDARY_READ_PREFERENCE", "secondaryPreferred")
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", "90"))
+# (method, path) of read-only endpoints whose queries may go to secondaries
+SECONDARY_READ_ROUTES = {
+    ("GET", "/api/dashboard/stats"),
+    ("GET", "/api/sales"),
+    ("POST", "/api/reports/query"),
+}
+secondary_reads = contextvars.ContextVar("secondary_reads", default=False)
+
+def secondary_read_preference():
+    modes = {
+        "primary": pymongo.read_preferences.Primary,
+        "primaryPreferred": pymongo.read_preferences.PrimaryPreferred,
+        "secondary": pymongo.read_preferences.Secondary,
+        "secondaryPreferred": pymongo.read_preferences.SecondaryPreferred,
+        "nearest": pymongo.read_preferences.Nearest,
+    }
+    if MONGO_SECONDARY_READ_PREFERENCE == "primary":
+        return modes["primary"]()
+    return modes[MONGO_SECONDARY_READ_PREFERENCE](max_staleness=MONGO_MAX_STALENESS_SECONDS)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+tenant_router = TenantRouter(mongo_url, os.environ['DB_NAME'], json.loads(os.environ.get("TENANT_ROUTES", "{}")))
+db = ScopedDatabase(tenant_router)
+
+async def run_migrations() -> bool:
+    """Backfill legacy documents and create indexes before any request is served.
+
+    Until property ids and room-night claims are backfilled, the scoped
+    collections hide legacy documents and new bookings can take nights
+    legacy bookings hold. Skipped when MongoDB cannot be reached, so the
+    app still starts; returns whether the migrations ran.
+    """
+    try:
+        for database in tenant_router.databases():
+            await database.command("ping")
+    except Exception as e:
+        logger.error(f"Migrations skipped, MongoDB is unreachable: {str(e)}")
+        return False
+    await backfill_property_ids()
+    await ensure_indexes()
+    for property_id in sorted({DEFAULT_PROPERTY_ID, *tenant_router.routes}):
+        token = current_property.set(property_id)
+        try:
+            await backfill_room_nights()
+        finally:
+            current_property.reset(token)
+    logger.info("Migrations completed")
+    return True
+
+async def warm_up():
+    """Prepare per-property caches without delaying the first request."""
+    try:
+        for property_id in sorted({DEFAULT_PROPERTY_ID, *tenant_router.routes}):
+            current_property.set(property_id)
+            await rate_calendar.ensure_fresh()
+        logger.info("Warm-up completed")
+    except Exception as e:
+        logger.error(f"Warm-up error: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_migrations()
+    job_queue.start()
+    audit_log.start()
+    warm_up_task = asyncio.create_task(warm_up())
+    yield
+    warm_up_task.cancel()
+    await job_queue.stop()
+    await audit_log.stop()
+    invoice_renderer.shutdown()
+    tenant_router.close()
 
 # Create the main app without a prefix
-app = FastAPI(title="Hotel Management System API")
+app = FastAPI(title="Hotel Management System API", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -40,7 +436,7 @@ class Room(BaseModel):
     room_type: str  # "single", "double", "suite", "deluxe"
     price_per_night: float
     amenities: List[str]
-    status: str = "available"  # "available", "occupied", "maintenance"
+    status: str = "available"  # "available", "occupied", "dirty", "clean", "inspected", "maintenance"
     max_occupancy: int
     description: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -69,6 +465,19 @@ class GuestCreate(BaseModel):
     address: str
     id_proof: str
 
+class GuestProfile(BaseModel):
+    guest_id: str
+    stays: int = 0  # completed (checked out) stays
+    nights: int = 0
+    cancellations: int = 0  # cancelled or no-show bookings
+    total_spend: float = 0.0  # sum of the guest's sales
+    last_stay: Optional[date] = None  # check-out date of the latest completed stay
+    longest_stay: int = 0
+    room_type_nights: Dict[str, int] = {}
+    preferred_room_type: Optional[str] = None
+    tags: List[str] = []
+    updated_at: Optional[datetime] = None
+
 class Booking(BaseModel):
     booking_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     room_id: str
@@ -77,9 +486,10 @@ class Booking(BaseModel):
     check_out: date
     total_amount: float
     advance_payment: float = 0.0
-    status: str = "confirmed"  # "confirmed", "cancelled", "checked_in", "checked_out"
+    status: str = "confirmed"  # "confirmed", "cancelled", "checked_in", "checked_out", "no_show"
     guests_count: int
     special_requests: str = ""
+    group_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class BookingCreate(BaseModel):
@@ -94,6 +504,7 @@ class BookingCreate(BaseModel):
     guests_count: int = 1
     special_requests: str = ""
     advance_payment: float = 0.0
+    join_waitlist: bool = False  # queue for the room's type instead of failing when the room is taken
 
 class BookingWithDetails(BaseModel):
     booking_id: str
@@ -111,6 +522,189 @@ class BookingWithDetails(BaseModel):
     special_requests: str
     created_at: datetime
 
+class GroupBookingCreate(BaseModel):
+    group_name: str
+    guest_name: str
+    guest_email: str = ""
+    guest_phone: str = ""
+    guest_address: str = ""
+    guest_id_proof: str = ""
+    check_in: date
+    check_out: date
+    rooms: Dict[str, int]  # room_type -> number of rooms
+    guests_per_room: int = 1
+    special_requests: str = ""
+
+class BookingGroup(BaseModel):
+    group_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    group_name: str
+    guest_id: str
+    check_in: date
+    check_out: date
+    booking_ids: List[str]
+    room_ids: List[str]
+    total_amount: float
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class WaitlistEntry(BaseModel):
+    waitlist_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    room_type: str
+    guest_id: str
+    check_in: date
+    check_out: date
+    guests_count: int
+    special_requests: str = ""
+    advance_payment: float = 0.0
+    status: str = "waiting"  # "waiting", "allocated", "cancelled"
+    overbooked: bool = False  # promised against the room type's overbooking limit
+    booking_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class WaitlistCreate(BaseModel):
+    room_type: str
+    guest_name: str
+    guest_email: str = ""
+    guest_phone: str = ""
+    guest_address: str = ""
+    guest_id_proof: str = ""
+    check_in: date
+    check_out: date
+    guests_count: int = 1
+    special_requests: str = ""
+    advance_payment: float = 0.0
+
+class OverbookingPolicy(BaseModel):
+    room_type: str
+    limit: int = 0  # stays per night that may be promised beyond the rooms of this type
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class OverbookingPolicyUpdate(BaseModel):
+    limit: int
+
+class RoomOptimizationRequest(BaseModel):
+    room_type: Optional[str] = None  # every room type when omitted
+    dry_run: bool = True
+    days: int = 365
+    min_stay: int = 2  # free runs shorter than this count as unsellable
+    strategy: str = "close_gaps"  # "close_gaps" (fewest moves) or "compact" (longest free runs)
+
+class Channel(BaseModel):
+    channel_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    endpoint_url: str  # base URL of the OTA's availability and rates API
+    room_type_codes: Dict[str, str] = {}  # room_type -> the OTA's room code; unmapped types are not sold
+    active: bool = True
+    last_push_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ChannelCreate(BaseModel):
+    name: str
+    endpoint_url: str
+    api_key: str = Field(min_length=1)  # sent on pushes and expected on inbound reservations
+    room_type_codes: Dict[str, str] = {}
+    active: bool = True
+
+class ChannelReservation(BaseModel):
+    reservation_id: str  # the OTA's id, unique per channel
+    room_code: str
+    guest_name: str
+    guest_email: str = ""
+    guest_phone: str = ""
+    check_in: date
+    check_out: date
+    guests_count: int = 1
+    total_amount: Optional[float] = None  # priced by the rate calendar when omitted
+    status: str = "confirmed"  # "confirmed", "cancelled"
+
+class ChannelReservationBatch(BaseModel):
+    reservations: List[ChannelReservation]
+
+class ChannelImportResult(BaseModel):
+    created: int = 0
+    cancelled: int = 0
+    overbooked: int = 0
+    duplicates: int = 0
+    rejected: List[dict] = []
+
+class BookingAnalytics(BaseModel):
+    start_date: date
+    end_date: date
+    bookings: int
+    revenue: float
+    nightly_occupancy: List[int]
+    peak_occupancy: int
+
+class HousekeepingTask(BaseModel):
+    task_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    room_id: str
+    room_number: str
+    floor: str
+    task_type: str  # "checkout_clean", "inspection"
+    booking_id: Optional[str] = None
+    status: str = "pending"  # "pending", "assigned", "done"
+    assigned_to: str = ""
+    next_arrival: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    assigned_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+class HousekeepingAssign(BaseModel):
+    staff: str
+    floor: Optional[str] = None
+
+class HousekeepingBoard(BaseModel):
+    floor: str
+    tasks: List[HousekeepingTask]
+
+class Tombstone(BaseModel):
+    collection: str
+    document_id: str
+    change_version: int
+    deleted_at: datetime
+
+class SyncResponse(BaseModel):
+    version: int
+    full: bool
+    rooms: List[Room]
+    guests: List[Guest]
+    bookings: List[BookingWithDetails]
+    deleted: List[Tombstone]
+
+class AuditEvent(BaseModel):
+    event_id: str
+    entity: str
+    entity_id: str
+    action: str
+    user: str
+    user_id: str = ""
+    before: Optional[dict] = None
+    after: Optional[dict] = None
+    at: datetime
+
+class ReportFilters(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None  # exclusive
+    category: Optional[List[str]] = None
+    payment_method: Optional[List[str]] = None
+    room_type: Optional[List[str]] = None
+    status: Optional[List[str]] = None
+
+class ReportQuery(BaseModel):
+    source: str  # "sales", "expenses", "bookings"
+    filters: ReportFilters = ReportFilters()
+    group_by: List[str] = []
+    metrics: List[str] = ["count", "total_amount"]
+
+class ReportResult(BaseModel):
+    source: str
+    group_by: List[str]
+    metrics: List[str]
+    rows: List[dict]
+    cached: bool = False
+
+class MonthEndInvoiceRun(BaseModel):
+    month: str  # "YYYY-MM"
+
 class Admin(BaseModel):
     admin_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
@@ -147,6 +741,7 @@ class Sale(BaseModel):
     amount: float
     payment_method: str
     date: date
+    kind: str = "room"  # "room", "advance", "additional", "settlement"
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class SaleCreate(BaseModel):
@@ -159,6 +754,7 @@ class BookingStatusUpdate(BaseModel):
     status: str
     additional_charges: float = 0.0
     advance_payment_received: float = 0.0  # For check-in advance
+    payment_received: float = 0.0  # For check-out settlement
     payment_method: str = "cash"
     notes: str = ""
 
@@ -183,11 +779,139 @@ class PaymentBalance(BaseModel):
     balance_due: float
     payment_status: str
 
+class FolioEntry(BaseModel):
+    entry_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    booking_id: str
+    sequence: int
+    entry_type: str  # "charge", "payment"
+    category: str  # "room", "additional", "advance", "settlement", "adjustment"
+    amount: float
+    payment_method: str = ""
+    description: str = ""
+    balance_after: float
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class FolioEntryCreate(BaseModel):
+    entry_type: str
+    category: str = "adjustment"
+    amount: float
+    payment_method: str = "cash"
+    description: str = ""
+
+class Folio(BaseModel):
+    booking_id: str
+    room_charges: float = 0.0
+    additional_charges: float = 0.0
+    charges_total: float = 0.0
+    payments_total: float = 0.0
+    balance: float = 0.0
+    entry_count: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 class AvailabilityCheck(BaseModel):
     check_in: date
     check_out: date
     room_type: Optional[str] = None
 
+class Job(BaseModel):
+    job_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    job_type: str
+    property_id: str = Field(default_factory=lambda: current_property.get())
+    payload: dict = Field(default_factory=dict)
+    status: str = "pending"  # "pending", "running", "succeeded", "failed"
+    attempts: int = 0
+    max_attempts: int = 5
+    last_error: str = ""
+    result: Optional[dict] = None
+    run_after: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class JobStats(BaseModel):
+    pending: int
+    running: int
+    succeeded: int
+    failed: int
+    in_flight: int
+    concurrency: int
+
+class RateRule(BaseModel):
+    rule_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    rule_type: str  # "season", "weekend", "occupancy", "length_of_stay"
+    room_type: Optional[str] = None  # None applies the rule to every room type
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    weekdays: List[int] = []  # 0 = Monday, used by "weekend" rules
+    occupancy_threshold: float = 0.0  # percent, used by "occupancy" rules
+    min_nights: int = 0  # used by "length_of_stay" rules
+    multiplier: float
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class RateRuleCreate(BaseModel):
+    name: str
+    rule_type: str
+    room_type: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    weekdays: List[int] = []
+    occupancy_threshold: float = 0.0
+    min_nights: int = 0
+    multiplier: float
+
+class RateQuoteRequest(BaseModel):
+    check_in: date
+    check_out: date
+
+class RoomTypeQuote(BaseModel):
+    room_type: str
+    nights: int
+    base_price_per_night: float
+    base_amount: float
+    length_of_stay_multiplier: float
+    total_amount: float
+    average_nightly_rate: float
+
+class ArchiveRequest(BaseModel):
+    months: int = int(os.environ.get("ARCHIVE_AFTER_MONTHS", "12"))
+    export_files: bool = False
+
+class ArchiveRollup(BaseModel):
+    month: str  # "YYYY-MM"
+    revenue: float
+    sales_count: int
+    bookings_count: int
+
+class ArchiveStatus(BaseModel):
+    cutoff: Optional[datetime] = None
+    last_run_at: Optional[datetime] = None
+    archived_bookings: int = 0
+    archived_sales: int = 0
+    rollups: List[ArchiveRollup] = []
+
+class AdmissionStats(BaseModel):
+    admitted: int
+    rate_limited: dict
+    shed: dict
+    in_flight: int
+    queued: int
+    max_concurrent: int
+    max_queued: int
+
+class LoggingStats(BaseModel):
+    queued: int
+    capacity: int
+    dropped: int  # records discarded because the queue was full
+    sampled_out: int  # repeated errors suppressed by sampling
+
+class AvailabilityMemoStats(BaseModel):
+    entries: int
+    hits: int
+    misses: int
+    hit_rate: float
+    invalidated: int  # entries evicted by booking changes
+    evicted: int  # entries dropped to stay under the size limit
+
 class DashboardStats(BaseModel):
     total_rooms: int
     occupied_rooms: int
@@ -208,6 +932,262 @@ def verify_password(password: str, hashed: str) -> bool:
 def create_access_token(data: dict):
     return jwt.encode(data, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def resolve_property(headers: dict) -> str:
+    """Property of a request: the admin token's property, else the X-Property-ID header."""
+    authorization = headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(authorization[7:], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            return payload.get("property_id", DEFAULT_PROPERTY_ID)
+        except InvalidTokenError:
+            # verify_token rejects the request if the endpoint needs a token
+            pass
+    return headers.get("x-property-id") or DEFAULT_PROPERTY_ID
+
+def known_property(property_id: str) -> bool:
+    return property_id == DEFAULT_PROPERTY_ID or property_id in tenant_router.routes
+
+class TenantMiddleware:
+    """Sets current_property, and whether reads may use secondaries, for each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        property_id = resolve_property(headers)
+        if not known_property(property_id):
+            # Rejected before any per-property state or collection is created for it
+            await JSONResponse({"detail": "Unknown property"}, status_code=404)(scope, receive, send)
+            return
+        token = current_property.set(property_id)
+        context = log_context.get()
+        if context is not None:
+            # Kept for the access log, which is written after this middleware returns
+            context["property_id"] = property_id
+        reads_token = secondary_reads.set((scope["method"], scope["path"]) in SECONDARY_READ_ROUTES)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            secondary_reads.reset(reads_token)
+            current_property.reset(token)
+
+# Admission control
+# (method, path) -> (requests per second, burst) per client, for public endpoints
+RATE_LIMITS = {
+    ("POST", "/api/bookings"): (1.0, 10),
+    # Each group holds many rooms at once
+    ("POST", "/api/booking-groups"): (0.2, 5),
+    ("POST", "/api/waitlist"): (1.0, 10),
+    ("POST", "/api/guests"): (1.0, 10),
+    ("POST", "/api/rooms/availability"): (5.0, 20),
+    ("POST", "/api/rates/quote"): (5.0, 20),
+    ("POST", "/api/admin/login"): (0.2, 5),
+    ("POST", "/api/admin/create"): (1.0 / 60, 3),
+}
+# Applied per client to every other /api request
+DEFAULT_RATE_LIMIT = (50.0, 100)
+TRUSTED_PROXIES = set(os.environ.get("TRUSTED_PROXIES", "127.0.0.1,::1").split(","))
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token; return 0 if admitted, else seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """Token buckets keyed by (client, route), bounded to max_keys buckets."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self.buckets = {}
+
+    def check(self, key: tuple, rate: float, capacity: int) -> float:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self.evict(now)
+            bucket = self.buckets[key] = TokenBucket(rate, capacity, now)
+        return bucket.take(now)
+
+    def evict(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.rate < bucket.capacity
+        }
+        if len(self.buckets) >= self.max_keys:
+            oldest = sorted(self.buckets, key=lambda key: self.buckets[key].updated)
+            for key in oldest[:len(oldest) // 2]:
+                del self.buckets[key]
+
+class ConcurrencyLimiter:
+    """Caps in-flight requests; excess requests wait in a bounded queue or are shed."""
+
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._semaphore = None
+
+    async def acquire(self) -> Optional[str]:
+        """Return None once admitted, or the reason the request was shed."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        if self._semaphore.locked():
+            if self.queued >= self.max_queued:
+                return "queue_full"
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                return "queue_timeout"
+            finally:
+                self.queued -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        return None
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+class AdmissionMetrics:
+    def __init__(self):
+        self.admitted = 0
+        self.rate_limited = Counter()
+        self.shed = Counter()
+
+rate_limiter = RateLimiter()
+concurrency_limiter = ConcurrencyLimiter(
+    max_concurrent=int(os.environ.get("MAX_CONCURRENT_REQUESTS", "64")),
+    max_queued=int(os.environ.get("MAX_QUEUED_REQUESTS", "256")),
+    queue_timeout=float(os.environ.get("QUEUE_TIMEOUT_SECONDS", "2.0"))
+)
+admission_metrics = AdmissionMetrics()
+
+def client_key(scope, headers: dict) -> str:
+    """Rate limit key: a valid bearer token, else the client IP.
+
+    Unverified tokens fall back to the IP, so random bearer values cannot
+    open a fresh bucket per request.
+    """
+    authorization = headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            jwt.decode(authorization[7:], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            return "token:" + hashlib.sha1(authorization[7:].encode()).hexdigest()
+        except InvalidTokenError:
+            pass
+    client_ip = scope["client"][0] if scope.get("client") else "unknown"
+    if client_ip in TRUSTED_PROXIES:
+        forwarded = headers.get("x-real-ip") or headers.get("x-forwarded-for", "").split(",")[0].strip()
+        client_ip = forwarded or client_ip
+    return "ip:" + client_ip
+
+async def send_rejection(send, status_code: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode())
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class AdmissionMiddleware:
+    """Per-client token bucket rate limits plus a global concurrency limit for /api."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api"):
+            await self.app(scope, receive, send)
+            return
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        route = (scope["method"], scope["path"].rstrip("/"))
+        rate, capacity = RATE_LIMITS.get(route, DEFAULT_RATE_LIMIT)
+        # Unlisted paths share one name, so arbitrary URLs cannot grow the buckets or the metrics
+        limited_route = " ".join(route) if route in RATE_LIMITS else "default"
+        retry_after = rate_limiter.check((client_key(scope, headers), limited_route), rate, capacity)
+        if retry_after > 0:
+            admission_metrics.rate_limited[limited_route] += 1
+            await send_rejection(send, 429, "Too many requests", retry_after)
+            return
+
+        shed_reason = await concurrency_limiter.acquire()
+        if shed_reason:
+            admission_metrics.shed[shed_reason] += 1
+            await send_rejection(send, 503, "Server is busy, please retry", concurrency_limiter.queue_timeout)
+            return
+        admission_metrics.admitted += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency_limiter.release()
+
+class RequestLogMiddleware:
+    """Gives each HTTP request an id for its log records, then logs its status and latency.
+
+    An X-Request-ID sent by the client (or a proxy) is reused, and the id is
+    returned in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = next((value.decode("latin-1")[:64] for key, value in scope["headers"]
+                           if key == b"x-request-id"), None) or uuid.uuid4().hex
+        context = {"request_id": request_id, "method": scope["method"], "scope": scope}
+        token = log_context.set(context)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            latency_ms = round((time.perf_counter() - started) * 1000, 2)
+            route = scope["route"].path if "route" in scope else scope["path"]
+            access_logger.info(
+                f"{scope['method']} {route} {status_code} {latency_ms}ms",
+                extra={"fields": {"status": status_code, "latency_ms": latency_ms}}
+            )
+            log_context.reset(token)
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -218,50 +1198,2908 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             detail="Invalid token"
         )
 
-# Auth endpoints
-@api_router.post("/admin/login")
-async def admin_login(admin_data: AdminLogin):
-    try:
-        admin = await db.admins.find_one({"username": admin_data.username})
-        if not admin or not verify_password(admin_data.password, admin["password_hash"]):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid username or password"
+def sale_document(booking_id: str, amount: float, payment_method: str, sale_date: date, kind: str = "room") -> dict:
+    sale_obj = Sale(
+        booking_id=booking_id,
+        amount=amount,
+        payment_method=payment_method,
+        date=sale_date,
+        kind=kind
+    )
+    
+    # Convert date object to datetime object before saving to MongoDB
+    sale_dict_for_db = sale_obj.dict()
+    sale_dict_for_db["date"] = datetime.combine(sale_obj.date, datetime.min.time())
+    return sale_dict_for_db
+
+def to_date(value) -> date:
+    # Bookings store dates as datetimes for MongoDB compatibility
+    return value.date() if isinstance(value, datetime) else value
+
+# Indexes created at startup; features append (collection, keys, options).
+# Indexes on property-scoped collections are prefixed with property_id.
+INDEXES = [
+    ("jobs", [("job_id", 1)], {"unique": True}),
+    ("jobs", [("status", 1), ("run_after", 1)], {}),
+    ("jobs", [("property_id", 1), ("status", 1)], {}),
+    ("admins", [("username", 1)], {"unique": True}),
+    ("rooms", [("room_id", 1)], {"unique": True}),
+    ("rooms", [("room_number", 1)], {}),
+    ("guests", [("guest_id", 1)], {"unique": True}),
+    ("guests", [("email", 1)], {}),
+    ("guest_profiles", [("guest_id", 1)], {"unique": True}),
+    ("bookings", [("booking_id", 1)], {"unique": True}),
+    ("bookings", [("room_id", 1), ("status", 1), ("check_in", 1)], {}),
+    ("bookings", [("status", 1), ("check_in", 1), ("check_out", 1)], {}),
+    ("sales", [("sale_id", 1)], {"unique": True}),
+    ("sales", [("date", 1)], {}),
+    ("expenses", [("date", 1)], {}),
+    ("settings", [("setting_id", 1)], {}),
+    ("rate_rules", [("rule_id", 1)], {"unique": True}),
+    ("folios", [("booking_id", 1)], {"unique": True}),
+    ("folio_entries", [("booking_id", 1), ("sequence", 1)], {"unique": True}),
+    ("bookings", [("status", 1), ("check_out", 1)], {}),
+    ("sales", [("booking_id", 1)], {}),
+    ("bookings_archive", [("booking_id", 1)], {"unique": True}),
+    ("bookings_archive", [("check_out", 1)], {}),
+    ("bookings_archive", [("check_in", 1)], {}),
+    ("sales_archive", [("sale_id", 1)], {"unique": True}),
+    ("sales_archive", [("date", 1)], {}),
+    ("archive_rollups", [("month", 1)], {"unique": True}),
+    ("room_nights", [("room_id", 1), ("night", 1)], {"unique": True}),
+    ("room_nights", [("booking_id", 1)], {}),
+    ("booking_groups", [("group_id", 1)], {"unique": True}),
+    ("counters", [("name", 1)], {"unique": True}),
+    ("bookings", [("check_in", 1)], {}),
+    ("invoices", [("booking_id", 1), ("kind", 1)], {"unique": True}),
+    ("audit_log", [("event_id", 1)], {"unique": True}),
+    ("audit_log", [("entity", 1), ("entity_id", 1), ("at", -1)], {}),
+    ("audit_log", [("user", 1), ("at", -1)], {}),
+    ("audit_log", [("at", -1)], {}),
+    ("rooms", [("change_version", 1)], {}),
+    ("guests", [("change_version", 1)], {}),
+    ("bookings", [("change_version", 1)], {}),
+    ("tombstones", [("change_version", 1)], {}),
+    ("housekeeping_tasks", [("task_id", 1)], {"unique": True}),
+    ("housekeeping_tasks", [("status", 1), ("priority_at", 1), ("created_at", 1)], {}),
+    ("housekeeping_tasks", [("floor", 1), ("status", 1), ("priority_at", 1)], {}),
+    ("housekeeping_tasks", [("room_id", 1), ("status", 1)], {}),
+    ("waitlist", [("waitlist_id", 1)], {"unique": True}),
+    ("waitlist", [("room_type", 1), ("status", 1), ("check_in", 1)], {}),
+    ("overbooking_policies", [("room_type", 1)], {"unique": True}),
+    ("channels", [("channel_id", 1)], {"unique": True}),
+    ("channels", [("active", 1)], {}),
+    ("channel_inventory", [("channel_id", 1), ("room_type", 1)], {"unique": True}),
+    ("channel_reservations", [("channel_id", 1), ("reservation_id", 1)], {"unique": True}),
+]
+
+async def ensure_indexes():
+    for database in tenant_router.databases():
+        for collection, keys, options in INDEXES:
+            if collection not in GLOBAL_COLLECTIONS:
+                keys = [("property_id", 1)] + keys
+            elif database.name != tenant_router.default_db_name:
+                continue
+            try:
+                await database[collection].create_index(keys, **options)
+            except Exception as e:
+                logger.error(f"Create index error on {collection}: {str(e)}")
+
+async def backfill_property_ids():
+    # Documents written before multi-property support belong to the default property
+    database = tenant_router.database(DEFAULT_PROPERTY_ID)
+    collections = {collection for collection, _, _ in INDEXES} - GLOBAL_COLLECTIONS
+    for collection in sorted(collections):
+        try:
+            await database[collection].update_many(
+                {"property_id": {"$exists": False}},
+                {"$set": {"property_id": DEFAULT_PROPERTY_ID}}
             )
-        
-        token = create_access_token({"admin_id": admin["admin_id"], "username": admin["username"]})
-        return {"access_token": token, "token_type": "bearer", "admin_id": admin["admin_id"]}
-    except Exception as e:
-        logger.error(f"Login error: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Login failed"
+        except Exception as e:
+            logger.error(f"Backfill property_id error on {collection}: {str(e)}")
+
+# Background job queue
+class JobQueue:
+    """In-process workers draining the persistent db.jobs outbox.
+
+    Jobs are written to Mongo before the request returns, so they survive a
+    restart; a crashed worker's job is picked up again once its lease expires.
+    Failed attempts are retried with exponential backoff until max_attempts.
+    """
+
+    def __init__(self, concurrency: int = 4, poll_interval: float = 1.0,
+                 base_backoff: float = 2.0, max_backoff: float = 300.0,
+                 lease_seconds: float = 300.0):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lease_seconds = lease_seconds
+        self.handlers = {}
+        self.in_flight = 0
+        self._wakeup = asyncio.Event()
+        self._workers = []
+        self._stopping = False
+
+    def handler(self, job_type: str):
+        def decorator(func):
+            self.handlers[job_type] = func
+            return func
+        return decorator
+
+    async def enqueue(self, job_type: str, payload: dict, max_attempts: int = 5, delay: float = 0.0) -> Job:
+        if job_type not in self.handlers:
+            raise ValueError(f"No handler registered for job type {job_type}")
+        job_obj = Job(job_type=job_type, payload=payload, max_attempts=max_attempts,
+                      run_after=datetime.utcnow() + timedelta(seconds=delay))
+        await db.jobs.insert_one(job_obj.dict())
+        self._wakeup.set()
+        return job_obj
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await db.jobs.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending", "run_after": {"$lte": now}},
+                    {"status": "running", "lease_expires_at": {"$lt": now}}
+                ]
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "updated_at": now,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds)
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_after", 1)],
+            return_document=pymongo.ReturnDocument.AFTER
         )
 
-@api_router.post("/admin/create", response_model=Admin)
-async def create_admin(admin_data: AdminCreate):
-    try:
-        # Check if admin already exists
-        existing_admin = await db.admins.find_one({"username": admin_data.username})
-        if existing_admin:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Admin already exists"
+    async def run_job(self, job: dict):
+        self.in_flight += 1
+        property_token = current_property.set(job.get("property_id", DEFAULT_PROPERTY_ID))
+        log_token = log_context.set({"job_id": job["job_id"], "job_type": job["job_type"]})
+        try:
+            handler = self.handlers.get(job["job_type"])
+            if handler is None:
+                raise ValueError(f"No handler registered for job type {job['job_type']}")
+            result = await handler(job["payload"])
+            await db.jobs.update_one(
+                {"job_id": job["job_id"]},
+                {"$set": {"status": "succeeded", "result": result, "updated_at": datetime.utcnow()}}
             )
-        
-        admin_dict = admin_data.dict()
-        admin_dict["password_hash"] = hash_password(admin_data.password)
-        admin_obj = Admin(**admin_dict)
-        await db.admins.insert_one(admin_obj.dict())
-        return admin_obj
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Create admin error: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to create admin"
-        )
+        except Exception as e:
+            logger.error(f"Job {job['job_type']} {job['job_id']} error: {str(e)}")
+            now = datetime.utcnow()
+            update_data = {"last_error": str(e), "updated_at": now}
+            if job["attempts"] >= job.get("max_attempts", 5):
+                update_data["status"] = "failed"
+            else:
+                update_data["status"] = "pending"
+                update_data["run_after"] = now + timedelta(seconds=self.backoff(job["attempts"]))
+            await db.jobs.update_one({"job_id": job["job_id"]}, {"$set": update_data})
+        finally:
+            log_context.reset(log_token)
+            current_property.reset(property_token)
+            self.in_flight -= 1
+
+    async def worker(self):
+        while not self._stopping:
+            try:
+                self._wakeup.clear()
+                job = await self.claim()
+                if job:
+                    await self.run_job(job)
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker error: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if not self._workers:
+            self._stopping = False
+            self._workers = [asyncio.create_task(self.worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        # asyncio.wait_for can swallow a cancellation, so also flag the loop
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def stats(self) -> JobStats:
+        counts = {"pending": 0, "running": 0, "succeeded": 0, "failed": 0}
+        async for row in db.jobs.aggregate([
+            {"$match": {"property_id": current_property.get()}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]):
+            counts[row["_id"]] = row["count"]
+        return JobStats(**counts, in_flight=self.in_flight, concurrency=self.concurrency)
+
+job_queue = JobQueue(concurrency=int(os.environ.get("JOB_WORKER_CONCURRENCY", "4")))
+
+@job_queue.handler("record_sales")
+async def record_sales_job(payload: dict):
+    # Upsert by sale_id so a retried job never records a sale twice
+    recorded = []
+    for sale in payload["sales"]:
+        result = await db.sales.update_one({"sale_id": sale["sale_id"]}, {"$setOnInsert": sale}, upsert=True)
+        if result.upserted_id is not None:
+            recorded.append(sale)
+    collection_versions.bump("sales")
+    await add_guest_spend(recorded)
+    return {"recorded": len(recorded)}
+
+# Audit log
+AUDIT_HIDDEN_FIELDS = {"_id", "password_hash", "api_key"}
+
+def audit_snapshot(document) -> Optional[dict]:
+    if document is None:
+        return None
+    if isinstance(document, BaseModel):
+        document = document.dict()
+    return {key: value for key, value in document.items() if key not in AUDIT_HIDDEN_FIELDS}
+
+class AuditLog:
+    """Append-only audit trail written in batches.
+
+    record() only appends to an in-memory buffer; a background task writes
+    the buffer with insert_many every flush_interval seconds, or as soon as
+    batch_size events are waiting. A batch that cannot be written is
+    appended to a local NDJSON spool file and replayed after the next
+    successful write, so events outlive a database outage.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 1.0, spool_path: Path = None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.events = []
+        self.flushed = 0
+        self.spooled = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+    def record(self, entity: str, entity_id: str, action: str, token_data: Optional[dict],
+               before=None, after=None):
+        self.events.append({
+            "event_id": str(uuid.uuid4()),
+            "property_id": current_property.get(),
+            "entity": entity,
+            "entity_id": entity_id,
+            "action": action,
+            "user": token_data.get("username", "") if token_data else "anonymous",
+            "user_id": token_data.get("admin_id", "") if token_data else "",
+            "before": audit_snapshot(before),
+            "after": audit_snapshot(after),
+            "at": datetime.utcnow()
+        })
+        if len(self.events) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        events, self.events = self.events, []
+        try:
+            await self.write(events)
+        except Exception as e:
+            logger.error(f"Audit log write error, spooling {len(events)} events: {str(e)}")
+            await asyncio.to_thread(self.spool, events)
+            return
+        self.flushed += len(events)
+        await self.replay_spool()
+
+    async def write(self, events: List[dict]):
+        by_property = {}
+        for event in events:
+            by_property.setdefault(event["property_id"], []).append(event)
+        for property_id, property_events in by_property.items():
+            property_token = current_property.set(property_id)
+            try:
+                for offset in range(0, len(property_events), self.batch_size):
+                    await insert_ignoring_duplicates("audit_log", property_events[offset:offset + self.batch_size])
+            finally:
+                current_property.reset(property_token)
+
+    def spool(self, events: List[dict]):
+        from bson import json_util
+
+        if not events:
+            return
+        with open(self.spool_path, "a") as spool_file:
+            for event in events:
+                spool_file.write(json_util.dumps({key: value for key, value in event.items() if key != "_id"}) + "\n")
+        self.spooled += len(events)
+
+    def read_spool(self) -> List[dict]:
+        from bson import json_util
+
+        with open(self.spool_path) as spool_file:
+            return [json_util.loads(line) for line in spool_file if line.strip()]
+
+    async def replay_spool(self):
+        if self.spool_path is None or not self.spool_path.exists():
+            return
+        try:
+            events = await asyncio.to_thread(self.read_spool)
+            # Event ids are unique, so replaying a partly written spool is safe
+            await self.write(events)
+            self.spool_path.unlink()
+            self.flushed += len(events)
+            logger.info(f"Replayed {len(events)} spooled audit events")
+        except Exception as e:
+            logger.error(f"Audit spool replay error: {str(e)}")
+
+async def insert_ignoring_duplicates(collection: str, documents: List[dict]):
+    if not documents:
+        return
+    try:
+        await db[collection].insert_many([dict(document) for document in documents], ordered=False)
+    except pymongo.errors.BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+audit_log = AuditLog(
+    batch_size=int(os.environ.get("AUDIT_BATCH_SIZE", "500")),
+    flush_interval=float(os.environ.get("AUDIT_FLUSH_INTERVAL", "1.0")),
+    spool_path=Path(os.environ.get("AUDIT_SPOOL_PATH", str(ROOT_DIR / "audit_spool.ndjson")))
+)
+
+# Booking change hooks
+booking_change_hooks = []
+
+def on_booking_change(func):
+    booking_change_hooks.append(func)
+    return func
+
+async def notify_booking_change(booking: dict, previous_status: Optional[str]):
+    """Run in-process hooks after a booking is created or changes status.
+
+    previous_status is None for a newly created booking.
+    """
+    for hook in booking_change_hooks:
+        try:
+            await hook(booking, previous_status)
+        except Exception as e:
+            logger.error(f"Booking change hook {hook.__name__} error: {str(e)}")
+
+ACTIVE_BOOKING_STATUSES = ["confirmed", "checked_in"]
+
+# Dynamic pricing
+RATE_RULE_TYPES = ["season", "weekend", "occupancy", "length_of_stay"]
+
+def day_range(start: date, days: int) -> "np.ndarray":
+    return np.datetime64(start, "D") + np.arange(days)
+
+def rule_rows(rule: dict, type_index: dict) -> List[int]:
+    if rule.get("room_type") is None:
+        return list(type_index.values())
+    row = type_index.get(rule["room_type"])
+    return [] if row is None else [row]
+
+def rule_window(rule: dict, days: "np.ndarray") -> "np.ndarray":
+    mask = np.ones(len(days), dtype=bool)
+    if rule.get("start_date"):
+        mask &= days >= np.datetime64(to_date(rule["start_date"]), "D")
+    if rule.get("end_date"):
+        mask &= days <= np.datetime64(to_date(rule["end_date"]), "D")
+    return mask
+
+def base_rate_factors(rules: List[dict], type_index: dict, start: date, days: int) -> "np.ndarray":
+    """Season and weekend multipliers for each room type (row) and night (column)."""
+    factors = np.ones((len(type_index), days))
+    nights = day_range(start, days)
+    # 1970-01-01 was a Thursday, so shift by 3 to get Monday = 0
+    weekdays = (nights.astype("int64") + 3) % 7
+    for rule in rules:
+        if rule["rule_type"] == "season":
+            mask = rule_window(rule, nights)
+        elif rule["rule_type"] == "weekend":
+            mask = rule_window(rule, nights) & np.isin(weekdays, rule.get("weekdays", []))
+        else:
+            continue
+        for row in rule_rows(rule, type_index):
+            factors[row, mask] *= rule["multiplier"]
+    return factors
+
+def yield_rate_factors(rules: List[dict], type_index: dict, start: date,
+                       occupancy: "np.ndarray", room_counts: "np.ndarray") -> "np.ndarray":
+    """Occupancy-based multipliers; the highest threshold reached wins."""
+    factors = np.ones(occupancy.shape)
+    nights = day_range(start, occupancy.shape[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent = np.where(room_counts[:, None] > 0, occupancy * 100.0 / room_counts[:, None], 0.0)
+    occupancy_rules = [rule for rule in rules if rule["rule_type"] == "occupancy"]
+    for rule in sorted(occupancy_rules, key=lambda r: r.get("occupancy_threshold", 0.0)):
+        window = rule_window(rule, nights)
+        for row in rule_rows(rule, type_index):
+            factors[row, window & (percent[row] >= rule.get("occupancy_threshold", 0.0))] = rule["multiplier"]
+    return factors
+
+class RateCalendar:
+    """Nightly rate multipliers per room type, precomputed for a rolling horizon.
+
+    Rows are room types and columns are nights starting at ``origin``. The
+    calendar keeps a prefix sum per row, so pricing any stay is a slice-sum:
+    ``prefix[:, end] - prefix[:, start]``. It is rebuilt when rules or rooms
+    change and kept current for occupancy rules through booking hooks.
+    """
+
+    def __init__(self, horizon_days: int = 730, history_days: int = 30):
+        self.horizon_days = horizon_days
+        self.history_days = history_days
+        self.stale = True
+        self.generation = 0
+        self.origin = None
+        self.rules = []
+        self.type_index = {}
+        self.room_types = {}
+        self.room_counts = np.zeros(0)
+        self.base_prices = np.zeros(0)
+        self.occupancy = np.zeros((0, 0))
+        self.base = np.zeros((0, 0))
+        self.prefix = np.zeros((0, 1))
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self.stale = True
+        self.generation += 1
+
+    async def ensure_fresh(self):
+        today = datetime.utcnow().date()
+        if not self.stale and self.origin == today - timedelta(days=self.history_days):
+            return
+        async with self._lock:
+            if self.stale or self.origin != today - timedelta(days=self.history_days):
+                await self.rebuild(today)
+
+    async def rebuild(self, today: date):
+        # An invalidation while loading may have been read past; stay stale then
+        generation = self.generation
+        rules = await db.rate_rules.find().to_list(1000)
+        rooms = await db.rooms.find({}, {"room_id": 1, "room_type": 1, "price_per_night": 1}).to_list(None)
+        origin = today - timedelta(days=self.history_days)
+        horizon_end = origin + timedelta(days=self.horizon_days)
+        bookings = await db.bookings.find(
+            {
+                "status": {"$in": ACTIVE_BOOKING_STATUSES},
+                "check_in": {"$lt": datetime.combine(horizon_end, datetime.min.time())},
+                "check_out": {"$gt": datetime.combine(origin, datetime.min.time())}
+            },
+            {"room_id": 1, "check_in": 1, "check_out": 1}
+        ).to_list(None)
+
+        type_names = sorted({room["room_type"] for room in rooms})
+        type_index = {name: row for row, name in enumerate(type_names)}
+        counts = Counter(room["room_type"] for room in rooms)
+        base_prices = {}
+        for room in rooms:
+            current = base_prices.get(room["room_type"])
+            if current is None or room["price_per_night"] < current:
+                base_prices[room["room_type"]] = room["price_per_night"]
+
+        self.origin = origin
+        self.rules = rules
+        self.type_index = type_index
+        self.room_types = {room["room_id"]: room["room_type"] for room in rooms}
+        self.room_counts = np.array([counts[name] for name in type_names], dtype=float)
+        self.base_prices = np.array([base_prices[name] for name in type_names], dtype=float)
+        self.occupancy = np.zeros((len(type_names), self.horizon_days))
+        for booking in bookings:
+            self.add_occupancy(booking, 1)
+        self.base = base_rate_factors(rules, type_index, origin, self.horizon_days)
+        self.refresh_prefix()
+        self.stale = self.generation != generation
+
+    def refresh_prefix(self, rows=slice(None)):
+        factors = self.base[rows] * yield_rate_factors(
+            self.rules, self.type_index, self.origin, self.occupancy, self.room_counts
+        )[rows]
+        if isinstance(rows, slice):
+            self.prefix = np.zeros((len(self.type_index), self.horizon_days + 1))
+        self.prefix[rows, 1:] = np.cumsum(factors, axis=-1)
+
+    def add_occupancy(self, booking: dict, delta: int) -> Optional[int]:
+        room_type = self.room_types.get(booking["room_id"])
+        if room_type is None:
+            return None
+        row = self.type_index[room_type]
+        start = max((to_date(booking["check_in"]) - self.origin).days, 0)
+        end = min((to_date(booking["check_out"]) - self.origin).days, self.horizon_days)
+        if start < end:
+            self.occupancy[row, start:end] += delta
+        return row
+
+    def apply_booking_change(self, booking: dict, previous_status: Optional[str]):
+        was_active = previous_status in ACTIVE_BOOKING_STATUSES
+        is_active = booking["status"] in ACTIVE_BOOKING_STATUSES
+        if was_active == is_active:
+            return
+        if self.stale:
+            # A rebuild in progress may already have loaded the old status
+            self.invalidate()
+            return
+        row = self.add_occupancy(booking, 1 if is_active else -1)
+        if row is not None:
+            self.refresh_prefix(row)
+
+    def factor_sums(self, check_in: date, check_out: date) -> "np.ndarray":
+        """Sum of nightly multipliers over [check_in, check_out) for every room type."""
+        start = (check_in - self.origin).days
+        end = (check_out - self.origin).days
+        if 0 <= start and end <= self.horizon_days:
+            return self.prefix[:, end] - self.prefix[:, start]
+        # Outside the precomputed horizon: evaluate the date-based rules directly
+        return base_rate_factors(self.rules, self.type_index, check_in, end - start).sum(axis=1)
+
+    def inventory(self, start: date, days: int) -> Dict[str, tuple]:
+        """Rooms left and nightly rate per room type for the nights [start, start + days)."""
+        first = (start - self.origin).days
+        days = min(days, self.horizon_days - first)
+        factors = self.prefix[:, first + 1:first + days + 1] - self.prefix[:, first:first + days]
+        available = np.maximum(self.room_counts[:, None] - self.occupancy[:, first:first + days], 0).astype("int64")
+        rates = np.round(self.base_prices[:, None] * factors, 2)
+        return {room_type: (available[row], rates[row]) for room_type, row in self.type_index.items()}
+
+    def length_of_stay_multiplier(self, room_type: str, nights: int) -> float:
+        multiplier = 1.0
+        for rule in self.rules:
+            if (rule["rule_type"] == "length_of_stay" and nights >= rule.get("min_nights", 0)
+                    and rule.get("room_type") in (None, room_type)):
+                multiplier = min(multiplier, rule["multiplier"])
+        return multiplier
+
+    async def stay_price(self, room: dict, check_in: date, check_out: date) -> float:
+        await self.ensure_fresh()
+        nights = (check_out - check_in).days
+        row = self.type_index.get(room["room_type"])
+        if row is None:
+            return nights * room["price_per_night"]
+        factor_sum = self.factor_sums(check_in, check_out)[row]
+        multiplier = self.length_of_stay_multiplier(room["room_type"], nights)
+        return round(room["price_per_night"] * factor_sum * multiplier, 2)
+
+    async def quote(self, check_in: date, check_out: date) -> List[RoomTypeQuote]:
+        await self.ensure_fresh()
+        nights = (check_out - check_in).days
+        base_amounts = self.base_prices * self.factor_sums(check_in, check_out)
+        quotes = []
+        for room_type, row in self.type_index.items():
+            multiplier = self.length_of_stay_multiplier(room_type, nights)
+            total_amount = round(float(base_amounts[row]) * multiplier, 2)
+            quotes.append(RoomTypeQuote(
+                room_type=room_type,
+                nights=nights,
+                base_price_per_night=float(self.base_prices[row]),
+                base_amount=round(float(base_amounts[row]), 2),
+                length_of_stay_multiplier=multiplier,
+                total_amount=total_amount,
+                average_nightly_rate=round(total_amount / nights, 2)
+            ))
+        return quotes
+
+rate_calendar = PerProperty(lambda: RateCalendar(horizon_days=int(os.environ.get("RATE_CALENDAR_DAYS", "730"))))
+
+@on_booking_change
+async def update_rate_calendar_occupancy(booking: dict, previous_status: Optional[str]):
+    rate_calendar.apply_booking_change(booking, previous_status)
+
+# Compact booking store
+BOOKING_STATUS_CODES = {"confirmed": 0, "checked_in": 1, "checked_out": 2, "cancelled": 3, "no_show": 4}
+EPOCH = date(1970, 1, 1)
+
+def booking_key(booking_id: str) -> bytes:
+    # Booking ids are UUIDs; anything else is hashed to the same width
+    try:
+        return uuid.UUID(booking_id).bytes
+    except ValueError:
+        return hashlib.md5(booking_id.encode()).digest()
+
+def day_number(value) -> int:
+    return (to_date(value) - EPOCH).days
+
+class BookingStore:
+    """Bookings of one property as parallel NumPy columns.
+
+    A row costs 37 bytes (booking key, room index, check-in and check-out
+    day numbers, status code, total amount) instead of a dict per booking.
+    Rows are loaded from MongoDB in chunks and kept current by the
+    booking change hooks; archiving marks the store stale.
+    """
+
+    COLUMNS = {
+        "keys": "S16",
+        "rooms": "int32",
+        "starts": "int32",
+        "ends": "int32",
+        "statuses": "int8",
+        "amounts": "float64",
+    }
+
+    def __init__(self, chunk_size: int = 50000):
+        self.chunk_size = chunk_size
+        self.stale = True
+        self.generation = 0
+        self._lock = asyncio.Lock()
+        self.reset()
+
+    def reset(self):
+        self.size = 0
+        self.room_index = {}
+        for name, dtype in self.COLUMNS.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+
+    def invalidate(self):
+        self.stale = True
+        self.generation += 1
+
+    async def ensure_fresh(self):
+        if self.stale:
+            async with self._lock:
+                if self.stale:
+                    await self.rebuild()
+
+    async def rebuild(self):
+        # An invalidation while loading may have been read past; stay stale then
+        generation = self.generation
+        self.reset()
+        cursor = db.bookings.find(
+            {},
+            {"_id": 0, "booking_id": 1, "room_id": 1, "check_in": 1, "check_out": 1, "status": 1, "total_amount": 1}
+        ).batch_size(self.chunk_size)
+        while True:
+            chunk = await cursor.to_list(self.chunk_size)
+            if not chunk:
+                break
+            self.append(chunk)
+        self.stale = self.generation != generation
+
+    def reserve(self, extra: int):
+        capacity = len(self.keys)
+        if self.size + extra <= capacity:
+            return
+        capacity = max(self.size + extra, capacity * 2)
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def room_number(self, room_id: str) -> int:
+        if room_id not in self.room_index:
+            self.room_index[room_id] = len(self.room_index)
+        return self.room_index[room_id]
+
+    def append(self, bookings: List[dict]):
+        count = len(bookings)
+        self.reserve(count)
+        rows = slice(self.size, self.size + count)
+        self.keys[rows] = [booking_key(booking["booking_id"]) for booking in bookings]
+        self.rooms[rows] = [self.room_number(booking["room_id"]) for booking in bookings]
+        self.starts[rows] = [day_number(booking["check_in"]) for booking in bookings]
+        self.ends[rows] = [day_number(booking["check_out"]) for booking in bookings]
+        self.statuses[rows] = [BOOKING_STATUS_CODES.get(booking["status"], -1) for booking in bookings]
+        self.amounts[rows] = [booking["total_amount"] for booking in bookings]
+        self.size += count
+
+    def apply_booking_change(self, booking: dict, previous_status: Optional[str]):
+        if self.stale:
+            # A rebuild in progress may already have read past this booking
+            self.invalidate()
+            return
+        if previous_status is None:
+            self.append([booking])
+            return
+        rows = np.flatnonzero(self.keys[:self.size] == booking_key(booking["booking_id"]))
+        self.statuses[rows] = BOOKING_STATUS_CODES.get(booking["status"], -1)
+
+    def status_mask(self, statuses: List[str]) -> "np.ndarray":
+        codes = [BOOKING_STATUS_CODES[name] for name in statuses]
+        return np.isin(self.statuses[:self.size], codes)
+
+    def overlapping(self, check_in: date, check_out: date,
+                    statuses: List[str] = ACTIVE_BOOKING_STATUSES) -> "np.ndarray":
+        """Row numbers of bookings that hold a night in [check_in, check_out).
+
+        Uses the same half-open comparison as the availability queries.
+        """
+        mask = self.status_mask(statuses)
+        mask &= self.starts[:self.size] < day_number(check_out)
+        mask &= self.ends[:self.size] > day_number(check_in)
+        return np.flatnonzero(mask)
+
+    def busy_room_ids(self, check_in: date, check_out: date) -> set:
+        room_ids = list(self.room_index)
+        return {room_ids[room] for room in np.unique(self.rooms[self.overlapping(check_in, check_out)])}
+
+    def nightly_occupancy(self, start: date, end: date,
+                          statuses: List[str] = ACTIVE_BOOKING_STATUSES) -> "np.ndarray":
+        """Number of booked rooms for each night in [start, end)."""
+        first, last = day_number(start), day_number(end)
+        mask = self.status_mask(statuses)
+        mask &= (self.starts[:self.size] < last) & (self.ends[:self.size] > first)
+        starts = np.clip(self.starts[:self.size][mask], first, last) - first
+        ends = np.clip(self.ends[:self.size][mask], first, last) - first
+        changes = np.zeros(last - first + 1, dtype="int64")
+        np.add.at(changes, starts, 1)
+        np.add.at(changes, ends, -1)
+        return np.cumsum(changes[:-1])
+
+    def revenue(self, start: date, end: date) -> tuple:
+        """Booking count and booked amount for stays checking in during [start, end)."""
+        mask = ~self.status_mask(["cancelled"])
+        mask &= (self.starts[:self.size] >= day_number(start)) & (self.starts[:self.size] < day_number(end))
+        return int(mask.sum()), float(self.amounts[:self.size][mask].sum())
+
+    def memory_bytes(self) -> int:
+        return sum(getattr(self, name)[:self.size].nbytes for name in self.COLUMNS)
+
+booking_store = PerProperty(lambda: BookingStore(chunk_size=int(os.environ.get("BOOKING_STORE_CHUNK_SIZE", "50000"))))
+
+@on_booking_change
+async def update_booking_store(booking: dict, previous_status: Optional[str]):
+    booking_store.apply_booking_change(booking, previous_status)
+
+# HTTP caching
+BOOT_ID = uuid.uuid4().hex[:8]
+COMPRESSION_MINIMUM_SIZE = 1000
+
+class CollectionVersions:
+    """Change counters for cacheable collections of one property.
+
+    Mutation handlers bump the counters, so a conditional GET whose ETag
+    still matches is answered without touching MongoDB. Counters live in
+    this process; ETags embed a boot id so a restart never reuses one.
+    Encoded (and compressed) bodies are kept per path for the current ETag.
+    """
+
+    def __init__(self):
+        self.versions = Counter()
+        self.responses = {}
+
+    def bump(self, *collections: str):
+        for collection in collections:
+            self.versions[collection] += 1
+
+    def etag(self, collections: List[str], extra: str = "") -> str:
+        parts = [BOOT_ID, current_property.get(), extra] + [str(self.versions[c]) for c in collections]
+        return 'W/"' + hashlib.sha1("|".join(parts).encode()).hexdigest()[:20] + '"'
+
+collection_versions = PerProperty(CollectionVersions)
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Quality value per content-coding in an Accept-Encoding header; q=0 refuses it."""
+    qualities = {}
+    for token in accept_encoding.split(","):
+        name, *params = [part.strip() for part in token.split(";")]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.lower()] = quality
+    return qualities
+
+def preferred_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+    """The available coding the client rates highest (ties go to the earlier one), if any is acceptable."""
+    qualities = accepted_encodings(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+class NegotiatedGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that honours q-values; Starlette's matches "gzip" as a substring."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+            if preferred_encoding(headers.get("accept-encoding", ""), ["gzip"]) is None:
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(",") if tag.strip())
+
+async def cached_json_response(request: Request, collections: List[str], load, extra: str = "") -> Response:
+    """Serve a JSON list or document with ETag revalidation and cached compression."""
+    versions = collection_versions.get()
+    # Compute the ETag before loading so a concurrent write can only make it stale
+    etag = versions.etag(collections, extra)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding, Authorization, X-Property-ID"
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    cached = versions.responses.get(request.url.path)
+    if cached is None or cached["etag"] != etag:
+        body = json.dumps(jsonable_encoder(await load())).encode()
+        cached = {"etag": etag, "identity": body}
+        if len(body) >= COMPRESSION_MINIMUM_SIZE:
+            cached["gzip"] = gzip.compress(body, compresslevel=6)
+            if brotli is not None:
+                cached["br"] = brotli.compress(body)
+        versions.responses[request.url.path] = cached
+
+    encoding = preferred_encoding(request.headers.get("accept-encoding", ""),
+                                  [encoding for encoding in ("br", "gzip") if encoding in cached])
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        return Response(content=cached[encoding], media_type="application/json", headers=headers)
+    return Response(content=cached["identity"], media_type="application/json", headers=headers)
+
+# Change versions for delta sync
+SYNC_COLLECTIONS = {"rooms": "room_id", "guests": "guest_id", "bookings": "booking_id"}
+
+class ChangeVersions:
+    """Monotonic change version of one property, persisted in db.counters.
+
+    Writes to the synced collections run inside stamp() and store the
+    version on every document they touch (or on a tombstone for deletes).
+    A stamp counts as in flight from before its version is allocated until
+    its write finishes, so the version reported to clients never runs ahead
+    of a write still in flight here. While an allocation has not returned
+    its number yet, current() falls back to the last version it saw fully
+    committed. The tracking is per process: writes in flight in another
+    worker are not seen.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.pending = set()
+        self.committed = 0
+
+    @asynccontextmanager
+    async def stamp(self):
+        # Registered before the increment is awaited, so current() never
+        # reports a version whose number this process has not learnt yet
+        self.in_flight += 1
+        version = None
+        try:
+            counter = await db.counters.find_one_and_update(
+                {"name": "change_version"},
+                {"$inc": {"value": 1}},
+                upsert=True,
+                return_document=pymongo.ReturnDocument.AFTER
+            )
+            version = counter["value"]
+            self.pending.add(version)
+            yield version
+        finally:
+            self.in_flight -= 1
+            self.pending.discard(version)
+
+    async def current(self) -> int:
+        counter = await db.counters.find_one({"name": "change_version"})
+        version = counter["value"] if counter else 0
+        if len(self.pending) < self.in_flight:
+            return self.committed
+        if self.pending:
+            version = min(version, min(self.pending) - 1)
+        self.committed = max(self.committed, version)
+        return version
+
+change_versions = PerProperty(ChangeVersions)
+
+async def record_tombstones(collection: str, document_ids: List[str], version: int):
+    if document_ids:
+        deleted_at = datetime.utcnow()
+        await db.tombstones.insert_many([
+            {"collection": collection, "document_id": document_id,
+             "change_version": version, "deleted_at": deleted_at}
+            for document_id in document_ids
+        ])
+
+@on_booking_change
+async def bump_booking_version(booking: dict, previous_status: Optional[str]):
+    collection_versions.bump("bookings")
+
+# Folio ledger
+FOLIO_ENTRY_TYPES = ["charge", "payment"]
+
+async def post_folio_entry(booking_id: str, entry_type: str, category: str, amount: float,
+                           payment_method: str = "", description: str = "") -> dict:
+    """Append a charge or payment to a booking's folio and return the updated folio.
+
+    The folio document keeps running totals, so the $inc that allocates the
+    entry's sequence number also yields the balance after the entry.
+    """
+    increments = {
+        "entry_count": 1,
+        "balance": amount if entry_type == "charge" else -amount,
+        "charges_total" if entry_type == "charge" else "payments_total": amount
+    }
+    if entry_type == "charge" and category in ("room", "additional"):
+        increments[f"{category}_charges"] = amount
+    folio = await db.folios.find_one_and_update(
+        {"booking_id": booking_id},
+        {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    entry_obj = FolioEntry(
+        booking_id=booking_id,
+        sequence=folio["entry_count"],
+        entry_type=entry_type,
+        category=category,
+        amount=amount,
+        payment_method=payment_method,
+        description=description,
+        balance_after=folio["balance"]
+    )
+    await db.folio_entries.insert_one(entry_obj.dict())
+    return folio
+
+async def ensure_folio(booking: dict) -> dict:
+    folio = await db.folios.find_one({"booking_id": booking["booking_id"]})
+    if folio:
+        return folio
+    
+    # Open the folio with the room charge and any advance already taken,
+    # which also covers bookings created before the ledger existed
+    try:
+        await db.folios.insert_one(Folio(booking_id=booking["booking_id"]).dict())
+    except pymongo.errors.DuplicateKeyError:
+        return await db.folios.find_one({"booking_id": booking["booking_id"]})
+    folio = await post_folio_entry(booking["booking_id"], "charge", "room", booking["total_amount"],
+                                   description="Room charges")
+    if booking.get("advance_payment", 0.0) > 0:
+        folio = await post_folio_entry(booking["booking_id"], "payment", "advance", booking["advance_payment"],
+                                       payment_method="cash", description="Advance payment")
+    return folio
+
+def payment_balance(folio: dict) -> PaymentBalance:
+    balance_due = round(folio["balance"], 2)
+    return PaymentBalance(
+        booking_id=folio["booking_id"],
+        room_charges=folio["room_charges"],
+        additional_charges=folio["additional_charges"],
+        total_amount=folio["charges_total"],
+        paid_amount=folio["payments_total"],
+        balance_due=balance_due,
+        payment_status="paid" if balance_due <= 0 else "pending"
+    )
+
+# Room-night claims
+# One document per (room, night) under a unique index, so two requests
+# cannot reserve the same room for the same night even if both passed
+# the availability check.
+def stay_nights(check_in: datetime, check_out: datetime) -> List[datetime]:
+    return [check_in + timedelta(days=offset) for offset in range((check_out - check_in).days)]
+
+async def release_room_nights(booking_ids: List[str]):
+    await db.room_nights.delete_many({"booking_id": {"$in": booking_ids}})
+
+async def claim_room_nights(bookings: List[dict]) -> bool:
+    """Claim every night of every booking, or none of them."""
+    return await insert_claims([
+        {"room_id": booking["room_id"], "night": night, "booking_id": booking["booking_id"]}
+        for booking in bookings
+        for night in stay_nights(booking["check_in"], booking["check_out"])
+    ])
+
+async def insert_claims(claims: List[dict]) -> bool:
+    """Insert every (room, night) claim, or none of them."""
+    if not claims:
+        return True
+    try:
+        await db.room_nights.insert_many(claims, ordered=False)
+        return True
+    except pymongo.errors.BulkWriteError as e:
+        # Undo only this call's claims; a concurrent request may hold the others
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        inserted = [claim for index, claim in enumerate(claims) if index not in failed]
+        if inserted:
+            await db.room_nights.delete_many({
+                "$or": [{"room_id": claim["room_id"], "night": claim["night"]} for claim in inserted]
+            })
+        if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+        return False
+
+@on_booking_change
+async def release_room_nights_on_exit(booking: dict, previous_status: Optional[str]):
+    # Cancelled and checked-out bookings no longer hold their room
+    if previous_status in ACTIVE_BOOKING_STATUSES and booking["status"] not in ACTIVE_BOOKING_STATUSES:
+        await release_room_nights([booking["booking_id"]])
+
+async def backfill_room_nights(batch_size: int = 1000):
+    """Claim the nights of active bookings made before claims existed.
+
+    Stays already over are skipped. A stay whose nights another booking
+    holds was double booked before claims could prevent it; it is logged.
+    """
+    cursor = db.bookings.find(
+        {"status": {"$in": ACTIVE_BOOKING_STATUSES}, "check_out": {"$gt": datetime.utcnow()}},
+        {"_id": 0, "booking_id": 1, "room_id": 1, "check_in": 1, "check_out": 1}
+    ).batch_size(batch_size)
+    while True:
+        chunk = await cursor.to_list(batch_size)
+        if not chunk:
+            break
+        claimed = set(await db.room_nights.distinct(
+            "booking_id", {"booking_id": {"$in": [booking["booking_id"] for booking in chunk]}}
+        ))
+        for booking in chunk:
+            if booking["booking_id"] not in claimed and not await claim_room_nights([booking]):
+                logger.error(f"Booking {booking['booking_id']} overlaps another stay in room {booking['room_id']}")
+
+# Availability memoization
+class AvailabilityMemo:
+    """Availability search results keyed by (check_in, check_out, room_type).
+
+    A booking that starts or stops holding a room evicts only the entries
+    whose nights overlap its stay (half-open, like the search) and whose
+    room_type is the booking's or None. Entries are found through an index
+    of bucket_days-wide date buckets, so an eviction looks only at entries
+    sharing a bucket with the stay. Entries also record the "rooms"
+    collection version and expire after ttl seconds, which bounds staleness
+    from writes made by other processes.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0, bucket_days: int = 7):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bucket_days = bucket_days
+        self.entries = OrderedDict()  # key -> (stored_at, rooms_version, rooms)
+        self.buckets = defaultdict(set)  # bucket number -> keys
+        # Bumped by every invalidation so a search that raced one is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.evicted = 0
+
+    def bucket_range(self, check_in: date, check_out: date) -> range:
+        return range(check_in.toordinal() // self.bucket_days, check_out.toordinal() // self.bucket_days + 1)
+
+    def get(self, key: tuple) -> Optional[list]:
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl \
+                or entry[1] != collection_versions.get().versions["rooms"]:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: tuple, rooms: list, generation: int):
+        if generation != self.generation:
+            return
+        if key not in self.entries:
+            for bucket in self.bucket_range(key[0], key[1]):
+                self.buckets[bucket].add(key)
+        self.entries[key] = (time.monotonic(), collection_versions.get().versions["rooms"], rooms)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+            self.evicted += 1
+
+    def remove(self, key: tuple):
+        del self.entries[key]
+        for bucket in self.bucket_range(key[0], key[1]):
+            self.buckets[bucket].discard(key)
+            if not self.buckets[bucket]:
+                del self.buckets[bucket]
+
+    def invalidate(self, room_type: Optional[str], check_in: date, check_out: date):
+        """Evict entries overlapping [check_in, check_out) for room_type (None: any type)."""
+        self.generation += 1
+        candidates = set()
+        for bucket in self.bucket_range(check_in, check_out):
+            candidates.update(self.buckets.get(bucket, ()))
+        for key in candidates:
+            key_check_in, key_check_out, key_room_type = key
+            if key_check_in < check_out and key_check_out > check_in \
+                    and (room_type is None or key_room_type in (None, room_type)):
+                self.remove(key)
+                self.invalidated += 1
+
+availability_memo = PerProperty(lambda: AvailabilityMemo(
+    max_entries=int(os.environ.get("AVAILABILITY_MEMO_ENTRIES", "1024")),
+    ttl=float(os.environ.get("AVAILABILITY_MEMO_SECONDS", "30")),
+    bucket_days=int(os.environ.get("AVAILABILITY_MEMO_BUCKET_DAYS", "7"))
+))
+
+@on_booking_change
+async def invalidate_availability(booking: dict, previous_status: Optional[str]):
+    # Moving between confirmed and checked_in keeps the room taken
+    if (previous_status in ACTIVE_BOOKING_STATUSES) == (booking["status"] in ACTIVE_BOOKING_STATUSES):
+        return
+    memo = availability_memo.get()
+    if not memo.entries:
+        memo.generation += 1
+        return
+    room = await db.rooms.find_one({"room_id": booking["room_id"]}, {"_id": 0, "room_type": 1})
+    memo.invalidate(room["room_type"] if room else None, to_date(booking["check_in"]), to_date(booking["check_out"]))
+
+async def get_or_create_guest(name: str, email: str, phone: str, address: str, id_proof: str) -> dict:
+    guest = await db.guests.find_one({"email": email})
+    if not guest:
+        guest = {
+            "guest_id": str(uuid.uuid4()),
+            "name": name,
+            "email": email,
+            "phone": phone,
+            "address": address,
+            "id_proof": id_proof,
+            "created_at": datetime.utcnow()
+        }
+        async with change_versions.stamp() as version:
+            await db.guests.insert_one({**guest, "change_version": version})
+    return guest
+
+async def place_booking(room: dict, guest_id: str, check_in: date, check_out: date, guests_count: int,
+                        special_requests: str = "", advance_payment: float = 0.0,
+                        total_amount: Optional[float] = None, payment_method: str = "cash") -> Optional[Booking]:
+    """Price (unless sold at total_amount), claim and store a confirmed booking of room.
+
+    Returns None when a concurrent booking already claimed one of the nights.
+    """
+    if total_amount is None:
+        total_amount = await rate_calendar.stay_price(room, check_in, check_out)
+    booking_obj = Booking(
+        room_id=room["room_id"],
+        guest_id=guest_id,
+        check_in=check_in,
+        check_out=check_out,
+        total_amount=total_amount,
+        advance_payment=advance_payment,
+        guests_count=guests_count,
+        special_requests=special_requests
+    )
+    
+    # Convert date objects to datetime objects before saving to MongoDB
+    booking_dict_for_db = booking_obj.dict()
+    booking_dict_for_db["check_in"] = datetime.combine(check_in, datetime.min.time())
+    booking_dict_for_db["check_out"] = datetime.combine(check_out, datetime.min.time())
+    
+    if not await claim_room_nights([booking_dict_for_db]):
+        return None
+    try:
+        async with change_versions.stamp() as version:
+            booking_dict_for_db["change_version"] = version
+            await db.bookings.insert_one(booking_dict_for_db)
+    except Exception:
+        await release_room_nights([booking_obj.booking_id])
+        raise
+    audit_log.record("booking", booking_obj.booking_id, "create", None, after=booking_dict_for_db)
+    await notify_booking_change(booking_dict_for_db, None)
+    await ensure_folio(booking_dict_for_db)
+    
+    # Record the sale in the background
+    await job_queue.enqueue("record_sales", {
+        "sales": [sale_document(booking_obj.booking_id, total_amount, payment_method, check_in, "room")]
+    })
+    return booking_obj
+
+# Group bookings
+async def load_free_rooms(room_types: List[str], check_in: datetime, check_out: datetime) -> dict:
+    """Rooms of the given types with no active booking in the range, by type.
+
+    Two queries build the whole view, however many rooms the group needs.
+    """
+    rooms = await db.rooms.find({"room_type": {"$in": room_types}}).to_list(None)
+    busy_room_ids = set(await db.bookings.distinct("room_id", {
+        "status": {"$in": ACTIVE_BOOKING_STATUSES},
+        "check_in": {"$lt": check_out},
+        "check_out": {"$gt": check_in}
+    }))
+    free_rooms = {room_type: [] for room_type in room_types}
+    for room in rooms:
+        if room["room_id"] not in busy_room_ids and room.get("status", "available") != "maintenance":
+            free_rooms[room["room_type"]].append(room)
+    return free_rooms
+
+def allocate_rooms(free_rooms: dict, counts: Dict[str, int]) -> Optional[List[dict]]:
+    """Pick the counts[room_type] lowest-numbered free rooms of each type.
+
+    The numbers need not be consecutive; free rooms are taken in order,
+    skipping any gaps. Returns None when any type is short of rooms.
+    """
+    allocation = []
+    for room_type, count in counts.items():
+        candidates = free_rooms.get(room_type, [])
+        if len(candidates) < count:
+            return None
+        # Rooms are numbered along corridors, so low numbers tend to share a floor
+        candidates = sorted(candidates, key=lambda room: (len(room["room_number"]), room["room_number"]))
+        allocation.extend(candidates[:count])
+    return allocation
+
+# Waitlist and overbooking
+# Requests that find no room wait per room type, ahead of which the
+# overbooking policy may promise a few stays beyond the physical rooms.
+# When a cancellation or no-show frees nights, the matcher packs waiting
+# stays into the type's rooms, moving as few future bookings as it can.
+UNBOUNDED_GAP = 1 << 20
+MAX_EJECTION_CANDIDATES = 8
+
+class RoomCalendar:
+    """Occupied nights of one room type's rooms as sorted stays per room.
+
+    Stays are half-open day numbers [start, end), the nights claimed in
+    room_nights, so a departure and an arrival can share a day. Stays of
+    one room never overlap, which keeps them sorted by both start and end.
+    """
+
+    def __init__(self, room_ids: List[str]):
+        self.starts = {room_id: [] for room_id in room_ids}
+        self.stays = {room_id: [] for room_id in room_ids}
+        self.location = {}
+        self.nightly = Counter()
+
+    def add(self, room_id: str, start: int, end: int, key: str):
+        index = bisect.bisect_left(self.starts[room_id], start)
+        self.starts[room_id].insert(index, start)
+        self.stays[room_id].insert(index, (start, end, key))
+        self.location[key] = (room_id, start, end)
+        for night in range(start, end):
+            self.nightly[night] += 1
+
+    def remove(self, key: str) -> tuple:
+        room_id, start, end = self.location.pop(key)
+        index = bisect.bisect_left(self.starts[room_id], start)
+        while self.stays[room_id][index][2] != key:
+            index += 1
+        del self.starts[room_id][index]
+        del self.stays[room_id][index]
+        for night in range(start, end):
+            self.nightly[night] -= 1
+        return room_id, start, end
+
+    def sold_out(self, start: int, end: int) -> bool:
+        """Whether every room is taken on some night of [start, end)."""
+        rooms = len(self.stays)
+        return any(self.nightly[night] >= rooms for night in range(start, end))
+
+    def blockers(self, room_id: str, start: int, end: int) -> List[str]:
+        """Keys of the stays in room_id that overlap [start, end)."""
+        stays = self.stays[room_id]
+        index = bisect.bisect_left(self.starts[room_id], end) - 1
+        keys = []
+        while index >= 0 and stays[index][1] > start:
+            keys.append(stays[index][2])
+            index -= 1
+        return keys
+
+    def slack(self, room_id: str, start: int, end: int) -> Optional[int]:
+        """Free nights left around [start, end) in room_id, or None if it is taken."""
+        stays = self.stays[room_id]
+        index = bisect.bisect_left(self.starts[room_id], end)
+        before = UNBOUNDED_GAP
+        if index > 0:
+            if stays[index - 1][1] > start:
+                return None
+            before = start - stays[index - 1][1]
+        after = stays[index][0] - end if index < len(stays) else UNBOUNDED_GAP
+        return before + after
+
+    def best_fit(self, start: int, end: int, preferred: Optional[str] = None,
+                 exclude: frozenset = frozenset()) -> Optional[str]:
+        """The free room leaving the smallest gaps around the stay.
+
+        Filling the tightest gap keeps long runs of free nights for long
+        stays; the preferred room wins whenever it is free.
+        """
+        if preferred is not None and preferred not in exclude and self.slack(preferred, start, end) is not None:
+            return preferred
+        best_room, best_slack = None, None
+        for room_id in self.stays:
+            if room_id in exclude:
+                continue
+            slack = self.slack(room_id, start, end)
+            if slack is not None and (best_slack is None or slack < best_slack):
+                best_room, best_slack = room_id, slack
+                if slack == 0:
+                    break
+        return best_room
+
+class StayMatcher:
+    """Assigns stays to rooms of one type, moving as few movable stays as possible.
+
+    A request first gets a free room. Failing that, ejection chains of
+    growing depth are tried: the request takes a room whose blocking stays
+    are all movable, and each of those is placed the same way one level
+    down. As a last resort every movable stay overlapping the request is
+    repacked in order of arrival, each keeping its room when it can;
+    interval graphs are perfect, so without fixed stays the repack succeeds
+    whenever no night is booked beyond the number of rooms. Every change is
+    journaled so a failed attempt is rolled back.
+    """
+
+    def __init__(self, calendar: RoomCalendar, movable: set, max_depth: int = 2):
+        self.calendar = calendar
+        self.movable = movable
+        self.max_depth = max_depth
+        self.journal = []
+        self.original_rooms = {}
+
+    def add(self, room_id: str, start: int, end: int, key: str):
+        self.calendar.add(room_id, start, end, key)
+        self.journal.append((key, None))
+
+    def remove(self, key: str) -> tuple:
+        location = self.calendar.remove(key)
+        self.original_rooms.setdefault(key, location[0])
+        self.journal.append((key, location))
+        return location
+
+    def rollback(self, mark: int):
+        while len(self.journal) > mark:
+            key, location = self.journal.pop()
+            if location is None:
+                self.calendar.remove(key)
+            else:
+                self.calendar.add(*location, key)
+
+    def moves(self) -> Dict[str, tuple]:
+        """(from room, to room) of every stay that ended up in another room."""
+        return {
+            key: (room_id, self.calendar.location[key][0])
+            for key, room_id in self.original_rooms.items()
+            if self.calendar.location[key][0] != room_id
+        }
+
+    def place(self, key: str, start: int, end: int) -> Optional[str]:
+        if self.calendar.sold_out(start, end):
+            return None
+        for depth in range(self.max_depth + 1):
+            if self.relocate(key, start, end, depth, frozenset()):
+                return self.calendar.location[key][0]
+        if self.repack(key, start, end):
+            return self.calendar.location[key][0]
+        return None
+
+    def relocate(self, key: str, start: int, end: int, depth: int, excluded: frozenset) -> bool:
+        calendar = self.calendar
+        room_id = calendar.best_fit(start, end, exclude=excluded)
+        if room_id is not None:
+            self.add(room_id, start, end, key)
+            return True
+        if depth == 0:
+            return False
+        candidates = []
+        for room_id in calendar.stays:
+            if room_id in excluded:
+                continue
+            keys = calendar.blockers(room_id, start, end)
+            if all(other in self.movable for other in keys):
+                candidates.append((len(keys), room_id, keys))
+        candidates.sort(key=lambda candidate: candidate[0])
+        for _, room_id, keys in candidates[:MAX_EJECTION_CANDIDATES]:
+            mark = len(self.journal)
+            ejected = [self.remove(other) for other in keys]
+            self.add(room_id, start, end, key)
+            if all(self.relocate(other, stay_start, stay_end, depth - 1, excluded | {room_id})
+                   for other, (_, stay_start, stay_end) in zip(keys, ejected)):
+                return True
+            self.rollback(mark)
+        return False
+
+    def repack(self, key: str, start: int, end: int) -> bool:
+        calendar = self.calendar
+        mark = len(self.journal)
+        overlapping = {
+            other for room_id in calendar.stays
+            for other in calendar.blockers(room_id, start, end) if other in self.movable
+        }
+        pending = [(start, end, key, None)]
+        for other in overlapping:
+            room_id, stay_start, stay_end = self.remove(other)
+            pending.append((stay_start, stay_end, other, room_id))
+        pending.sort(key=lambda stay: (stay[0], -stay[1]))
+        for stay_start, stay_end, other, room_id in pending:
+            target = calendar.best_fit(stay_start, stay_end, preferred=room_id)
+            if target is None:
+                self.rollback(mark)
+                return False
+            self.add(target, stay_start, stay_end, other)
+        return True
+
+waitlist_lock = PerProperty(asyncio.Lock)
+
+async def load_room_calendar(room_type: str, today: date) -> tuple:
+    """Calendar of the type's bookable rooms from today on, with the set of movable bookings.
+
+    Confirmed bookings arriving after today may change rooms unless they
+    belong to a group, whose rooms are kept together.
+    """
+    rooms = await db.rooms.find({"room_type": room_type, "status": {"$ne": "maintenance"}}).to_list(None)
+    calendar = RoomCalendar([room["room_id"] for room in rooms])
+    movable = set()
+    first_night = datetime.combine(today, datetime.min.time())
+    async for booking in db.bookings.find(
+        {
+            "room_id": {"$in": list(calendar.stays)},
+            "status": {"$in": ACTIVE_BOOKING_STATUSES},
+            "check_out": {"$gt": first_night}
+        },
+        {"_id": 0, "booking_id": 1, "room_id": 1, "check_in": 1, "check_out": 1, "status": 1, "group_id": 1}
+    ):
+        calendar.add(booking["room_id"], day_number(booking["check_in"]), day_number(booking["check_out"]),
+                     booking["booking_id"])
+        if booking["status"] == "confirmed" and booking["check_in"] > first_night and not booking.get("group_id"):
+            movable.add(booking["booking_id"])
+    return {room["room_id"]: room for room in rooms}, calendar, movable
+
+async def apply_room_moves(moves: Dict[str, tuple]) -> bool:
+    """Move bookings between rooms, re-claiming their nights as one unit.
+
+    The target nights are claimed before the old ones are released, so a
+    booking never goes without claims. Nights another moving booking holds
+    (stays swapping rooms) are handed over in place. Returns False,
+    changing nothing, if any booking changed meanwhile or a concurrent
+    booking claimed one of the target nights.
+    """
+    if not moves:
+        return True
+    booking_ids = list(moves)
+    bookings = await db.bookings.find({"booking_id": {"$in": booking_ids}, "status": "confirmed"}).to_list(None)
+    if len(bookings) != len(moves) or any(booking["room_id"] != moves[booking["booking_id"]][0] for booking in bookings):
+        return False
+    moved = [{**booking, "room_id": moves[booking["booking_id"]][1]} for booking in bookings]
+    
+    held = {
+        (claim["room_id"], claim["night"]): claim["booking_id"]
+        for claim in await db.room_nights.find({"booking_id": {"$in": booking_ids}}).to_list(None)
+    }
+    targets = [
+        {"room_id": booking["room_id"], "night": night, "booking_id": booking["booking_id"]}
+        for booking in moved
+        for night in stay_nights(booking["check_in"], booking["check_out"])
+    ]
+    if not await insert_claims([claim for claim in targets if (claim["room_id"], claim["night"]) not in held]):
+        return False
+    for claim in targets:
+        holder = held.get((claim["room_id"], claim["night"]))
+        if holder is None:
+            continue
+        result = await db.room_nights.update_one(
+            {"room_id": claim["room_id"], "night": claim["night"], "booking_id": holder},
+            {"$set": {"booking_id": claim["booking_id"]}}
+        )
+        # The holder released the night meanwhile (its status changed), so claim it afresh
+        if result.matched_count == 0 and not await insert_claims([claim]):
+            logger.error(f"Room move lost night {claim['night']:%Y-%m-%d} of room {claim['room_id']} "
+                         f"for booking {claim['booking_id']}")
+    # Whatever a moving booking still holds in its old room was not handed over
+    await db.room_nights.delete_many({"$or": [
+        {"booking_id": booking["booking_id"], "room_id": booking["room_id"]} for booking in bookings
+    ]})
+    
+    async with change_versions.stamp() as version:
+        results = await asyncio.gather(*[
+            db.bookings.update_one(
+                {"booking_id": after["booking_id"], "status": "confirmed", "room_id": before["room_id"]},
+                {"$set": {"room_id": after["room_id"], "change_version": version}}
+            )
+            for before, after in zip(bookings, moved)
+        ])
+    for before, after, result in zip(bookings, moved, results):
+        if result.matched_count == 0:
+            # It changed while moving; put its claims back where the booking now is
+            current = await db.bookings.find_one({"booking_id": before["booking_id"]})
+            await release_room_nights([before["booking_id"]])
+            if current is not None and current["status"] in ACTIVE_BOOKING_STATUSES \
+                    and not await claim_room_nights([current]):
+                logger.error(f"Booking {before['booking_id']} lost its room nights to a concurrent booking")
+            continue
+        audit_log.record("booking", before["booking_id"], "reassign_room", None, before=before, after=after)
+    for room_id in {room_id for move in moves.values() for room_id in move}:
+        await reprioritize_room_tasks(room_id)
+    for booking in moved:
+        availability_memo.invalidate(None, to_date(booking["check_in"]), to_date(booking["check_out"]))
+    collection_versions.bump("bookings")
+    booking_store.invalidate()
+    return True
+
+async def overbooking_allows(room_type: str, room_count: int, calendar: RoomCalendar,
+                             check_in: datetime, check_out: datetime) -> bool:
+    """Whether one more stay fits on every night under the type's overbooking limit."""
+    policy = await db.overbooking_policies.find_one({"room_type": room_type})
+    limit = policy["limit"] if policy else 0
+    if limit <= 0:
+        return False
+    promised = await db.waitlist.find(
+        {
+            "room_type": room_type,
+            "status": "waiting",
+            "overbooked": True,
+            "check_in": {"$lt": check_out},
+            "check_out": {"$gt": check_in}
+        },
+        {"_id": 0, "check_in": 1, "check_out": 1}
+    ).to_list(None)
+    nightly = Counter()
+    for entry in promised:
+        for night in range(day_number(entry["check_in"]), day_number(entry["check_out"])):
+            nightly[night] += 1
+    return all(
+        calendar.nightly[night] + nightly[night] + 1 <= room_count + limit
+        for night in range(day_number(check_in), day_number(check_out))
+    )
+
+async def allocate_waitlist_entry(entry: dict, room: dict, moves: Dict[str, tuple]) -> Optional[Booking]:
+    """Apply the matcher's moves and book the freed room for a waitlist entry."""
+    if not await apply_room_moves(moves):
+        return None
+    booking_obj = await place_booking(
+        room, entry["guest_id"], to_date(entry["check_in"]), to_date(entry["check_out"]),
+        entry["guests_count"], entry["special_requests"], entry["advance_payment"]
+    )
+    if booking_obj is not None:
+        await db.waitlist.update_one(
+            {"waitlist_id": entry["waitlist_id"]},
+            {"$set": {"status": "allocated", "booking_id": booking_obj.booking_id}}
+        )
+    return booking_obj
+
+async def join_waitlist(entry_obj: WaitlistEntry) -> WaitlistEntry:
+    """Book the entry straight away if the matcher finds it a room, otherwise queue it."""
+    entry = entry_obj.dict()
+    entry["check_in"] = datetime.combine(entry_obj.check_in, datetime.min.time())
+    entry["check_out"] = datetime.combine(entry_obj.check_out, datetime.min.time())
+    start, end = day_number(entry_obj.check_in), day_number(entry_obj.check_out)
+    async with waitlist_lock.get():
+        rooms, calendar, movable = await load_room_calendar(entry_obj.room_type, datetime.utcnow().date())
+        if not rooms:
+            raise HTTPException(status_code=404, detail="No rooms of this type")
+        matcher = StayMatcher(calendar, movable)
+        room_id = matcher.place(entry_obj.waitlist_id, start, end)
+        await db.waitlist.insert_one(entry)
+        booking_obj = None
+        if room_id is not None:
+            booking_obj = await allocate_waitlist_entry(entry, rooms[room_id], matcher.moves())
+        if booking_obj is not None:
+            entry_obj.status = "allocated"
+            entry_obj.booking_id = booking_obj.booking_id
+        elif await overbooking_allows(entry_obj.room_type, len(rooms), calendar, entry["check_in"], entry["check_out"]):
+            entry_obj.overbooked = True
+            await db.waitlist.update_one({"waitlist_id": entry_obj.waitlist_id}, {"$set": {"overbooked": True}})
+    audit_log.record("waitlist", entry_obj.waitlist_id, "create", None, after=entry_obj)
+    return entry_obj
+
+@job_queue.handler("reallocate_waitlist")
+async def reallocate_waitlist_job(payload: dict):
+    """Match waiting stays of a room type to the rooms freed by cancellations and no-shows.
+
+    Overbooked stays the hotel already promised go first, then the rest in
+    order of joining.
+    """
+    room_type = payload["room_type"]
+    today = datetime.utcnow().date()
+    allocated = 0
+    moved = 0
+    async with waitlist_lock.get():
+        entries = await db.waitlist.find({
+            "room_type": room_type,
+            "status": "waiting",
+            "check_in": {"$gte": datetime.combine(today, datetime.min.time())}
+        }).sort([("overbooked", -1), ("created_at", 1)]).to_list(None)
+        if not entries:
+            return {"allocated": 0, "moved": 0, "waiting": 0}
+        rooms, calendar, movable = await load_room_calendar(room_type, today)
+        for entry in entries:
+            matcher = StayMatcher(calendar, movable)
+            room_id = matcher.place(entry["waitlist_id"], day_number(entry["check_in"]), day_number(entry["check_out"]))
+            if room_id is None:
+                continue
+            moves = matcher.moves()
+            booking_obj = await allocate_waitlist_entry(entry, rooms[room_id], moves)
+            if booking_obj is None:
+                # The calendar went stale under a concurrent booking; rebuild it and carry on
+                rooms, calendar, movable = await load_room_calendar(room_type, today)
+                continue
+            # Track the new booking under its own id so later entries can move it
+            _, start, end = calendar.remove(entry["waitlist_id"])
+            calendar.add(room_id, start, end, booking_obj.booking_id)
+            movable.add(booking_obj.booking_id)
+            allocated += 1
+            moved += len(moves)
+    return {"allocated": allocated, "moved": moved, "waiting": len(entries) - allocated}
+
+@on_booking_change
+async def reallocate_released_rooms(booking: dict, previous_status: Optional[str]):
+    if previous_status in ACTIVE_BOOKING_STATUSES and booking["status"] in ["cancelled", "no_show"]:
+        room = await db.rooms.find_one({"room_id": booking["room_id"]})
+        if room and await db.waitlist.count_documents({"room_type": room["room_type"], "status": "waiting"}, limit=1):
+            await job_queue.enqueue("reallocate_waitlist", {"room_type": room["room_type"]})
+
+# Room assignment optimizer
+# Stays are pinned to the room picked at booking time, which scatters
+# one-night gaps nobody can sell. The optimizer re-packs movable stays of
+# a room type so free nights gather into long runs in fewer rooms.
+OPTIMIZER_DIFF_LIMIT = 1000
+OPTIMIZER_STRATEGIES = ["close_gaps", "compact"]
+
+def fragmentation(calendar: RoomCalendar, first: int, last: int, min_stay: int) -> dict:
+    """Free runs of nights per room over [first, last).
+
+    Runs shorter than min_stay between two stays cannot be sold; runs
+    reaching the end of the horizon are left out of that count.
+    """
+    free_runs = free_nights = unsellable_nights = longest_run = 0
+    for stays in calendar.stays.values():
+        cursor = first
+        for start, end, _ in stays + [(last, last, None)]:
+            start = min(max(start, first), last)
+            if start > cursor:
+                run = start - cursor
+                free_runs += 1
+                free_nights += run
+                longest_run = max(longest_run, run)
+                if run < min_stay and start < last:
+                    unsellable_nights += run
+            cursor = max(cursor, min(end, last))
+            if cursor >= last:
+                break
+    return {"free_runs": free_runs, "free_nights": free_nights,
+            "unsellable_nights": unsellable_nights, "longest_free_run": longest_run}
+
+def compact_assignments(calendar: RoomCalendar, movable: set, min_stay: int,
+                        keep_sellable: bool = True) -> Optional[Dict[str, tuple]]:
+    """Re-place movable stays in arrival order, each right after the stay that ends latest before it.
+
+    The frontier holds, per room, the end of the last stay that starts at
+    or before the sweep, sorted so the tightest left gap is one bisect away.
+    With keep_sellable a stay keeps its room whenever the gap it leaves
+    there is sellable (none, or at least min_stay nights), which closes
+    unsellable gaps with far fewer moves; otherwise it only keeps its room
+    on a tie, packing free nights into the longest runs. Returns the moves,
+    or None (calendar unchanged) when a fixed stay leaves some stay without
+    a room.
+    """
+    original = {key: calendar.remove(key) for key in movable}
+    events = [(start, 0, -end, key, room_id) for key, (room_id, start, end) in original.items()]
+    events += [
+        (start, 1, -end, key, room_id)
+        for key, (room_id, start, end) in calendar.location.items()
+    ]
+    # At equal starts fixed stays enter the frontier first; longer stays go first
+    events.sort(key=lambda event: (event[0], -event[1], event[2]))
+
+    no_stay = -UNBOUNDED_GAP
+    room_frontier = {room_id: no_stay for room_id in calendar.stays}
+    frontier = sorted((end, room_id) for room_id, end in room_frontier.items())
+
+    def advance(room_id: str, end: int):
+        frontier.pop(bisect.bisect_left(frontier, (room_frontier[room_id], room_id)))
+        room_frontier[room_id] = end
+        bisect.insort(frontier, (end, room_id))
+
+    placed = []
+    for start, fixed, negative_end, key, current_room in events:
+        end = -negative_end
+        if fixed:
+            if end > room_frontier[current_room]:
+                advance(current_room, end)
+            continue
+        chosen = None
+        current_gap = start - room_frontier[current_room]
+        if (current_gap == 0 or (keep_sellable and current_gap >= min_stay)) \
+                and calendar.slack(current_room, start, end) is not None:
+            chosen = current_room
+        index = bisect.bisect_left(frontier, (start + 1,)) - 1
+        while chosen is None and index >= 0:
+            left_end, room_id = frontier[index]
+            if calendar.slack(room_id, start, end) is not None:
+                chosen = room_id
+                if room_frontier[current_room] == left_end and calendar.slack(current_room, start, end) is not None:
+                    chosen = current_room
+            index -= 1
+        if chosen is None:
+            for placed_key in placed:
+                calendar.remove(placed_key)
+            for key, (room_id, start, end) in original.items():
+                calendar.add(room_id, start, end, key)
+            return None
+        calendar.add(chosen, start, end, key)
+        placed.append(key)
+        advance(chosen, end)
+    return {
+        key: (room_id, calendar.location[key][0])
+        for key, (room_id, _, _) in original.items()
+        if calendar.location[key][0] != room_id
+    }
+
+async def optimize_room_type(room_type: str, dry_run: bool, days: int, min_stay: int, strategy: str) -> dict:
+    today = datetime.utcnow().date()
+    first = day_number(today)
+    last = first + days
+    rooms, calendar, movable = await load_room_calendar(room_type, today)
+    # Stays beyond the horizon keep their rooms
+    movable = {key for key in movable if calendar.location[key][1] < last}
+    before = fragmentation(calendar, first, last, min_stay)
+    moves = compact_assignments(calendar, movable, min_stay, keep_sellable=strategy == "close_gaps")
+    after = fragmentation(calendar, first, last, min_stay) if moves is not None else before
+    improved = moves is not None and (after["unsellable_nights"], after["free_runs"]) < (
+        before["unsellable_nights"], before["free_runs"])
+    if not improved:
+        moves = {}
+        after = before
+
+    diff = []
+    for booking_id, (from_room, to_room) in list(moves.items())[:OPTIMIZER_DIFF_LIMIT]:
+        _, start, end = calendar.location[booking_id]
+        diff.append({
+            "booking_id": booking_id,
+            "check_in": (EPOCH + timedelta(days=start)).isoformat(),
+            "check_out": (EPOCH + timedelta(days=end)).isoformat(),
+            "from_room": rooms[from_room]["room_number"],
+            "to_room": rooms[to_room]["room_number"]
+        })
+    applied = False
+    if moves and not dry_run:
+        if not await apply_room_moves(moves):
+            # Retried by the job queue against a fresh calendar
+            raise RuntimeError(f"Bookings of {room_type} changed while optimizing")
+        applied = True
+    return {"room_type": room_type, "before": before, "after": after, "moves_total": len(moves),
+            "moves": diff, "applied": applied}
+
+@job_queue.handler("optimize_room_assignments")
+async def optimize_room_assignments_job(payload: dict):
+    room_types = [payload["room_type"]] if payload.get("room_type") else sorted(await db.rooms.distinct("room_type"))
+    results = []
+    async with waitlist_lock.get():
+        for room_type in room_types:
+            results.append(await optimize_room_type(
+                room_type, payload["dry_run"], payload["days"], payload["min_stay"], payload["strategy"]
+            ))
+    return {"dry_run": payload["dry_run"], "room_types": results}
+
+# Housekeeping
+# Cleaning tasks are generated from booking events and handed out in
+# order of the room's next arrival, so rooms guests are about to walk
+# into are turned around first.
+OPEN_TASK_STATUSES = ["pending", "assigned"]
+NO_ARRIVAL = datetime(9999, 12, 31)
+# Room status after each task type is completed, and the task that follows
+TASK_COMPLETION = {
+    "checkout_clean": ("clean", "inspection"),
+    "inspection": ("inspected", None),
+}
+
+def room_floor(room_number: str) -> str:
+    # "101" -> "1", "1204" -> "12"; short numbers are on the ground floor
+    return room_number[:-2] if len(room_number) > 2 else "0"
+
+async def set_room_status(room_id: str, room_status: str):
+    async with change_versions.stamp() as version:
+        await db.rooms.update_one({"room_id": room_id}, {"$set": {"status": room_status, "change_version": version}})
+    collection_versions.bump("rooms")
+
+async def next_arrival(room_id: str) -> datetime:
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    booking = await db.bookings.find_one(
+        {"room_id": room_id, "status": "confirmed", "check_in": {"$gte": today}},
+        sort=[("check_in", 1)]
+    )
+    return booking["check_in"] if booking else NO_ARRIVAL
+
+async def create_housekeeping_task(room: dict, task_type: str, booking_id: Optional[str] = None):
+    task = HousekeepingTask(
+        room_id=room["room_id"],
+        room_number=room["room_number"],
+        floor=room_floor(room["room_number"]),
+        task_type=task_type,
+        booking_id=booking_id
+    ).dict()
+    task["priority_at"] = await next_arrival(room["room_id"])
+    await db.housekeeping_tasks.insert_one(task)
+
+async def reprioritize_room_tasks(room_id: str) -> int:
+    result = await db.housekeeping_tasks.update_many(
+        {"room_id": room_id, "status": {"$in": OPEN_TASK_STATUSES}},
+        {"$set": {"priority_at": await next_arrival(room_id)}}
+    )
+    return result.matched_count
+
+def task_from_db(task: dict) -> HousekeepingTask:
+    next_arrival_at = task.get("priority_at")
+    return HousekeepingTask(**{**task, "next_arrival": None if next_arrival_at == NO_ARRIVAL else next_arrival_at})
+
+@on_booking_change
+async def update_housekeeping(booking: dict, previous_status: Optional[str]):
+    if booking["status"] == "checked_in" and previous_status != "checked_in":
+        await set_room_status(booking["room_id"], "occupied")
+    elif (booking["status"] == "checked_out" and previous_status != "checked_out") \
+            or (booking["status"] in ["cancelled", "no_show"] and previous_status == "checked_in"):
+        # A stay cancelled after check-in left the room used, just like a check-out
+        room = await db.rooms.find_one({"room_id": booking["room_id"]})
+        if room:
+            await set_room_status(room["room_id"], "dirty")
+            await create_housekeeping_task(room, "checkout_clean", booking["booking_id"])
+    elif booking["status"] in ["confirmed", "cancelled", "no_show"]:
+        # An arrival was added or removed: open tasks for the room move up or down
+        if await reprioritize_room_tasks(booking["room_id"]) == 0 and booking["status"] == "confirmed":
+            # A guest is due in a room left dirty with no task (e.g. marked by hand)
+            room = await db.rooms.find_one({"room_id": booking["room_id"]})
+            if room and room.get("status") == "dirty":
+                await create_housekeeping_task(room, "checkout_clean")
+
+async def assign_next_task(staff: str, floor: Optional[str]) -> Optional[dict]:
+    query = {"status": "pending"}
+    if floor is not None:
+        query["floor"] = floor
+    return await db.housekeeping_tasks.find_one_and_update(
+        query,
+        {"$set": {"status": "assigned", "assigned_to": staff, "assigned_at": datetime.utcnow()}},
+        sort=[("priority_at", 1), ("created_at", 1)],
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+
+async def complete_task(task_id: str) -> Optional[dict]:
+    task = await db.housekeeping_tasks.find_one_and_update(
+        {"task_id": task_id, "status": {"$in": OPEN_TASK_STATUSES}},
+        {"$set": {"status": "done", "completed_at": datetime.utcnow()}},
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    if task is None:
+        return None
+    room_status, follow_up = TASK_COMPLETION[task["task_type"]]
+    room = await db.rooms.find_one({"room_id": task["room_id"]})
+    # A guest may already be in the room again; never overwrite "occupied"
+    if room and room.get("status") != "occupied":
+        await set_room_status(room["room_id"], room_status)
+    if room and follow_up:
+        await create_housekeeping_task(room, follow_up, task.get("booking_id"))
+    return task
+
+# Guest profiles
+# One document per guest with lifetime stay and spend counters. Booking
+# status changes and newly recorded sales update it incrementally; the
+# rebuild_guest_profiles job recomputes every profile from scratch.
+GUEST_PROFILE_STAY_STATUSES = ["checked_out"]
+GUEST_PROFILE_CANCELLED_STATUSES = ["cancelled", "no_show"]
+GUEST_PROFILE_BATCH_SIZE = 500
+GUEST_HIGH_VALUE_SPEND = float(os.environ.get("GUEST_HIGH_VALUE_SPEND", "5000"))
+
+def profile_counts(status: Optional[str], nights: int, room_type: str) -> dict:
+    """What one booking in the given status adds to its guest's counters."""
+    if status in GUEST_PROFILE_STAY_STATUSES:
+        return {"stays": 1, "nights": nights, f"room_type_nights.{room_type.replace('.', '_')}": nights}
+    if status in GUEST_PROFILE_CANCELLED_STATUSES:
+        return {"cancellations": 1}
+    return {}
+
+def profile_tags(profile: dict) -> List[str]:
+    tags = []
+    stays = profile.get("stays", 0)
+    if stays >= 5:
+        tags.append("loyal")
+    elif stays >= 2:
+        tags.append("repeat")
+    if profile.get("total_spend", 0) >= GUEST_HIGH_VALUE_SPEND:
+        tags.append("high_value")
+    if profile.get("longest_stay", 0) >= 7:
+        tags.append("long_stay")
+    if profile.get("cancellations", 0) >= 2 and profile["cancellations"] > stays:
+        tags.append("frequent_canceller")
+    return tags
+
+async def update_guest_profile(guest_id: str, increments: dict, maximums: Optional[dict] = None):
+    update = {"$set": {"updated_at": datetime.utcnow()}}
+    if increments:
+        update["$inc"] = increments
+    if maximums:
+        update["$max"] = maximums
+    profile = await db.guest_profiles.find_one_and_update(
+        {"guest_id": guest_id}, update, upsert=True, return_document=pymongo.ReturnDocument.AFTER
+    )
+    tags = profile_tags(profile)
+    if tags != profile.get("tags"):
+        await db.guest_profiles.update_one({"guest_id": guest_id}, {"$set": {"tags": tags}})
+
+@on_booking_change
+async def update_profile_on_booking_change(booking: dict, previous_status: Optional[str]):
+    if booking["status"] == previous_status:
+        return
+    room = await db.rooms.find_one({"room_id": booking["room_id"]}, {"room_type": 1})
+    room_type = room["room_type"] if room else "unknown"
+    nights = (to_date(booking["check_out"]) - to_date(booking["check_in"])).days
+    added = profile_counts(booking["status"], nights, room_type)
+    removed = profile_counts(previous_status, nights, room_type)
+    increments = {
+        field: added.get(field, 0) - removed.get(field, 0)
+        for field in added.keys() | removed.keys()
+        if added.get(field, 0) != removed.get(field, 0)
+    }
+    if not increments:
+        return
+    maximums = None
+    if booking["status"] in GUEST_PROFILE_STAY_STATUSES:
+        maximums = {"last_stay": booking["check_out"], "longest_stay": nights}
+    await update_guest_profile(booking["guest_id"], increments, maximums)
+
+async def add_guest_spend(sales: List[dict]):
+    if not sales:
+        return
+    bookings = await db.bookings.find(
+        {"booking_id": {"$in": list({sale["booking_id"] for sale in sales})}},
+        {"booking_id": 1, "guest_id": 1}
+    ).to_list(None)
+    guest_ids = {booking["booking_id"]: booking["guest_id"] for booking in bookings}
+    spend = Counter()
+    for sale in sales:
+        if sale["booking_id"] in guest_ids:
+            spend[guest_ids[sale["booking_id"]]] += sale["amount"]
+    for guest_id, amount in spend.items():
+        await update_guest_profile(guest_id, {"total_spend": amount})
+
+@job_queue.handler("rebuild_guest_profiles")
+async def rebuild_guest_profiles_job(payload: dict):
+    """Recompute every profile from bookings, sales and their archives (idempotent).
+
+    Counters incremented by writes that land while the aggregations run
+    are overwritten, so run it when the property is quiet.
+    """
+    started = datetime.utcnow()
+    room_types = {
+        room["room_id"]: room["room_type"]
+        for room in await db.rooms.find({}, {"room_id": 1, "room_type": 1}).to_list(None)
+    }
+    profiles = {}
+
+    def profile(guest_id: str) -> dict:
+        return profiles.setdefault(guest_id, {
+            "stays": 0, "nights": 0, "cancellations": 0, "total_spend": 0.0,
+            "last_stay": None, "longest_stay": 0, "room_type_nights": {}
+        })
+
+    # Archived sales stay paired with archived bookings
+    for bookings_source, sales_source in [("bookings", "sales"), ("bookings_archive", "sales_archive")]:
+        async for row in db[bookings_source].aggregate([
+            {"$match": {"status": {"$in": GUEST_PROFILE_STAY_STATUSES + GUEST_PROFILE_CANCELLED_STATUSES}}},
+            {"$project": {
+                "guest_id": 1, "room_id": 1, "status": 1, "check_out": 1,
+                "nights": {"$divide": [{"$subtract": ["$check_out", "$check_in"]}, 86400000]}
+            }},
+            {"$group": {
+                "_id": {"guest_id": "$guest_id", "room_id": "$room_id", "status": "$status"},
+                "count": {"$sum": 1},
+                "nights": {"$sum": "$nights"},
+                "longest_stay": {"$max": "$nights"},
+                "last_stay": {"$max": "$check_out"}
+            }}
+        ]):
+            guest = profile(row["_id"]["guest_id"])
+            if row["_id"]["status"] in GUEST_PROFILE_CANCELLED_STATUSES:
+                guest["cancellations"] += row["count"]
+                continue
+            nights = int(round(row["nights"]))
+            room_type = room_types.get(row["_id"]["room_id"], "unknown").replace(".", "_")
+            guest["stays"] += row["count"]
+            guest["nights"] += nights
+            guest["room_type_nights"][room_type] = guest["room_type_nights"].get(room_type, 0) + nights
+            guest["longest_stay"] = max(guest["longest_stay"], int(round(row["longest_stay"])))
+            if guest["last_stay"] is None or row["last_stay"] > guest["last_stay"]:
+                guest["last_stay"] = row["last_stay"]
+
+        async for row in db[sales_source].aggregate([
+            {"$lookup": {"from": bookings_source, "localField": "booking_id", "foreignField": "booking_id", "as": "booking"}},
+            {"$group": {"_id": {"$arrayElemAt": ["$booking.guest_id", 0]}, "total_spend": {"$sum": "$amount"}}}
+        ]):
+            if row["_id"] is not None:
+                profile(row["_id"])["total_spend"] += row["total_spend"]
+
+    guest_ids = list(profiles)
+    for offset in range(0, len(guest_ids), GUEST_PROFILE_BATCH_SIZE):
+        await asyncio.gather(*[
+            db.guest_profiles.update_one(
+                {"guest_id": guest_id},
+                {"$set": {**profiles[guest_id], "tags": profile_tags(profiles[guest_id]), "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+            for guest_id in guest_ids[offset:offset + GUEST_PROFILE_BATCH_SIZE]
+        ])
+    # Profiles neither rebuilt nor updated since the job started have nothing behind them
+    removed = await db.guest_profiles.delete_many({"updated_at": {"$lt": started}})
+    return {"profiles": len(profiles), "removed": removed.deleted_count}
+
+# Reporting
+# Each source names the indexed date field every report must be bounded
+# by, so the pipeline's leading $match always starts on an index, plus
+# the filters, group-bys and metrics it accepts. Ranges starting before
+# the archive cutoff also read the source's archive collection. Joins go through unique
+# indexes (bookings.booking_id, rooms.room_id) and stay inside the
+# document's property, since ids repeat across properties cloned from
+# one another.
+def property_lookup(collection: str, field: str, alias: str) -> dict:
+    """$lookup of the document in `collection` with the same `field` and property_id."""
+    return {"$lookup": {
+        "from": collection,
+        "let": {"key": f"${field}", "property_id": "$property_id"},
+        "pipeline": [
+            {"$match": {"$expr": {"$and": [
+                {"$eq": ["$property_id", "$$property_id"]},
+                {"$eq": [f"${field}", "$$key"]},
+            ]}}},
+            {"$limit": 1},
+        ],
+        "as": alias,
+    }}
+
+ROOM_LOOKUP = [
+    property_lookup("rooms", "room_id", "room"),
+    {"$unwind": {"path": "$room", "preserveNullAndEmptyArrays": True}},
+]
+REPORT_SOURCES = {
+    "sales": {
+        "date_field": "date",
+        "amount_field": "amount",
+        "filters": {"payment_method": "payment_method", "room_type": "room.room_type", "category": "kind"},
+        "group_by": {"payment_method": "$payment_method", "kind": "$kind", "room_type": "$room.room_type"},
+        "joins": [
+            property_lookup("bookings", "booking_id", "booking"),
+            {"$addFields": {"room_id": {"$ifNull": [
+                {"$arrayElemAt": ["$booking.room_id", 0]},
+                {"$arrayElemAt": ["$archived_booking.room_id", 0]},
+            ]}}},
+            *ROOM_LOOKUP,
+        ],
+        "metrics": {},
+        # Archived sales belong to archived bookings
+        "archive": "sales_archive",
+        "archive_joins": [property_lookup("bookings_archive", "booking_id", "archived_booking")],
+    },
+    "expenses": {
+        "date_field": "date",
+        "amount_field": "amount",
+        "filters": {"category": "category"},
+        "group_by": {"category": "$category", "created_by": "$created_by"},
+        "joins": [],
+        "metrics": {},
+        "archive": None,
+        "archive_joins": [],
+    },
+    "bookings": {
+        "date_field": "check_in",
+        "amount_field": "total_amount",
+        "filters": {"status": "status", "room_type": "room.room_type"},
+        "group_by": {"status": "$status", "room_type": "$room.room_type", "room_number": "$room.room_number"},
+        "joins": ROOM_LOOKUP,
+        "metrics": {
+            "nights": {"$sum": {"$divide": [{"$subtract": ["$check_out", "$check_in"]}, 86400000]}},
+            "advance_payment": {"$sum": "$advance_payment"},
+        },
+        "archive": "bookings_archive",
+        "archive_joins": [],
+    },
+}
+REPORT_PERIODS = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+REPORT_MAX_RANGE_DAYS = int(os.environ.get("REPORT_MAX_RANGE_DAYS", "1100"))
+
+def compile_report(report: ReportQuery, archive_cutoff: Optional[datetime] = None) -> List[dict]:
+    """Validate a report query and compile it into one aggregation pipeline.
+
+    A range starting before archive_cutoff unions in the source's archive.
+    Raises HTTPException(400) for anything outside the source's whitelist.
+    """
+    source = REPORT_SOURCES.get(report.source)
+    if source is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown report source {report.source}")
+    filters = report.filters
+    if not filters.start_date or not filters.end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Reports need both start_date and end_date"
+        )
+    if not 0 < (filters.end_date - filters.start_date).days <= REPORT_MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Report range must be between 1 and {REPORT_MAX_RANGE_DAYS} days"
+        )
+    date_field = source["date_field"]
+    pipeline = [{"$match": {date_field: {
+        "$gte": datetime.combine(filters.start_date, datetime.min.time()),
+        "$lt": datetime.combine(filters.end_date, datetime.min.time())
+    }}}]
+
+    needs_join = False
+    post_match = {}
+    for name in ["category", "payment_method", "room_type", "status"]:
+        values = getattr(filters, name)
+        if values is None:
+            continue
+        if name not in source["filters"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{report.source} reports cannot filter by {name}"
+            )
+        field = source["filters"][name]
+        if field.startswith("room."):
+            needs_join = True
+            post_match[field] = {"$in": values}
+        else:
+            pipeline[0]["$match"][field] = {"$in": values}
+
+    include_archive = source["archive"] is not None and archive_cutoff is not None \
+        and pipeline[0]["$match"][date_field]["$gte"] < archive_cutoff
+    if include_archive:
+        # The facade scopes only the source collection; the archive is scoped here
+        pipeline.append({"$unionWith": {"coll": source["archive"], "pipeline": [
+            {"$match": {"property_id": current_property.get(), **pipeline[0]["$match"]}}
+        ]}})
+
+    group_id = {}
+    for name in report.group_by:
+        if name in REPORT_PERIODS:
+            group_id[name] = {"$dateToString": {"format": REPORT_PERIODS[name], "date": f"${date_field}"}}
+        elif name in source["group_by"]:
+            group_id[name] = source["group_by"][name]
+            needs_join = needs_join or source["group_by"][name].startswith("$room.")
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{report.source} reports cannot group by {name}"
+            )
+
+    amount = f"${source['amount_field']}"
+    metrics = {
+        "count": {"$sum": 1},
+        "total_amount": {"$sum": amount},
+        "avg_amount": {"$avg": amount},
+        "min_amount": {"$min": amount},
+        "max_amount": {"$max": amount},
+        **source["metrics"],
+    }
+    group = {"_id": group_id or None}
+    for name in report.metrics:
+        if name not in metrics:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown metric {name} for {report.source} reports"
+            )
+        group[name] = metrics[name]
+
+    if needs_join:
+        if include_archive:
+            pipeline.extend(source["archive_joins"])
+        pipeline.extend(source["joins"])
+    if post_match:
+        pipeline.append({"$match": post_match})
+    pipeline.append({"$group": group})
+    pipeline.append({"$sort": {f"_id.{name}": 1 for name in report.group_by} or {"_id": 1}})
+    return pipeline
+
+class ReportCache:
+    """Recent report results keyed by query, valid while the collection
+    versions they were computed from are current (and at most ttl seconds,
+    which bounds staleness from writes made by other processes).
+
+    Results read from a secondary may lag the versions in their key, so
+    they are kept apart from primary results and only for secondary_ttl.
+    """
+
+    SOURCE_COLLECTIONS = {"sales": ["sales", "bookings", "rooms"], "expenses": ["expenses"],
+                          "bookings": ["bookings", "rooms"]}
+
+    def __init__(self, max_entries: int = 256, ttl: float = 60.0, secondary_ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.secondary_ttl = secondary_ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, report: ReportQuery) -> tuple:
+        versions = collection_versions.get().versions
+        return (
+            current_property.get(),
+            secondary_reads.get(),
+            json.dumps(jsonable_encoder(report), sort_keys=True),
+            tuple(versions[name] for name in self.SOURCE_COLLECTIONS[report.source])
+        )
+
+    def get(self, key: tuple) -> Optional[List[dict]]:
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > (self.secondary_ttl if key[1] else self.ttl):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, rows: List[dict]):
+        self.entries[key] = (time.monotonic(), rows)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+report_cache = ReportCache(
+    max_entries=int(os.environ.get("REPORT_CACHE_ENTRIES", "256")),
+    ttl=float(os.environ.get("REPORT_CACHE_SECONDS", "60")),
+    secondary_ttl=float(os.environ.get("REPORT_CACHE_SECONDARY_SECONDS", "5"))
+)
+
+async def run_report(report: ReportQuery) -> ReportResult:
+    archive_state = await db.archive_state.find_one()
+    pipeline = compile_report(report, archive_state["cutoff"] if archive_state else None)
+    key = report_cache.key(report)
+    rows = report_cache.get(key)
+    cached = rows is not None
+    if rows is None:
+        rows = []
+        async for row in db[report.source].aggregate(pipeline):
+            group_values = row.pop("_id") or {}
+            rows.append({
+                **group_values,
+                **{name: round(value, 2) if isinstance(value, float) else value for name, value in row.items()}
+            })
+        report_cache.put(key, rows)
+    return ReportResult(source=report.source, group_by=report.group_by, metrics=report.metrics,
+                        rows=rows, cached=cached)
+
+# Invoices
+INVOICE_KINDS = ["invoice", "folio"]
+INVOICE_RENDER_BATCH = 25
+
+class InvoiceRenderer:
+    """Renders invoices in a process pool so the event loop never runs them.
+
+    The pool is created on first use and uses spawned workers, which only
+    import the small invoices module.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool = None
+
+    def pool(self):
+        if self._pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def render(self, documents: List[dict]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        batches = [documents[offset:offset + INVOICE_RENDER_BATCH]
+                   for offset in range(0, len(documents), INVOICE_RENDER_BATCH)]
+        rendered = await asyncio.gather(*[
+            loop.run_in_executor(self.pool(), invoices.render_documents, batch) for batch in batches
+        ])
+        return [html for batch in rendered for html in batch]
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+invoice_renderer = InvoiceRenderer(workers=int(os.environ.get("INVOICE_WORKERS", str(os.cpu_count() or 2))))
+
+def invoice_version(booking: dict, folio: dict, settings: Settings) -> str:
+    # Anything printed on the document changes one of these
+    return f"{booking.get('change_version', 0)}-{folio['entry_count']}-{settings.updated_at.isoformat()}"
+
+async def assign_invoice_numbers(booking_ids: List[str]) -> dict:
+    """Invoice numbers for the bookings, allocating new ones in one counter update."""
+    numbers = {
+        invoice["booking_id"]: invoice["number"]
+        for invoice in await db.invoices.find({"booking_id": {"$in": booking_ids}}, {"booking_id": 1, "number": 1}).to_list(None)
+    }
+    missing = [booking_id for booking_id in booking_ids if booking_id not in numbers]
+    if missing:
+        counter = await db.counters.find_one_and_update(
+            {"name": "invoice_number"},
+            {"$inc": {"value": len(missing)}},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        first = counter["value"] - len(missing) + 1
+        for offset, booking_id in enumerate(missing):
+            numbers[booking_id] = f"INV-{first + offset:06d}"
+    return numbers
+
+async def invoice_documents(bookings: List[dict], folios: dict, kind: str, settings: Settings) -> List[dict]:
+    """Plain-dict inputs for invoices.render_document, loaded in batched queries."""
+    booking_ids = [booking["booking_id"] for booking in bookings]
+    rooms = {room["room_id"]: room for room in await db.rooms.find(
+        {"room_id": {"$in": list({booking["room_id"] for booking in bookings})}}).to_list(None)}
+    guests = {guest["guest_id"]: guest for guest in await db.guests.find(
+        {"guest_id": {"$in": list({booking["guest_id"] for booking in bookings})}}).to_list(None)}
+    entries = {}
+    async for entry in db.folio_entries.find({"booking_id": {"$in": booking_ids}}).sort(
+            [("booking_id", 1), ("sequence", 1)]):
+        entries.setdefault(entry["booking_id"], []).append({
+            "sequence": entry["sequence"],
+            "entry_type": entry["entry_type"],
+            "category": entry["category"],
+            "amount": entry["amount"],
+            "payment_method": entry.get("payment_method", ""),
+            "description": entry.get("description", ""),
+            "balance_after": entry["balance_after"],
+            "created_at": entry["created_at"].isoformat()
+        })
+    numbers = await assign_invoice_numbers(booking_ids)
+    documents = []
+    for booking in bookings:
+        room = rooms.get(booking["room_id"])
+        guest = guests.get(booking["guest_id"], {})
+        folio = folios[booking["booking_id"]]
+        documents.append({
+            "kind": kind,
+            "number": numbers[booking["booking_id"]],
+            "settings": {"hotel_name": settings.hotel_name, "currency": settings.currency,
+                         "currency_symbol": settings.currency_symbol},
+            "booking": {"booking_id": booking["booking_id"],
+                        "check_in": to_date(booking["check_in"]).isoformat(),
+                        "check_out": to_date(booking["check_out"]).isoformat()},
+            "guest": {"name": guest.get("name", "Unknown"), "email": guest.get("email", "")},
+            "room_number": room["room_number"] if room else "Unknown",
+            "folio": {name: folio[name] for name in ["charges_total", "payments_total", "balance"]},
+            "entries": entries.get(booking["booking_id"], [])
+        })
+    return documents
+
+async def get_invoices(bookings: List[dict], kind: str) -> tuple:
+    """Rendered documents for the bookings, re-rendering only those whose version changed.
+
+    Returns (html by booking_id, number rendered).
+    """
+    settings = await load_settings()
+    booking_ids = [booking["booking_id"] for booking in bookings]
+    folios = {folio["booking_id"]: folio for folio in await db.folios.find({"booking_id": {"$in": booking_ids}}).to_list(None)}
+    for booking in bookings:
+        if booking["booking_id"] not in folios:
+            folios[booking["booking_id"]] = await ensure_folio(booking)
+    cached = {invoice["booking_id"]: invoice for invoice in await db.invoices.find(
+        {"booking_id": {"$in": booking_ids}, "kind": kind}).to_list(None)}
+
+    html = {}
+    stale = []
+    for booking in bookings:
+        version = invoice_version(booking, folios[booking["booking_id"]], settings)
+        invoice = cached.get(booking["booking_id"])
+        if invoice and invoice["version"] == version:
+            html[booking["booking_id"]] = invoice["html"]
+        else:
+            stale.append((booking, version))
+    if not stale:
+        return html, 0
+
+    documents = await invoice_documents([booking for booking, _ in stale], folios, kind, settings)
+    rendered = await invoice_renderer.render(documents)
+    rendered_at = datetime.utcnow()
+    await asyncio.gather(*[
+        db.invoices.update_one(
+            {"booking_id": booking["booking_id"], "kind": kind},
+            {"$set": {"number": document["number"], "version": version, "html": document_html,
+                      "rendered_at": rendered_at}},
+            upsert=True
+        )
+        for (booking, version), document, document_html in zip(stale, documents, rendered)
+    ])
+    for (booking, _), document_html in zip(stale, rendered):
+        html[booking["booking_id"]] = document_html
+    return html, len(stale)
+
+@job_queue.handler("month_end_invoices")
+async def month_end_invoices_job(payload: dict):
+    """Render invoices for every booking checked out during the month."""
+    start, end = month_bounds(payload["month"])
+    cursor = db.bookings.find({
+        "status": "checked_out",
+        "check_out": {"$gte": start, "$lt": end}
+    }).sort("check_out", 1)
+    total = 0
+    rendered = 0
+    while True:
+        bookings = await cursor.to_list(500)
+        if not bookings:
+            break
+        _, chunk_rendered = await get_invoices(bookings, "invoice")
+        total += len(bookings)
+        rendered += chunk_rendered
+    return {"bookings": total, "rendered": rendered, "reused": total - rendered}
+
+# Channel manager
+# Availability and rates go out to each OTA as deltas against what that
+# channel was last sent, coalesced into date ranges and batched per push.
+# Changes within CHANNEL_PUSH_DELAY seconds share one push job.
+CHANNEL_PUSH_DELAY = float(os.environ.get("CHANNEL_PUSH_DELAY", "30"))
+CHANNEL_HORIZON_DAYS = int(os.environ.get("CHANNEL_HORIZON_DAYS", "365"))
+CHANNEL_BATCH_SIZE = 500
+CHANNEL_TIMEOUT = 30.0
+# Times a reservation is re-placed after concurrent bookings made the room calendar stale
+CHANNEL_PLACEMENT_ATTEMPTS = 3
+
+def ari_deltas(room_code: str, start: date, available: "np.ndarray", rates: "np.ndarray",
+               previous: Optional[dict]) -> List[dict]:
+    """Nights whose availability or rate changed since the previous push, as ranges of equal values."""
+    changed = np.ones(len(available), dtype=bool)
+    if previous:
+        offset = (start - to_date(previous["start"])).days
+        overlap = min(len(available), len(previous["available"]) - offset)
+        if offset >= 0 and overlap > 0:
+            old_available = np.array(previous["available"][offset:offset + overlap])
+            old_rates = np.array(previous["rates"][offset:offset + overlap])
+            changed[:overlap] = (available[:overlap] != old_available) | (np.abs(rates[:overlap] - old_rates) >= 0.005)
+
+    updates = []
+    for night in np.flatnonzero(changed).tolist():
+        values = (int(available[night]), float(rates[night]))
+        last = updates[-1] if updates else None
+        if last and last["end_night"] == night and (last["available"], last["rate"]) == values:
+            last["end_night"] = night + 1
+        else:
+            updates.append({"night": night, "end_night": night + 1, "available": values[0], "rate": values[1]})
+    return [
+        {
+            "room_code": room_code,
+            "start": (start + timedelta(days=update["night"])).isoformat(),
+            "end": (start + timedelta(days=update["end_night"])).isoformat(),
+            "available": update["available"],
+            "rate": update["rate"]
+        }
+        for update in updates
+    ]
+
+async def push_channel(client, channel: dict, start: date, inventory: Dict[str, tuple]) -> dict:
+    """Send one channel the ranges that changed since its last push, then remember what it has."""
+    states = {
+        state["room_type"]: state
+        for state in await db.channel_inventory.find({"channel_id": channel["channel_id"]}).to_list(None)
+    }
+    updates = []
+    for room_type, room_code in channel.get("room_type_codes", {}).items():
+        if room_type in inventory:
+            available, rates = inventory[room_type]
+            updates += ari_deltas(room_code, start, available, rates, states.get(room_type))
+    for offset in range(0, len(updates), CHANNEL_BATCH_SIZE):
+        response = await client.post(
+            f"{channel['endpoint_url'].rstrip('/')}/ari",
+            json={"updates": updates[offset:offset + CHANNEL_BATCH_SIZE]},
+            headers={"Authorization": f"Bearer {channel.get('api_key', '')}"}
+        )
+        response.raise_for_status()
+    for room_type in channel.get("room_type_codes", {}):
+        if room_type in inventory:
+            available, rates = inventory[room_type]
+            await db.channel_inventory.update_one(
+                {"channel_id": channel["channel_id"], "room_type": room_type},
+                {"$set": {
+                    "start": datetime.combine(start, datetime.min.time()),
+                    "available": available.tolist(),
+                    "rates": rates.tolist()
+                }},
+                upsert=True
+            )
+    await db.channels.update_one({"channel_id": channel["channel_id"]}, {"$set": {"last_push_at": datetime.utcnow()}})
+    return {"updates": len(updates), "batches": -(-len(updates) // CHANNEL_BATCH_SIZE)}
+
+class ChannelSync:
+    """Schedules at most one pending ARI push per coalescing window."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.scheduled_until = None
+
+    async def schedule(self):
+        now = datetime.utcnow()
+        if self.scheduled_until is not None and self.scheduled_until > now:
+            return
+        if not await db.channels.count_documents({"active": True}, limit=1):
+            return
+        self.scheduled_until = now + timedelta(seconds=self.delay)
+        await job_queue.enqueue("push_channel_updates", {}, delay=self.delay)
+
+channel_sync = PerProperty(lambda: ChannelSync(CHANNEL_PUSH_DELAY))
+
+@job_queue.handler("push_channel_updates")
+async def push_channel_updates_job(payload: dict):
+    query = {"active": True}
+    if payload.get("channel_id"):
+        query["channel_id"] = payload["channel_id"]
+    channels = await db.channels.find(query).to_list(None)
+    if not channels:
+        return {"channels": {}}
+    await rate_calendar.ensure_fresh()
+    start = datetime.utcnow().date()
+    inventory = rate_calendar.inventory(start, CHANNEL_HORIZON_DAYS)
+    results = {}
+    failures = []
+    async with httpx.AsyncClient(timeout=CHANNEL_TIMEOUT) as client:
+        for channel in channels:
+            try:
+                results[channel["name"]] = await push_channel(client, channel, start, inventory)
+            except Exception as e:
+                failures.append(f"{channel['name']}: {str(e)}")
+    if failures:
+        # Channels that succeeded have nothing left to send when the job is retried
+        raise RuntimeError(f"Channel push failed for {'; '.join(failures)}")
+    return {"channels": results}
+
+@on_booking_change
+async def schedule_channel_push(booking: dict, previous_status: Optional[str]):
+    await channel_sync.schedule()
+
+async def import_channel_reservations(channel: dict, reservations: List[ChannelReservation]) -> ChannelImportResult:
+    """Create, or cancel, the bookings behind a batch of OTA reservations.
+
+    Reservations are keyed by (channel, reservation id), so a redelivered
+    batch is a no-op. The mapping is claimed under its unique index before
+    the booking is created, so of two concurrent deliveries only one books.
+    Rooms are assigned with the waitlist matcher, re-placing a reservation
+    when a concurrent booking made the room calendar stale; a sold
+    reservation that finds no room becomes an overbooked waitlist entry.
+    """
+    result = ChannelImportResult()
+    room_types = {code: room_type for room_type, code in channel.get("room_type_codes", {}).items()}
+    known = {
+        mapping["reservation_id"]: mapping
+        for mapping in await db.channel_reservations.find({
+            "channel_id": channel["channel_id"],
+            "reservation_id": {"$in": [reservation.reservation_id for reservation in reservations]}
+        }).to_list(None)
+    }
+
+    pending = OrderedDict()
+    for reservation in reservations:
+        mapping = known.get(reservation.reservation_id)
+        if reservation.status not in ["confirmed", "cancelled"]:
+            result.rejected.append({"reservation_id": reservation.reservation_id, "reason": "Unsupported status"})
+        elif reservation.status == "cancelled" and reservation.reservation_id in pending:
+            # Booked and cancelled within the same batch; remembered so a redelivery is a no-op
+            del pending[reservation.reservation_id]
+            known[reservation.reservation_id] = {
+                "channel_id": channel["channel_id"],
+                "reservation_id": reservation.reservation_id,
+                "status": "cancelled",
+                "received_at": datetime.utcnow()
+            }
+            try:
+                await db.channel_reservations.insert_one(dict(known[reservation.reservation_id]))
+            except pymongo.errors.DuplicateKeyError:
+                # A concurrent delivery of the same batch got there first
+                result.duplicates += 1
+                continue
+            result.cancelled += 1
+        elif reservation.status == "cancelled":
+            if mapping is None or mapping["status"] == "cancelled":
+                result.duplicates += 1
+                continue
+            if mapping.get("booking_id"):
+                await cancel_channel_booking(mapping["booking_id"])
+            elif mapping.get("waitlist_id"):
+                await db.waitlist.update_one({"waitlist_id": mapping["waitlist_id"]}, {"$set": {"status": "cancelled"}})
+            await db.channel_reservations.update_one({"_id": mapping["_id"]}, {"$set": {"status": "cancelled"}})
+            result.cancelled += 1
+        elif mapping is not None or reservation.reservation_id in pending:
+            result.duplicates += 1
+        elif reservation.room_code not in room_types:
+            result.rejected.append({"reservation_id": reservation.reservation_id, "reason": "Unknown room code"})
+        elif (reservation.check_out - reservation.check_in).days <= 0:
+            result.rejected.append({"reservation_id": reservation.reservation_id, "reason": "Invalid dates"})
+        else:
+            pending[reservation.reservation_id] = reservation
+
+    arrivals = {}
+    for reservation in pending.values():
+        arrivals.setdefault(room_types[reservation.room_code], []).append(reservation)
+
+    today = datetime.utcnow().date()
+    for room_type, stays in arrivals.items():
+        async with waitlist_lock.get():
+            rooms, calendar, movable = await load_room_calendar(room_type, today)
+            for reservation in stays:
+                claim = {"channel_id": channel["channel_id"], "reservation_id": reservation.reservation_id}
+                try:
+                    await db.channel_reservations.insert_one({
+                        **claim, "status": "confirmed", "received_at": datetime.utcnow()
+                    })
+                except pymongo.errors.DuplicateKeyError:
+                    # A concurrent delivery of the same batch is booking it
+                    result.duplicates += 1
+                    continue
+                try:
+                    for _ in range(CHANNEL_PLACEMENT_ATTEMPTS):
+                        placed = await place_channel_reservation(
+                            channel, reservation, room_type, rooms, calendar, movable
+                        )
+                        if placed is not None:
+                            break
+                        # The calendar went stale under a concurrent booking; reload it and retry
+                        rooms, calendar, movable = await load_room_calendar(room_type, today)
+                    if placed is None:
+                        # Still racing other bookings; release the claim so a redelivery books it
+                        await db.channel_reservations.delete_one(claim)
+                        result.rejected.append({
+                            "reservation_id": reservation.reservation_id,
+                            "reason": "Rooms changed during import, please redeliver"
+                        })
+                        continue
+                    if not placed:
+                        placed = await waitlist_channel_reservation(channel, reservation, room_type)
+                        result.overbooked += 1
+                    else:
+                        result.created += 1
+                except Exception:
+                    # Release the claim so a redelivery can book the reservation
+                    await db.channel_reservations.delete_one(claim)
+                    raise
+                recorded = await db.channel_reservations.update_one(
+                    {**claim, "status": "confirmed"}, {"$set": placed}
+                )
+                if recorded.matched_count == 0:
+                    # Cancelled by a concurrent delivery while it was being booked
+                    if placed.get("booking_id"):
+                        await cancel_channel_booking(placed["booking_id"])
+                    else:
+                        await db.waitlist.update_one({"waitlist_id": placed["waitlist_id"]},
+                                                     {"$set": {"status": "cancelled"}})
+    return result
+
+async def place_channel_reservation(channel: dict, reservation: ChannelReservation, room_type: str,
+                                    rooms: dict, calendar: RoomCalendar, movable: set) -> Optional[dict]:
+    """Book a reservation into the room calendar.
+
+    Returns the mapping fields of the booking, {} when no room fits, or
+    None when a concurrent booking made the calendar stale.
+    """
+    guest = await get_or_create_guest(
+        reservation.guest_name, reservation.guest_email, reservation.guest_phone, "", ""
+    )
+    matcher = StayMatcher(calendar, movable)
+    room_id = matcher.place(
+        reservation.reservation_id, day_number(reservation.check_in), day_number(reservation.check_out)
+    ) if rooms else None
+    if room_id is None:
+        return {}
+    booking_obj = None
+    if await apply_room_moves(matcher.moves()):
+        booking_obj = await place_booking(
+            rooms[room_id], guest["guest_id"], reservation.check_in, reservation.check_out,
+            reservation.guests_count, f"{channel['name']} reservation {reservation.reservation_id}",
+            total_amount=reservation.total_amount, payment_method="ota"
+        )
+    if booking_obj is None:
+        return None
+    _, start, end = calendar.remove(reservation.reservation_id)
+    calendar.add(room_id, start, end, booking_obj.booking_id)
+    movable.add(booking_obj.booking_id)
+    return {"booking_id": booking_obj.booking_id}
+
+async def waitlist_channel_reservation(channel: dict, reservation: ChannelReservation, room_type: str) -> dict:
+    guest = await get_or_create_guest(
+        reservation.guest_name, reservation.guest_email, reservation.guest_phone, "", ""
+    )
+    entry_obj = WaitlistEntry(
+        room_type=room_type,
+        guest_id=guest["guest_id"],
+        check_in=reservation.check_in,
+        check_out=reservation.check_out,
+        guests_count=reservation.guests_count,
+        special_requests=f"{channel['name']} reservation {reservation.reservation_id}",
+        overbooked=True
+    )
+    entry = entry_obj.dict()
+    entry["check_in"] = datetime.combine(reservation.check_in, datetime.min.time())
+    entry["check_out"] = datetime.combine(reservation.check_out, datetime.min.time())
+    await db.waitlist.insert_one(entry)
+    return {"waitlist_id": entry_obj.waitlist_id}
+
+async def cancel_channel_booking(booking_id: str):
+    booking = await db.bookings.find_one({"booking_id": booking_id})
+    if not booking or booking["status"] not in ACTIVE_BOOKING_STATUSES:
+        return
+    async with change_versions.stamp() as version:
+        await db.bookings.update_one(
+            {"booking_id": booking_id},
+            {"$set": {"status": "cancelled", "change_version": version}}
+        )
+    updated_booking = await db.bookings.find_one({"booking_id": booking_id})
+    audit_log.record("booking", booking_id, "update_status", None, before=booking, after=updated_booking)
+    await notify_booking_change(updated_booking, booking["status"])
+
+# Archival
+ARCHIVED_BOOKING_STATUSES = ["checked_out", "cancelled", "no_show"]
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_DIR = Path(os.environ.get("ARCHIVE_DIR", str(ROOT_DIR / "archive")))
+
+def archive_cutoff(months: int, today: date) -> datetime:
+    """First day of the month `months` months before today."""
+    month_index = today.year * 12 + today.month - 1 - months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def month_key(value: datetime) -> str:
+    return f"{value.year:04d}-{value.month:02d}"
+
+def month_bounds(month: str):
+    year, month_number = int(month[:4]), int(month[5:])
+    start = datetime(year, month_number, 1)
+    end = datetime(year + month_number // 12, month_number % 12 + 1, 1)
+    return start, end
+
+def export_archive_files(property_id: str, collection: str, documents: List[dict], date_field: str):
+    """Append documents to gzip-compressed monthly NDJSON files."""
+    from bson import json_util
+
+    directory = ARCHIVE_DIR / property_id
+    directory.mkdir(parents=True, exist_ok=True)
+    by_month = {}
+    for document in documents:
+        by_month.setdefault(month_key(document[date_field]), []).append(document)
+    for month, month_documents in by_month.items():
+        with gzip.open(directory / f"{collection}-{month}.ndjson.gz", "at") as archive_file:
+            for document in month_documents:
+                document = {key: value for key, value in document.items() if key != "_id"}
+                archive_file.write(json_util.dumps(document) + "\n")
+
+async def refresh_archive_rollups(months: set):
+    """Recompute monthly rollups from the archive collections (idempotent)."""
+    for month in sorted(months):
+        start, end = month_bounds(month)
+        revenue = 0.0
+        sales_count = 0
+        async for row in db.sales_archive.aggregate([
+            {"$match": {"date": {"$gte": start, "$lt": end}}},
+            {"$group": {"_id": None, "revenue": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+        ]):
+            revenue, sales_count = row["revenue"], row["count"]
+        bookings_count = await db.bookings_archive.count_documents({"check_out": {"$gte": start, "$lt": end}})
+        await db.archive_rollups.update_one(
+            {"month": month},
+            {"$set": {"revenue": revenue, "sales_count": sales_count, "bookings_count": bookings_count}},
+            upsert=True
+        )
+
+@job_queue.handler("archive_bookings")
+async def archive_bookings_job(payload: dict):
+    """Move finished bookings older than the cutoff, and their sales, to archive collections."""
+    cutoff = archive_cutoff(payload["months"], datetime.utcnow().date())
+    property_id = current_property.get()
+    archived_bookings = 0
+    archived_sales = 0
+    months = set()
+    while True:
+        bookings = await db.bookings.find({
+            "status": {"$in": ARCHIVED_BOOKING_STATUSES},
+            "check_out": {"$lt": cutoff}
+        }).sort("check_out", 1).to_list(ARCHIVE_BATCH_SIZE)
+        if not bookings:
+            break
+        booking_ids = [booking["booking_id"] for booking in bookings]
+        sales = await db.sales.find({"booking_id": {"$in": booking_ids}}).to_list(None)
+
+        # Copy first, then delete, so an interrupted batch is only ever duplicated;
+        # a retried job may find part of a batch already archived
+        await insert_ignoring_duplicates("bookings_archive", bookings)
+        await insert_ignoring_duplicates("sales_archive", sales)
+        if payload.get("export_files"):
+            await asyncio.to_thread(export_archive_files, property_id, "bookings", bookings, "check_out")
+            await asyncio.to_thread(export_archive_files, property_id, "sales", sales, "date")
+        await db.sales.delete_many({"booking_id": {"$in": booking_ids}})
+        # Archived bookings leave client caches like deleted ones
+        async with change_versions.stamp() as version:
+            await db.bookings.delete_many({"booking_id": {"$in": booking_ids}})
+            await record_tombstones("bookings", booking_ids, version)
+
+        months.update(month_key(booking["check_out"]) for booking in bookings)
+        months.update(month_key(sale["date"]) for sale in sales)
+        archived_bookings += len(bookings)
+        archived_sales += len(sales)
+
+    await refresh_archive_rollups(months)
+    await db.archive_state.update_one(
+        {},
+        {
+            "$set": {"cutoff": cutoff, "last_run_at": datetime.utcnow()},
+            "$inc": {"archived_bookings": archived_bookings, "archived_sales": archived_sales}
+        },
+        upsert=True
+    )
+    collection_versions.bump("bookings", "sales")
+    booking_store.invalidate()
+    return {"archived_bookings": archived_bookings, "archived_sales": archived_sales, "months": sorted(months)}
+
+async def archived_totals() -> dict:
+    totals = {"revenue": 0.0, "bookings_count": 0}
+    async for row in db.archive_rollups.aggregate([
+        {"$group": {"_id": None, "revenue": {"$sum": "$revenue"}, "bookings_count": {"$sum": "$bookings_count"}}}
+    ]):
+        totals = row
+    return totals
+
+# Auth endpoints
+@api_router.post("/admin/login")
+async def admin_login(admin_data: AdminLogin):
+    try:
+        admin = await db.admins.find_one({"username": admin_data.username})
+        if not admin or not verify_password(admin_data.password, admin["password_hash"]):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid username or password"
+            )
+        
+        token = create_access_token({
+            "admin_id": admin["admin_id"],
+            "username": admin["username"],
+            "property_id": current_property.get()
+        })
+        return {"access_token": token, "token_type": "bearer", "admin_id": admin["admin_id"]}
+    except Exception as e:
+        logger.error(f"Login error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Login failed"
+        )
+
+@api_router.post("/admin/create", response_model=Admin)
+async def create_admin(admin_data: AdminCreate):
+    try:
+        # Check if admin already exists
+        existing_admin = await db.admins.find_one({"username": admin_data.username})
+        if existing_admin:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Admin already exists"
+            )
+        
+        admin_dict = admin_data.dict()
+        admin_dict["password_hash"] = hash_password(admin_data.password)
+        admin_obj = Admin(**admin_dict)
+        await db.admins.insert_one(admin_obj.dict())
+        audit_log.record("admin", admin_obj.admin_id, "create", None, after=admin_obj)
+        return admin_obj
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Create admin error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create admin"
+        )
 
 # Room endpoints
 @api_router.post("/rooms", response_model=Room)
@@ -277,7 +4115,12 @@ async def create_room(room_data: RoomCreate, token_data: dict = Depends(verify_t
         
         room_dict = room_data.dict()
         room_obj = Room(**room_dict)
-        await db.rooms.insert_one(room_obj.dict())
+        async with change_versions.stamp() as version:
+            await db.rooms.insert_one({**room_obj.dict(), "change_version": version})
+        audit_log.record("room", room_obj.room_id, "create", token_data, after=room_obj)
+        rate_calendar.invalidate()
+        await channel_sync.schedule()
+        collection_versions.bump("rooms")
         return room_obj
     except HTTPException:
         raise
@@ -288,11 +4131,14 @@ async def create_room(room_data: RoomCreate, token_data: dict = Depends(verify_t
             detail="Failed to create room"
         )
 
+async def load_rooms() -> List[Room]:
+    rooms = await db.rooms.find().to_list(1000)
+    return [Room(**room) for room in rooms]
+
 @api_router.get("/rooms", response_model=List[Room])
-async def get_rooms():
+async def get_rooms(request: Request):
     try:
-        rooms = await db.rooms.find().to_list(1000)
-        return [Room(**room) for room in rooms]
+        return await cached_json_response(request, ["rooms"], load_rooms)
     except Exception as e:
         logger.error(f"Get rooms error: {str(e)}")
         raise HTTPException(
@@ -324,9 +4170,16 @@ async def update_room(room_id: str, room_data: RoomCreate, token_data: dict = De
             raise HTTPException(status_code=404, detail="Room not found")
         
         update_dict = room_data.dict()
-        await db.rooms.update_one({"room_id": room_id}, {"$set": update_dict})
+        async with change_versions.stamp() as version:
+            await db.rooms.update_one({"room_id": room_id}, {"$set": {**update_dict, "change_version": version}})
+            # Synced bookings embed the room number and type
+            await db.bookings.update_many({"room_id": room_id}, {"$set": {"change_version": version}})
+        rate_calendar.invalidate()
+        await channel_sync.schedule()
+        collection_versions.bump("rooms")
         
         updated_room = await db.rooms.find_one({"room_id": room_id})
+        audit_log.record("room", room_id, "update", token_data, before=room, after=updated_room)
         return Room(**updated_room)
     except HTTPException:
         raise
@@ -344,7 +4197,13 @@ async def delete_room(room_id: str, token_data: dict = Depends(verify_token)):
         if not room:
             raise HTTPException(status_code=404, detail="Room not found")
         
-        await db.rooms.delete_one({"room_id": room_id})
+        async with change_versions.stamp() as version:
+            await db.rooms.delete_one({"room_id": room_id})
+            await record_tombstones("rooms", [room_id], version)
+        audit_log.record("room", room_id, "delete", token_data, before=room)
+        rate_calendar.invalidate()
+        await channel_sync.schedule()
+        collection_versions.bump("rooms")
         return {"message": "Room deleted successfully"}
     except HTTPException:
         raise
@@ -361,7 +4220,9 @@ async def create_guest(guest_data: GuestCreate):
     try:
         guest_dict = guest_data.dict()
         guest_obj = Guest(**guest_dict)
-        await db.guests.insert_one(guest_obj.dict())
+        async with change_versions.stamp() as version:
+            await db.guests.insert_one({**guest_obj.dict(), "change_version": version})
+        audit_log.record("guest", guest_obj.guest_id, "create", None, after=guest_obj)
         return guest_obj
     except Exception as e:
         logger.error(f"Create guest error: {str(e)}")
@@ -398,6 +4259,43 @@ async def get_guest(guest_id: str):
             detail="Failed to retrieve guest"
         )
 
+@api_router.get("/guests/{guest_id}/profile", response_model=GuestProfile)
+async def get_guest_profile(guest_id: str, token_data: dict = Depends(verify_token)):
+    try:
+        profile = await db.guest_profiles.find_one({"guest_id": guest_id})
+        if not profile:
+            if not await db.guests.find_one({"guest_id": guest_id}, {"_id": 1}):
+                raise HTTPException(status_code=404, detail="Guest not found")
+            return GuestProfile(guest_id=guest_id)
+        room_type_nights = profile.get("room_type_nights", {})
+        return GuestProfile(**{
+            **profile,
+            "total_spend": round(profile.get("total_spend", 0.0), 2),
+            "last_stay": to_date(profile["last_stay"]) if profile.get("last_stay") else None,
+            "preferred_room_type": max(room_type_nights, key=room_type_nights.get) if room_type_nights else None
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get guest profile error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve guest profile"
+        )
+
+@api_router.post("/guests/profiles/rebuild", response_model=Job)
+async def rebuild_guest_profiles(token_data: dict = Depends(verify_token)):
+    try:
+        job = await job_queue.enqueue("rebuild_guest_profiles", {}, max_attempts=3)
+        audit_log.record("guest_profiles", "all", "rebuild", token_data, after={"job_id": job.job_id})
+        return job
+    except Exception as e:
+        logger.error(f"Rebuild guest profiles error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to start guest profile rebuild"
+        )
+
 # Booking endpoints
 @api_router.post("/bookings", response_model=Booking)
 async def create_booking(booking_data: BookingCreate):
@@ -408,20 +4306,10 @@ async def create_booking(booking_data: BookingCreate):
             raise HTTPException(status_code=404, detail="Room not found")
         
         # Check if guest exists by email, if not create new guest
-        guest = await db.guests.find_one({"email": booking_data.guest_email})
-        if not guest:
-            # Create new guest
-            guest_data = {
-                "guest_id": str(uuid.uuid4()),
-                "name": booking_data.guest_name,
-                "email": booking_data.guest_email,
-                "phone": booking_data.guest_phone,
-                "address": booking_data.guest_address,
-                "id_proof": booking_data.guest_id_proof,
-                "created_at": datetime.utcnow()
-            }
-            await db.guests.insert_one(guest_data)
-            guest = guest_data
+        guest = await get_or_create_guest(
+            booking_data.guest_name, booking_data.guest_email, booking_data.guest_phone,
+            booking_data.guest_address, booking_data.guest_id_proof
+        )
         
         # Convert date objects to datetime objects for MongoDB compatibility
         check_in_datetime = datetime.combine(booking_data.check_in, datetime.min.time())
@@ -433,13 +4321,24 @@ async def create_booking(booking_data: BookingCreate):
             "status": {"$in": ["confirmed", "checked_in"]},
             "$or": [
                 {
-                    "check_in": {"$lte": check_out_datetime}, 
-                    "check_out": {"$gte": check_in_datetime}
+                    "check_in": {"$lt": check_out_datetime}, 
+                    "check_out": {"$gt": check_in_datetime}
                 }
             ]
         }).to_list(1000)
         
         if conflicting_bookings:
+            if booking_data.join_waitlist and booking_data.check_out > booking_data.check_in:
+                entry_obj = await join_waitlist(WaitlistEntry(
+                    room_type=room["room_type"],
+                    guest_id=guest["guest_id"],
+                    check_in=booking_data.check_in,
+                    check_out=booking_data.check_out,
+                    guests_count=booking_data.guests_count,
+                    special_requests=booking_data.special_requests,
+                    advance_payment=booking_data.advance_payment
+                ))
+                return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(entry_obj))
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Room is not available for the selected dates"
@@ -453,54 +4352,151 @@ async def create_booking(booking_data: BookingCreate):
                 detail="Check-out date must be after check-in date"
             )
         
-        total_amount = days * room["price_per_night"]
-        
-        # Create booking
-        booking_dict = {
-            "booking_id": str(uuid.uuid4()),
-            "room_id": booking_data.room_id,
-            "guest_id": guest["guest_id"],
-            "check_in": booking_data.check_in,
-            "check_out": booking_data.check_out,
-            "total_amount": total_amount,
-            "advance_payment": booking_data.advance_payment,
-            "status": "confirmed",
-            "guests_count": booking_data.guests_count,
-            "special_requests": booking_data.special_requests,
-            "created_at": datetime.utcnow()
-        }
+        booking_obj = await place_booking(
+            room, guest["guest_id"], booking_data.check_in, booking_data.check_out,
+            booking_data.guests_count, booking_data.special_requests, booking_data.advance_payment
+        )
+        # Lose gracefully to a concurrent booking of the same room
+        if booking_obj is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Room is not available for the selected dates"
+            )
         
-        booking_obj = Booking(**booking_dict)
+        return booking_obj
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Create booking error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create booking"
+        )
+
+@api_router.post("/booking-groups", response_model=BookingGroup)
+async def create_booking_group(group_data: GroupBookingCreate):
+    try:
+        if (group_data.check_out - group_data.check_in).days <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Check-out date must be after check-in date"
+            )
+        counts = {room_type: count for room_type, count in group_data.rooms.items() if count > 0}
+        if not counts or any(count < 0 for count in group_data.rooms.values()):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Request at least one room"
+            )
         
-        # Convert date objects to datetime objects before saving to MongoDB
-        booking_dict_for_db = booking_obj.dict()
-        booking_dict_for_db["check_in"] = check_in_datetime
-        booking_dict_for_db["check_out"] = check_out_datetime
+        check_in_datetime = datetime.combine(group_data.check_in, datetime.min.time())
+        check_out_datetime = datetime.combine(group_data.check_out, datetime.min.time())
         
-        await db.bookings.insert_one(booking_dict_for_db)
+        free_rooms = await load_free_rooms(list(counts), check_in_datetime, check_out_datetime)
+        rooms = allocate_rooms(free_rooms, counts)
+        if rooms is None:
+            shortages = {
+                room_type: count - len(free_rooms[room_type])
+                for room_type, count in counts.items() if len(free_rooms[room_type]) < count
+            }
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Not enough rooms available: short by {shortages}"
+            )
         
-        # Create sale record
-        sale_obj = Sale(
-            booking_id=booking_obj.booking_id,
-            amount=total_amount,
-            payment_method="cash",
-            date=booking_data.check_in
+        guest = await get_or_create_guest(
+            group_data.guest_name, group_data.guest_email, group_data.guest_phone,
+            group_data.guest_address, group_data.guest_id_proof
         )
+        group_id = str(uuid.uuid4())
+        bookings = []
+        for room in rooms:
+            total_amount = await rate_calendar.stay_price(room, group_data.check_in, group_data.check_out)
+            booking = Booking(
+                room_id=room["room_id"],
+                guest_id=guest["guest_id"],
+                check_in=group_data.check_in,
+                check_out=group_data.check_out,
+                total_amount=total_amount,
+                guests_count=group_data.guests_per_room,
+                special_requests=group_data.special_requests,
+                group_id=group_id
+            ).dict()
+            booking["check_in"] = check_in_datetime
+            booking["check_out"] = check_out_datetime
+            bookings.append(booking)
         
-        # Convert date object to datetime object before saving to MongoDB
-        sale_dict_for_db = sale_obj.dict()
-        sale_dict_for_db["date"] = datetime.combine(sale_obj.date, datetime.min.time())
+        # All rooms or none: a conflict on any night releases every claim
+        if not await claim_room_nights(bookings):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Rooms were booked by another request, please retry"
+            )
+        booking_ids = [booking["booking_id"] for booking in bookings]
+        async with change_versions.stamp() as version:
+            try:
+                for booking in bookings:
+                    booking["change_version"] = version
+                await db.bookings.insert_many(bookings)
+            except Exception:
+                await db.bookings.delete_many({"booking_id": {"$in": booking_ids}})
+                await record_tombstones("bookings", booking_ids, version)
+                await release_room_nights(booking_ids)
+                raise
         
-        await db.sales.insert_one(sale_dict_for_db)
+        group = BookingGroup(
+            group_id=group_id,
+            group_name=group_data.group_name,
+            guest_id=guest["guest_id"],
+            check_in=group_data.check_in,
+            check_out=group_data.check_out,
+            booking_ids=booking_ids,
+            room_ids=[room["room_id"] for room in rooms],
+            total_amount=sum(booking["total_amount"] for booking in bookings)
+        )
+        group_for_db = group.dict()
+        group_for_db["check_in"] = check_in_datetime
+        group_for_db["check_out"] = check_out_datetime
+        await db.booking_groups.insert_one(group_for_db)
+        audit_log.record("booking_group", group_id, "create", None, after=group_for_db)
+        for booking in bookings:
+            audit_log.record("booking", booking["booking_id"], "create", None, after=booking)
         
-        return booking_obj
+        for booking in bookings:
+            await notify_booking_change(booking, None)
+            await ensure_folio(booking)
+        await job_queue.enqueue("record_sales", {
+            "sales": [
+                sale_document(booking["booking_id"], booking["total_amount"], "cash", group_data.check_in, "room")
+                for booking in bookings
+            ]
+        })
+        
+        return group
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Create booking error: {str(e)}")
+        logger.error(f"Create booking group error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to create booking"
+            detail="Failed to create booking group"
+        )
+
+@api_router.get("/booking-groups/{group_id}", response_model=BookingGroup)
+async def get_booking_group(group_id: str, token_data: dict = Depends(verify_token)):
+    try:
+        group = await db.booking_groups.find_one({"group_id": group_id})
+        if not group:
+            raise HTTPException(status_code=404, detail="Booking group not found")
+        group["check_in"] = group["check_in"].date()
+        group["check_out"] = group["check_out"].date()
+        return BookingGroup(**group)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get booking group error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve booking group"
         )
 
 @api_router.get("/bookings", response_model=List[BookingWithDetails])
@@ -552,6 +4548,8 @@ async def get_bookings():
 async def get_booking(booking_id: str):
     try:
         booking = await db.bookings.find_one({"booking_id": booking_id})
+        if not booking:
+            booking = await db.bookings_archive.find_one({"booking_id": booking_id})
         if not booking:
             raise HTTPException(status_code=404, detail="Booking not found")
         
@@ -577,6 +4575,7 @@ async def get_booking(booking_id: str):
             check_in=check_in,
             check_out=check_out,
             total_amount=booking["total_amount"],
+            advance_payment=booking.get("advance_payment", 0.0),
             status=booking["status"],
             guests_count=booking["guests_count"],
             special_requests=booking.get("special_requests", ""),
@@ -598,77 +4597,92 @@ async def update_booking_status(booking_id: str, status_update: BookingStatusUpd
         if not booking:
             raise HTTPException(status_code=404, detail="Booking not found")
         
-        if status_update.status not in ["confirmed", "cancelled", "checked_in", "checked_out"]:
+        if status_update.status not in ["confirmed", "cancelled", "checked_in", "checked_out", "no_show"]:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid booking status"
             )
         
+        # Bookings created before the ledger get their folio opened first
+        await ensure_folio(booking)
+        
+        # A cancelled or finished booking that becomes active again needs its nights back
+        reclaimed = (booking["status"] not in ACTIVE_BOOKING_STATUSES
+                     and status_update.status in ACTIVE_BOOKING_STATUSES)
+        if reclaimed and not await claim_room_nights([booking]):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Room is no longer available for the booked dates"
+            )
+        
         # Update booking status and advance payment if checking in
         update_data = {"status": status_update.status}
+        advance = 0.0
         if status_update.status == "checked_in" and status_update.advance_payment_received > 0:
-            current_advance = booking.get("advance_payment", 0.0)
-            update_data["advance_payment"] = current_advance + status_update.advance_payment_received
+            advance = status_update.advance_payment_received
         
-        await db.bookings.update_one(
-            {"booking_id": booking_id},
-            {"$set": update_data}
-        )
+        # Conditional on the status read above, so hooks see the true previous status
+        async with change_versions.stamp() as version:
+            update_data["change_version"] = version
+            updated_booking = await db.bookings.find_one_and_update(
+                {"booking_id": booking_id, "status": booking["status"]},
+                {"$set": update_data, "$inc": {"advance_payment": advance}},
+                return_document=pymongo.ReturnDocument.AFTER
+            )
+        if updated_booking is None:
+            if reclaimed:
+                await release_room_nights([booking_id])
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Booking was updated by another request, please retry"
+            )
         
-        # Get updated booking for calculations
-        updated_booking = await db.bookings.find_one({"booking_id": booking_id})
+        audit_log.record("booking", booking_id, "update_status", token_data, before=booking, after=updated_booking)
+        await notify_booking_change(updated_booking, booking["status"])
         
-        # Calculate payment balance
-        room_charges = updated_booking["total_amount"]
-        additional_charges = status_update.additional_charges
-        total_amount = room_charges + additional_charges
-        total_advance_paid = updated_booking.get("advance_payment", 0.0)
+        sales = []
+        folio = None
         
         # Add advance payment received during check-in
         if status_update.status == "checked_in" and status_update.advance_payment_received > 0:
-            # Create advance payment sale record
-            advance_sale = Sale(
-                booking_id=booking_id,
-                amount=status_update.advance_payment_received,
-                payment_method=status_update.payment_method,
-                date=datetime.utcnow().date()
+            folio = await post_folio_entry(
+                booking_id, "payment", "advance", status_update.advance_payment_received,
+                payment_method=status_update.payment_method, description="Advance payment at check-in"
             )
-            
-            sale_dict_for_db = advance_sale.dict()
-            sale_dict_for_db["date"] = datetime.combine(advance_sale.date, datetime.min.time())
-            await db.sales.insert_one(sale_dict_for_db)
-        
-        # If there are additional charges, create a new sale record
-        if additional_charges > 0:
-            additional_sale = Sale(
-                booking_id=booking_id,
-                amount=additional_charges,
-                payment_method=status_update.payment_method,
-                date=datetime.utcnow().date()
+            sales.append(sale_document(
+                booking_id, status_update.advance_payment_received,
+                status_update.payment_method, datetime.utcnow().date(), "advance"
+            ))
+        
+        # If there are additional charges, post them and create a new sale record
+        if status_update.additional_charges > 0:
+            folio = await post_folio_entry(
+                booking_id, "charge", "additional", status_update.additional_charges,
+                payment_method=status_update.payment_method, description=status_update.notes
             )
-            
-            sale_dict_for_db = additional_sale.dict()
-            sale_dict_for_db["date"] = datetime.combine(additional_sale.date, datetime.min.time())
-            await db.sales.insert_one(sale_dict_for_db)
+            sales.append(sale_document(
+                booking_id, status_update.additional_charges,
+                status_update.payment_method, datetime.utcnow().date(), "additional"
+            ))
+        
+        # Payment taken at check-out; without one the balance stays open
+        if status_update.status == "checked_out" and status_update.payment_received > 0:
+            folio = await post_folio_entry(
+                booking_id, "payment", "settlement", status_update.payment_received,
+                payment_method=status_update.payment_method, description="Payment at check-out"
+            )
+            sales.append(sale_document(
+                booking_id, status_update.payment_received,
+                status_update.payment_method, datetime.utcnow().date(), "settlement"
+            ))
         
-        # Calculate final balance
-        balance_due = total_amount - total_advance_paid
-        if status_update.status == "checked_out":
-            balance_due = 0.0
-            total_advance_paid = total_amount
+        if sales:
+            await job_queue.enqueue("record_sales", {"sales": sales})
         
-        # Prepare payment balance response
-        payment_balance = PaymentBalance(
-            booking_id=booking_id,
-            room_charges=room_charges,
-            additional_charges=additional_charges,
-            total_amount=total_amount,
-            paid_amount=total_advance_paid,
-            balance_due=balance_due,
-            payment_status="paid" if balance_due == 0 else "pending"
-        )
+        if folio is None:
+            folio = await db.folios.find_one({"booking_id": booking_id})
         
-        return payment_balance
+        return payment_balance(folio)
     except HTTPException:
         raise
     except Exception as e:
@@ -678,6 +4692,69 @@ async def update_booking_status(booking_id: str, status_update: BookingStatusUpd
             detail="Failed to update booking status"
         )
 
+@api_router.get("/bookings/{booking_id}/folio", response_model=Folio)
+async def get_folio(booking_id: str, token_data: dict = Depends(verify_token)):
+    try:
+        booking = await db.bookings.find_one({"booking_id": booking_id})
+        if not booking:
+            raise HTTPException(status_code=404, detail="Booking not found")
+        return Folio(**await ensure_folio(booking))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get folio error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve folio"
+        )
+
+@api_router.get("/bookings/{booking_id}/folio/entries", response_model=List[FolioEntry])
+async def get_folio_entries(booking_id: str, from_sequence: int = 1, to_sequence: Optional[int] = None,
+                            limit: int = 100, token_data: dict = Depends(verify_token)):
+    try:
+        sequence_range = {"$gte": from_sequence}
+        if to_sequence is not None:
+            sequence_range["$lte"] = to_sequence
+        entries = await db.folio_entries.find(
+            {"booking_id": booking_id, "sequence": sequence_range}
+        ).sort("sequence", 1).to_list(min(limit, 1000))
+        return [FolioEntry(**entry) for entry in entries]
+    except Exception as e:
+        logger.error(f"Get folio entries error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve folio entries"
+        )
+
+@api_router.post("/bookings/{booking_id}/folio/entries", response_model=PaymentBalance)
+async def create_folio_entry(booking_id: str, entry_data: FolioEntryCreate, token_data: dict = Depends(verify_token)):
+    try:
+        booking = await db.bookings.find_one({"booking_id": booking_id})
+        if not booking:
+            raise HTTPException(status_code=404, detail="Booking not found")
+        
+        if entry_data.entry_type not in FOLIO_ENTRY_TYPES or entry_data.amount <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Folio entries must be a positive charge or payment"
+            )
+        
+        await ensure_folio(booking)
+        folio = await post_folio_entry(
+            booking_id, entry_data.entry_type, entry_data.category, entry_data.amount,
+            payment_method=entry_data.payment_method, description=entry_data.description
+        )
+        audit_log.record("folio", booking_id, "post_entry", token_data, after=entry_data)
+        return payment_balance(folio)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Create folio entry error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create folio entry"
+        )
+
 @api_router.post("/rooms/availability", response_model=List[Room])
 async def check_room_availability(availability_data: AvailabilityCheck):
     try:
@@ -686,6 +4763,14 @@ async def check_room_availability(availability_data: AvailabilityCheck):
         if availability_data.room_type:
             rooms_query["room_type"] = availability_data.room_type
         
+        # Repeated searches are answered from the memo until a booking touches their dates
+        memo = availability_memo.get()
+        key = (availability_data.check_in, availability_data.check_out, availability_data.room_type)
+        cached = memo.get(key)
+        if cached is not None:
+            return cached
+        generation = memo.generation
+        
         rooms = await db.rooms.find(rooms_query).to_list(1000)
         available_rooms = []
         
@@ -700,8 +4785,8 @@ async def check_room_availability(availability_data: AvailabilityCheck):
                 "status": {"$in": ["confirmed", "checked_in"]},
                 "$or": [
                     {
-                        "check_in": {"$lte": check_out_datetime}, 
-                        "check_out": {"$gte": check_in_datetime}
+                        "check_in": {"$lt": check_out_datetime}, 
+                        "check_out": {"$gt": check_in_datetime}
                     }
                 ]
             }).to_list(1000)
@@ -709,6 +4794,7 @@ async def check_room_availability(availability_data: AvailabilityCheck):
             if not conflicting_bookings:
                 available_rooms.append(Room(**room))
         
+        memo.put(key, available_rooms, generation)
         return available_rooms
     except Exception as e:
         logger.error(f"Check room availability error: {str(e)}")
@@ -717,6 +4803,121 @@ async def check_room_availability(availability_data: AvailabilityCheck):
             detail="Failed to check room availability"
         )
 
+# Rate endpoints
+@api_router.post("/rates/quote", response_model=List[RoomTypeQuote])
+async def quote_rates(quote_data: RateQuoteRequest):
+    try:
+        if quote_data.check_out <= quote_data.check_in:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Check-out date must be after check-in date"
+            )
+        return await rate_calendar.quote(quote_data.check_in, quote_data.check_out)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Quote rates error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to quote rates"
+        )
+
+def rate_rule_document(rule_obj: RateRule) -> dict:
+    # Convert date objects to datetime objects for MongoDB compatibility
+    rule_dict_for_db = rule_obj.dict()
+    for field in ("start_date", "end_date"):
+        if rule_dict_for_db[field] is not None:
+            rule_dict_for_db[field] = datetime.combine(rule_dict_for_db[field], datetime.min.time())
+    return rule_dict_for_db
+
+def validate_rate_rule(rule_data: RateRuleCreate):
+    if rule_data.rule_type not in RATE_RULE_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid rate rule type"
+        )
+    if rule_data.multiplier <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Rate multiplier must be positive"
+        )
+
+@api_router.post("/rates/rules", response_model=RateRule)
+async def create_rate_rule(rule_data: RateRuleCreate, token_data: dict = Depends(verify_token)):
+    try:
+        validate_rate_rule(rule_data)
+        rule_obj = RateRule(**rule_data.dict())
+        await db.rate_rules.insert_one(rate_rule_document(rule_obj))
+        audit_log.record("rate_rule", rule_obj.rule_id, "create", token_data, after=rule_obj)
+        rate_calendar.invalidate()
+        await channel_sync.schedule()
+        return rule_obj
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Create rate rule error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create rate rule"
+        )
+
+@api_router.get("/rates/rules", response_model=List[RateRule])
+async def get_rate_rules():
+    try:
+        rules = await db.rate_rules.find().to_list(1000)
+        return [
+            RateRule(**{**rule, "start_date": to_date(rule["start_date"]), "end_date": to_date(rule["end_date"])})
+            for rule in rules
+        ]
+    except Exception as e:
+        logger.error(f"Get rate rules error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve rate rules"
+        )
+
+@api_router.put("/rates/rules/{rule_id}", response_model=RateRule)
+async def update_rate_rule(rule_id: str, rule_data: RateRuleCreate, token_data: dict = Depends(verify_token)):
+    try:
+        rule = await db.rate_rules.find_one({"rule_id": rule_id})
+        if not rule:
+            raise HTTPException(status_code=404, detail="Rate rule not found")
+        
+        validate_rate_rule(rule_data)
+        rule_obj = RateRule(**rule_data.dict(), rule_id=rule_id, created_at=rule["created_at"])
+        await db.rate_rules.update_one({"rule_id": rule_id}, {"$set": rate_rule_document(rule_obj)})
+        audit_log.record("rate_rule", rule_id, "update", token_data, before=rule, after=rule_obj)
+        rate_calendar.invalidate()
+        await channel_sync.schedule()
+        return rule_obj
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Update rate rule error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update rate rule"
+        )
+
+@api_router.delete("/rates/rules/{rule_id}")
+async def delete_rate_rule(rule_id: str, token_data: dict = Depends(verify_token)):
+    try:
+        rule = await db.rate_rules.find_one_and_delete({"rule_id": rule_id})
+        if not rule:
+            raise HTTPException(status_code=404, detail="Rate rule not found")
+        audit_log.record("rate_rule", rule_id, "delete", token_data, before=rule)
+        rate_calendar.invalidate()
+        await channel_sync.schedule()
+        return {"message": "Rate rule deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Delete rate rule error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete rate rule"
+        )
+
 # Expense endpoints
 @api_router.post("/expenses", response_model=Expense)
 async def create_expense(expense_data: ExpenseCreate, token_data: dict = Depends(verify_token)):
@@ -732,6 +4933,8 @@ async def create_expense(expense_data: ExpenseCreate, token_data: dict = Depends
         expense_dict_for_db["date"] = datetime.combine(expense_data.date, datetime.min.time())
         
         await db.expenses.insert_one(expense_dict_for_db)
+        collection_versions.bump("expenses")
+        audit_log.record("expense", expense_obj.expense_id, "create", token_data, after=expense_dict_for_db)
         
         return expense_obj
     except Exception as e:
@@ -774,9 +4977,20 @@ async def get_expenses():
 
 # Sales endpoints
 @api_router.get("/sales", response_model=List[Sale])
-async def get_sales():
+async def get_sales(start_date: Optional[date] = None, end_date: Optional[date] = None):
     try:
-        sales = await db.sales.find().to_list(1000)
+        query = {}
+        if start_date:
+            query.setdefault("date", {})["$gte"] = datetime.combine(start_date, datetime.min.time())
+        if end_date:
+            query.setdefault("date", {})["$lte"] = datetime.combine(end_date, datetime.min.time())
+        sales = await db.sales.find(query).to_list(1000)
+        
+        # Sales before the archive cutoff may have moved to the archive
+        archive_state = await db.archive_state.find_one()
+        if archive_state and (start_date is None or
+                              datetime.combine(start_date, datetime.min.time()) < archive_state["cutoff"]):
+            sales += await db.sales_archive.find(query).to_list(max(0, 1000 - len(sales)))
         sale_list = []
         
         for sale in sales:
@@ -791,6 +5005,7 @@ async def get_sales():
                 amount=sale["amount"],
                 payment_method=sale["payment_method"],
                 date=sale_date,
+                kind=sale.get("kind", "room"),
                 created_at=sale["created_at"]
             )
             sale_list.append(sale_obj)
@@ -805,16 +5020,19 @@ async def get_sales():
 
 # Dashboard endpoints
 # Settings endpoints
+async def load_settings() -> Settings:
+    settings = await db.settings.find_one()
+    if not settings:
+        # Create default settings
+        default_settings = Settings()
+        await db.settings.insert_one(default_settings.dict())
+        return default_settings
+    return Settings(**settings)
+
 @api_router.get("/settings", response_model=Settings)
-async def get_settings():
+async def get_settings(request: Request):
     try:
-        settings = await db.settings.find_one()
-        if not settings:
-            # Create default settings
-            default_settings = Settings()
-            await db.settings.insert_one(default_settings.dict())
-            return default_settings
-        return Settings(**settings)
+        return await cached_json_response(request, ["settings"], load_settings)
     except Exception as e:
         logger.error(f"Get settings error: {str(e)}")
         raise HTTPException(
@@ -832,11 +5050,16 @@ async def update_settings(settings_data: SettingsUpdate, token_data: dict = Depe
         existing_settings = await db.settings.find_one()
         if existing_settings:
             await db.settings.update_one({}, {"$set": settings_dict})
+            collection_versions.bump("settings")
             updated_settings = await db.settings.find_one()
+            audit_log.record("settings", updated_settings.get("setting_id", ""), "update", token_data,
+                             before=existing_settings, after=updated_settings)
             return Settings(**updated_settings)
         else:
             new_settings = Settings(**settings_dict)
             await db.settings.insert_one(new_settings.dict())
+            collection_versions.bump("settings")
+            audit_log.record("settings", new_settings.setting_id, "create", token_data, after=new_settings)
             return new_settings
     except Exception as e:
         logger.error(f"Update settings error: {str(e)}")
@@ -850,55 +5073,63 @@ class RoomStatus(BaseModel):
     room_number: str
     room_type: str
     status: str
+    housekeeping_status: str = "available"
     guest_name: str = ""
     check_out_date: Optional[date] = None
 
-@api_router.get("/dashboard/room-status", response_model=List[RoomStatus])
-async def get_room_status():
-    try:
-        rooms = await db.rooms.find().sort("room_number", 1).to_list(1000)
-        room_statuses = []
+async def load_room_status() -> List[RoomStatus]:
+    rooms = await db.rooms.find().sort("room_number", 1).to_list(1000)
+    room_statuses = []
+    
+    for room in rooms:
+        room_status = RoomStatus(
+            room_id=room["room_id"],
+            room_number=room["room_number"],
+            room_type=room["room_type"],
+            status="available",
+            housekeeping_status=room.get("status", "available")
+        )
         
-        for room in rooms:
-            room_status = RoomStatus(
-                room_id=room["room_id"],
-                room_number=room["room_number"],
-                room_type=room["room_type"],
-                status="available"
-            )
-            
-            # Check if room is currently occupied
-            current_date = datetime.utcnow().date()
-            current_booking = await db.bookings.find_one({
+        # Check if room is currently occupied
+        current_date = datetime.utcnow().date()
+        current_booking = await db.bookings.find_one({
+            "room_id": room["room_id"],
+            "status": "checked_in",
+            "check_in": {"$lte": datetime.combine(current_date, datetime.min.time())},
+            "check_out": {"$gte": datetime.combine(current_date, datetime.min.time())}
+        })
+        
+        if current_booking:
+            guest = await db.guests.find_one({"guest_id": current_booking["guest_id"]})
+            room_status.status = "occupied"
+            room_status.guest_name = guest["name"] if guest else "Unknown"
+            # Convert datetime back to date if needed
+            check_out = current_booking["check_out"]
+            if isinstance(check_out, datetime):
+                check_out = check_out.date()
+            room_status.check_out_date = check_out
+        else:
+            # Check if room has upcoming booking
+            upcoming_booking = await db.bookings.find_one({
                 "room_id": room["room_id"],
-                "status": "checked_in",
-                "check_in": {"$lte": datetime.combine(current_date, datetime.min.time())},
-                "check_out": {"$gte": datetime.combine(current_date, datetime.min.time())}
+                "status": "confirmed",
+                "check_in": {"$gte": datetime.combine(current_date, datetime.min.time())}
             })
             
-            if current_booking:
-                guest = await db.guests.find_one({"guest_id": current_booking["guest_id"]})
-                room_status.status = "occupied"
-                room_status.guest_name = guest["name"] if guest else "Unknown"
-                # Convert datetime back to date if needed
-                check_out = current_booking["check_out"]
-                if isinstance(check_out, datetime):
-                    check_out = check_out.date()
-                room_status.check_out_date = check_out
-            else:
-                # Check if room has upcoming booking
-                upcoming_booking = await db.bookings.find_one({
-                    "room_id": room["room_id"],
-                    "status": "confirmed",
-                    "check_in": {"$gte": datetime.combine(current_date, datetime.min.time())}
-                })
-                
-                if upcoming_booking:
-                    room_status.status = "reserved"
-            
-            room_statuses.append(room_status)
+            if upcoming_booking:
+                room_status.status = "reserved"
         
-        return room_statuses
+        room_statuses.append(room_status)
+    
+    return room_statuses
+
+@api_router.get("/dashboard/room-status", response_model=List[RoomStatus])
+async def get_room_status(request: Request):
+    try:
+        # Statuses depend on today's date as well as rooms and bookings
+        return await cached_json_response(
+            request, ["rooms", "bookings"], load_room_status, extra=datetime.utcnow().date().isoformat()
+        )
     except Exception as e:
         logger.error(f"Get room status error: {str(e)}")
         raise HTTPException(
@@ -922,16 +5153,21 @@ async def get_dashboard_stats():
         })
         available_rooms = total_rooms - occupied_rooms
         
+        # Archived bookings and sales are counted through their monthly rollups
+        archived = await archived_totals()
+        
         # Get booking statistics
-        total_bookings = await db.bookings.count_documents({})
+        total_bookings = await db.bookings.count_documents({}) + archived["bookings_count"]
         
         # Get revenue statistics
-        sales = await db.sales.find().to_list(1000)
-        total_revenue = sum(sale["amount"] for sale in sales)
+        total_revenue = archived["revenue"]
+        async for row in db.sales.aggregate([{"$group": {"_id": None, "total": {"$sum": "$amount"}}}]):
+            total_revenue += row["total"]
         
         # Get expense statistics
-        expenses = await db.expenses.find().to_list(1000)
-        total_expenses = sum(expense["amount"] for expense in expenses)
+        total_expenses = 0.0
+        async for row in db.expenses.aggregate([{"$group": {"_id": None, "total": {"$sum": "$amount"}}}]):
+            total_expenses = row["total"]
         
         # Calculate net profit
         net_profit = total_revenue - total_expenses
@@ -956,6 +5192,573 @@ async def get_dashboard_stats():
             detail="Failed to retrieve dashboard statistics"
         )
 
+# Sync endpoints
+async def booking_details(bookings: List[dict]) -> List[BookingWithDetails]:
+    """Join bookings with their rooms and guests in two queries."""
+    room_ids = list({booking["room_id"] for booking in bookings})
+    guest_ids = list({booking["guest_id"] for booking in bookings})
+    rooms = {room["room_id"]: room for room in await db.rooms.find({"room_id": {"$in": room_ids}}).to_list(None)}
+    guests = {guest["guest_id"]: guest for guest in await db.guests.find({"guest_id": {"$in": guest_ids}}).to_list(None)}
+    details = []
+    for booking in bookings:
+        room = rooms.get(booking["room_id"])
+        guest = guests.get(booking["guest_id"])
+        details.append(BookingWithDetails(
+            booking_id=booking["booking_id"],
+            room_number=room["room_number"] if room else "Unknown",
+            room_type=room["room_type"] if room else "Unknown",
+            guest_name=guest["name"] if guest else "Unknown",
+            guest_email=guest["email"] if guest else "Unknown",
+            guest_phone=guest["phone"] if guest else "Unknown",
+            check_in=to_date(booking["check_in"]),
+            check_out=to_date(booking["check_out"]),
+            total_amount=booking["total_amount"],
+            advance_payment=booking.get("advance_payment", 0.0),
+            status=booking["status"],
+            guests_count=booking["guests_count"],
+            special_requests=booking.get("special_requests", ""),
+            created_at=booking["created_at"]
+        ))
+    return details
+
+@api_router.get("/sync", response_model=SyncResponse)
+async def sync_changes(since: int = 0, token_data: dict = Depends(verify_token)):
+    """Rooms, guests and bookings changed after `since`, plus deletions.
+
+    since=0 returns everything; pass the returned version next time.
+    """
+    try:
+        # Read the version first: anything written meanwhile is sent again next time
+        version = await change_versions.current()
+        query = {"change_version": {"$gt": since}} if since > 0 else {}
+        rooms = await db.rooms.find(query).to_list(None)
+        guests = await db.guests.find(query).to_list(None)
+        bookings = await db.bookings.find(query).to_list(None)
+        deleted = await db.tombstones.find(query).to_list(None) if since > 0 else []
+        return SyncResponse(
+            version=version,
+            full=since <= 0,
+            rooms=[Room(**room) for room in rooms],
+            guests=[Guest(**guest) for guest in guests],
+            bookings=await booking_details(bookings),
+            deleted=[Tombstone(**tombstone) for tombstone in deleted]
+        )
+    except Exception as e:
+        logger.error(f"Sync error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to sync changes"
+        )
+
+# Housekeeping endpoints
+@api_router.get("/housekeeping/board", response_model=List[HousekeepingBoard])
+async def get_housekeeping_board(floor: Optional[str] = None, token_data: dict = Depends(verify_token)):
+    try:
+        query = {"status": {"$in": OPEN_TASK_STATUSES}}
+        if floor is not None:
+            query["floor"] = floor
+        tasks = await db.housekeeping_tasks.find(query).sort(
+            [("priority_at", 1), ("created_at", 1)]
+        ).to_list(None)
+        boards = {}
+        for task in tasks:
+            boards.setdefault(task["floor"], []).append(task_from_db(task))
+        return [
+            HousekeepingBoard(floor=board_floor, tasks=boards[board_floor])
+            for board_floor in sorted(boards, key=lambda value: (len(value), value))
+        ]
+    except Exception as e:
+        logger.error(f"Get housekeeping board error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve housekeeping board"
+        )
+
+@api_router.post("/housekeeping/tasks/next", response_model=HousekeepingTask)
+async def assign_housekeeping_task(assignment: HousekeepingAssign, token_data: dict = Depends(verify_token)):
+    try:
+        task = await assign_next_task(assignment.staff, assignment.floor)
+        if not task:
+            raise HTTPException(status_code=404, detail="No pending housekeeping tasks")
+        audit_log.record("housekeeping_task", task["task_id"], "assign", token_data, after=task)
+        return task_from_db(task)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Assign housekeeping task error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to assign housekeeping task"
+        )
+
+@api_router.put("/housekeeping/tasks/{task_id}/complete", response_model=HousekeepingTask)
+async def complete_housekeeping_task(task_id: str, token_data: dict = Depends(verify_token)):
+    try:
+        task = await complete_task(task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Open housekeeping task not found")
+        audit_log.record("housekeeping_task", task_id, "complete", token_data, after=task)
+        return task_from_db(task)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Complete housekeeping task error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to complete housekeeping task"
+        )
+
+# Waitlist endpoints
+@api_router.post("/waitlist", response_model=WaitlistEntry)
+async def create_waitlist_entry(entry_data: WaitlistCreate):
+    try:
+        if (entry_data.check_out - entry_data.check_in).days <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Check-out date must be after check-in date"
+            )
+        guest = await get_or_create_guest(
+            entry_data.guest_name, entry_data.guest_email, entry_data.guest_phone,
+            entry_data.guest_address, entry_data.guest_id_proof
+        )
+        return await join_waitlist(WaitlistEntry(
+            room_type=entry_data.room_type,
+            guest_id=guest["guest_id"],
+            check_in=entry_data.check_in,
+            check_out=entry_data.check_out,
+            guests_count=entry_data.guests_count,
+            special_requests=entry_data.special_requests,
+            advance_payment=entry_data.advance_payment
+        ))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Create waitlist entry error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to join waitlist"
+        )
+
+@api_router.get("/waitlist", response_model=List[WaitlistEntry])
+async def get_waitlist(room_type: Optional[str] = None, entry_status: str = "waiting",
+                       token_data: dict = Depends(verify_token)):
+    try:
+        query = {"status": entry_status}
+        if room_type:
+            query["room_type"] = room_type
+        entries = await db.waitlist.find(query).sort([("overbooked", -1), ("created_at", 1)]).to_list(1000)
+        return [WaitlistEntry(**entry) for entry in entries]
+    except Exception as e:
+        logger.error(f"Get waitlist error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve waitlist"
+        )
+
+@api_router.delete("/waitlist/{waitlist_id}")
+async def cancel_waitlist_entry(waitlist_id: str, token_data: dict = Depends(verify_token)):
+    try:
+        entry = await db.waitlist.find_one_and_update(
+            {"waitlist_id": waitlist_id, "status": "waiting"},
+            {"$set": {"status": "cancelled"}}
+        )
+        if not entry:
+            raise HTTPException(status_code=404, detail="Waiting entry not found")
+        audit_log.record("waitlist", waitlist_id, "cancel", token_data, before=entry)
+        return {"message": "Waitlist entry cancelled successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Cancel waitlist entry error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to cancel waitlist entry"
+        )
+
+@api_router.get("/overbooking", response_model=List[OverbookingPolicy])
+async def get_overbooking_policies(token_data: dict = Depends(verify_token)):
+    try:
+        policies = await db.overbooking_policies.find().to_list(100)
+        return [OverbookingPolicy(**policy) for policy in policies]
+    except Exception as e:
+        logger.error(f"Get overbooking policies error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve overbooking policies"
+        )
+
+@api_router.put("/overbooking/{room_type}", response_model=OverbookingPolicy)
+async def update_overbooking_policy(room_type: str, policy_data: OverbookingPolicyUpdate,
+                                    token_data: dict = Depends(verify_token)):
+    try:
+        if policy_data.limit < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Overbooking limit cannot be negative"
+            )
+        policy_obj = OverbookingPolicy(room_type=room_type, limit=policy_data.limit)
+        before = await db.overbooking_policies.find_one_and_update(
+            {"room_type": room_type},
+            {"$set": policy_obj.dict()},
+            upsert=True
+        )
+        audit_log.record("overbooking_policy", room_type, "update", token_data, before=before, after=policy_obj)
+        return policy_obj
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Update overbooking policy error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update overbooking policy"
+        )
+
+# Room assignment endpoints
+@api_router.post("/rooms/optimize", response_model=Job)
+async def optimize_room_assignments(optimization: RoomOptimizationRequest, token_data: dict = Depends(verify_token)):
+    try:
+        if not 1 <= optimization.days <= 730 or optimization.min_stay < 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="days must be between 1 and 730 and min_stay at least 1"
+            )
+        if optimization.strategy not in OPTIMIZER_STRATEGIES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"strategy must be one of {OPTIMIZER_STRATEGIES}"
+            )
+        # The plan and its diff are in the job result
+        job = await job_queue.enqueue("optimize_room_assignments", optimization.dict(), max_attempts=3)
+        audit_log.record("room_optimization", job.job_id, "start", token_data, after=optimization)
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Optimize room assignments error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to start room optimization"
+        )
+
+# Channel endpoints
+@api_router.post("/channels", response_model=Channel)
+async def create_channel(channel_data: ChannelCreate, token_data: dict = Depends(verify_token)):
+    try:
+        channel_obj = Channel(**channel_data.dict())
+        await db.channels.insert_one({**channel_obj.dict(), "api_key": channel_data.api_key})
+        audit_log.record("channel", channel_obj.channel_id, "create", token_data, after=channel_obj)
+        await channel_sync.schedule()
+        return channel_obj
+    except Exception as e:
+        logger.error(f"Create channel error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create channel"
+        )
+
+@api_router.get("/channels", response_model=List[Channel])
+async def get_channels(token_data: dict = Depends(verify_token)):
+    try:
+        channels = await db.channels.find().to_list(100)
+        return [Channel(**channel) for channel in channels]
+    except Exception as e:
+        logger.error(f"Get channels error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve channels"
+        )
+
+@api_router.put("/channels/{channel_id}", response_model=Channel)
+async def update_channel(channel_id: str, channel_data: ChannelCreate, token_data: dict = Depends(verify_token)):
+    try:
+        channel = await db.channels.find_one({"channel_id": channel_id})
+        if not channel:
+            raise HTTPException(status_code=404, detail="Channel not found")
+        
+        update_data = channel_data.dict()
+        if not update_data["api_key"]:
+            # Keep the stored key unless a new one is given
+            del update_data["api_key"]
+        await db.channels.update_one({"channel_id": channel_id}, {"$set": update_data})
+        updated_channel = await db.channels.find_one({"channel_id": channel_id})
+        audit_log.record("channel", channel_id, "update", token_data, before=channel, after=updated_channel)
+        await channel_sync.schedule()
+        return Channel(**updated_channel)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Update channel error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update channel"
+        )
+
+@api_router.post("/channels/{channel_id}/push", response_model=Job)
+async def push_channel_now(channel_id: str, full: bool = False, token_data: dict = Depends(verify_token)):
+    try:
+        channel = await db.channels.find_one({"channel_id": channel_id})
+        if not channel:
+            raise HTTPException(status_code=404, detail="Channel not found")
+        if full:
+            # Forget what the channel was sent, so the next push resends the whole horizon
+            await db.channel_inventory.delete_many({"channel_id": channel_id})
+        job = await job_queue.enqueue("push_channel_updates", {"channel_id": channel_id})
+        audit_log.record("channel", channel_id, "push", token_data, after={"full": full, "job_id": job.job_id})
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Push channel error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to push channel updates"
+        )
+
+@api_router.post("/channels/{channel_id}/reservations", response_model=ChannelImportResult)
+async def receive_channel_reservations(channel_id: str, batch: ChannelReservationBatch, request: Request):
+    try:
+        channel = await db.channels.find_one({"channel_id": channel_id, "active": True})
+        # The OTA authenticates with the channel's shared key rather than an admin token
+        # A channel without a key accepts no reservations
+        if not channel or not channel.get("api_key") \
+                or not hmac.compare_digest(request.headers.get("x-channel-key", ""), channel["api_key"]):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid channel credentials")
+        
+        result = await import_channel_reservations(channel, batch.reservations)
+        audit_log.record("channel", channel_id, "import_reservations", None, after=result)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Receive channel reservations error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to import channel reservations"
+        )
+
+# Analytics endpoints
+@api_router.get("/analytics/bookings", response_model=BookingAnalytics)
+async def get_booking_analytics(start_date: date, end_date: date, token_data: dict = Depends(verify_token)):
+    try:
+        if end_date <= start_date:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="End date must be after start date"
+            )
+        await booking_store.ensure_fresh()
+        store = booking_store.get()
+        occupancy = store.nightly_occupancy(start_date, end_date)
+        bookings, revenue = store.revenue(start_date, end_date)
+        return BookingAnalytics(
+            start_date=start_date,
+            end_date=end_date,
+            bookings=bookings,
+            revenue=round(revenue, 2),
+            nightly_occupancy=occupancy.tolist(),
+            peak_occupancy=int(occupancy.max()) if len(occupancy) else 0
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get booking analytics error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve booking analytics"
+        )
+
+# Archive endpoints
+@api_router.post("/admin/archive", response_model=Job)
+async def start_archive(archive_data: ArchiveRequest, token_data: dict = Depends(verify_token)):
+    try:
+        if archive_data.months < 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Archive age must be at least one month"
+            )
+        job = await job_queue.enqueue("archive_bookings", archive_data.dict(), max_attempts=3)
+        audit_log.record("archive", job.job_id, "start", token_data, after=archive_data)
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Start archive error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to start archive"
+        )
+
+@api_router.get("/admin/archive", response_model=ArchiveStatus)
+async def get_archive_status(token_data: dict = Depends(verify_token)):
+    try:
+        archive_state = await db.archive_state.find_one() or {}
+        rollups = await db.archive_rollups.find().sort("month", 1).to_list(None)
+        return ArchiveStatus(
+            cutoff=archive_state.get("cutoff"),
+            last_run_at=archive_state.get("last_run_at"),
+            archived_bookings=archive_state.get("archived_bookings", 0),
+            archived_sales=archive_state.get("archived_sales", 0),
+            rollups=[ArchiveRollup(**rollup) for rollup in rollups]
+        )
+    except Exception as e:
+        logger.error(f"Get archive status error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve archive status"
+        )
+
+# Invoice endpoints
+@api_router.get("/bookings/{booking_id}/invoice", response_class=HTMLResponse)
+async def get_invoice(booking_id: str, kind: str = "invoice", token_data: dict = Depends(verify_token)):
+    try:
+        if kind not in INVOICE_KINDS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Document kind must be one of {INVOICE_KINDS}"
+            )
+        booking = await db.bookings.find_one({"booking_id": booking_id})
+        if not booking:
+            booking = await db.bookings_archive.find_one({"booking_id": booking_id})
+        if not booking:
+            raise HTTPException(status_code=404, detail="Booking not found")
+        html, _ = await get_invoices([booking], kind)
+        return HTMLResponse(html[booking_id])
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get invoice error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to generate invoice"
+        )
+
+@api_router.post("/invoices/month-end", response_model=Job)
+async def start_month_end_invoices(run: MonthEndInvoiceRun, token_data: dict = Depends(verify_token)):
+    try:
+        try:
+            datetime.strptime(run.month, "%Y-%m")
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Month must be formatted as YYYY-MM"
+            )
+        job = await job_queue.enqueue("month_end_invoices", run.dict(), max_attempts=3)
+        audit_log.record("invoice_run", job.job_id, "start", token_data, after=run)
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Start month-end invoices error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to start month-end invoice run"
+        )
+
+# Report endpoints
+@api_router.post("/reports/query", response_model=ReportResult)
+async def query_report(report: ReportQuery, token_data: dict = Depends(verify_token)):
+    try:
+        return await run_report(report)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Report query error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to run report"
+        )
+
+# Audit endpoints
+@api_router.get("/audit", response_model=List[AuditEvent])
+async def get_audit_events(entity: Optional[str] = None, entity_id: Optional[str] = None,
+                           user: Optional[str] = None, start: Optional[datetime] = None,
+                           end: Optional[datetime] = None, limit: int = 100,
+                           token_data: dict = Depends(verify_token)):
+    try:
+        # Make this process's buffered events visible first
+        await audit_log.flush()
+        query = {}
+        if entity:
+            query["entity"] = entity
+        if entity_id:
+            query["entity_id"] = entity_id
+        if user:
+            query["user"] = user
+        if start:
+            query.setdefault("at", {})["$gte"] = start
+        if end:
+            query.setdefault("at", {})["$lt"] = end
+        events = await db.audit_log.find(query).sort("at", -1).to_list(min(max(limit, 1), 1000))
+        return [AuditEvent(**event) for event in events]
+    except Exception as e:
+        logger.error(f"Get audit events error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve audit events"
+        )
+
+# Admission control endpoints
+@api_router.get("/metrics/admission", response_model=AdmissionStats)
+async def get_admission_stats(token_data: dict = Depends(verify_token)):
+    return AdmissionStats(
+        admitted=admission_metrics.admitted,
+        rate_limited=dict(admission_metrics.rate_limited),
+        shed=dict(admission_metrics.shed),
+        in_flight=concurrency_limiter.in_flight,
+        queued=concurrency_limiter.queued,
+        max_concurrent=concurrency_limiter.max_concurrent,
+        max_queued=concurrency_limiter.max_queued
+    )
+
+@api_router.get("/metrics/logging", response_model=LoggingStats)
+async def get_logging_stats(token_data: dict = Depends(verify_token)):
+    return LoggingStats(
+        queued=log_queue.qsize(),
+        capacity=LOG_QUEUE_SIZE,
+        dropped=log_handler.dropped,
+        sampled_out=error_sampler.suppressed
+    )
+
+@api_router.get("/metrics/availability", response_model=AvailabilityMemoStats)
+async def get_availability_memo_stats(token_data: dict = Depends(verify_token)):
+    memo = availability_memo.get()
+    lookups = memo.hits + memo.misses
+    return AvailabilityMemoStats(
+        entries=len(memo.entries),
+        hits=memo.hits,
+        misses=memo.misses,
+        hit_rate=round(memo.hits / lookups, 4) if lookups else 0.0,
+        invalidated=memo.invalidated,
+        evicted=memo.evicted
+    )
+
+# Job endpoints
+@api_router.get("/jobs/stats", response_model=JobStats)
+async def get_job_stats(token_data: dict = Depends(verify_token)):
+    try:
+        return await job_queue.stats()
+    except Exception as e:
+        logger.error(f"Get job stats error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve job statistics"
+        )
+
+@api_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str, token_data: dict = Depends(verify_token)):
+    try:
+        job = await db.jobs.find_one({"job_id": job_id, "property_id": current_property.get()})
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return Job(**job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get job error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve job"
+        )
+
 @api_router.get("/")
 async def root():
     return {"message": "Hotel Management System API"}
@@ -963,6 +5766,12 @@ async def root():
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(TenantMiddleware)
+
+app.add_middleware(NegotiatedGZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -971,13 +5780,4 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+app.add_middleware(RequestLogMiddleware)
@@ -0,0 +1,615 @@
+#!/usr/bin/env python3
+"""Performance benchmarks for the Hotel Management System backend.
+
+Run one benchmark at a time, e.g.:
+
+    python backend_benchmark.py tenancy --sizes 0,100000,1000000
+    python backend_benchmark.py startup --budget-ms 1000
+    python backend_benchmark.py polling --url http://localhost:8001/api
+    python backend_benchmark.py load --path /rooms/availability --concurrency 64
+    python backend_benchmark.py groups --rooms 500 --group-size 100
+    python backend_benchmark.py memory --bookings 1000000
+    python backend_benchmark.py housekeeping --rooms 1000
+    python backend_benchmark.py waitlist --rooms 1000 --nights 365
+    python backend_benchmark.py optimizer --rooms 1000 --nights 365
+    python backend_benchmark.py logging --records 100000
+
+Benchmarks that need MongoDB use MONGO_URL from backend/.env and write to a
+separate BENCH_DB_NAME database (default "hotel_benchmark") that is dropped
+before each run.
+"""
+import argparse
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import requests
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+load_dotenv(BACKEND_DIR / ".env")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "hotel_benchmark")
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def print_latency(label, samples):
+    print(f"{label:<40} p50 {percentile(samples, 50) * 1000:8.2f} ms   "
+          f"p95 {percentile(samples, 95) * 1000:8.2f} ms   n={len(samples)}")
+
+
+async def reset_database():
+    await server.tenant_router.default_database().client.drop_database(os.environ["DB_NAME"])
+    await server.ensure_indexes()
+
+
+def in_property(property_id):
+    server.current_property.set(property_id)
+
+
+async def seed_property(property_id, room_count, booking_count, batch_size=5000):
+    """Insert rooms and non-overlapping bookings for one property."""
+    in_property(property_id)
+    rooms = [{
+        "room_id": str(uuid.uuid4()),
+        "room_number": str(100 + number),
+        "room_type": random.choice(["double", "triple"]),
+        "price_per_night": 9000.0,
+        "amenities": [],
+        "status": "available",
+        "max_occupancy": 2,
+        "description": "Benchmark room",
+        "created_at": datetime.utcnow()
+    } for number in range(room_count)]
+    if rooms:
+        await server.db.rooms.insert_many(rooms)
+
+    start = datetime(2020, 1, 1)
+    per_room = max(1, booking_count // max(1, room_count))
+    batch = []
+    inserted = 0
+    for room in rooms:
+        check_in = start
+        for _ in range(per_room):
+            if inserted >= booking_count:
+                break
+            nights = random.randint(1, 5)
+            batch.append({
+                "booking_id": str(uuid.uuid4()),
+                "room_id": room["room_id"],
+                "guest_id": str(uuid.uuid4()),
+                "check_in": check_in,
+                "check_out": check_in + timedelta(days=nights),
+                "total_amount": 9000.0 * nights,
+                "advance_payment": 0.0,
+                "status": random.choice(["confirmed", "checked_out", "cancelled"]),
+                "guests_count": 2,
+                "special_requests": "",
+                "created_at": datetime.utcnow()
+            })
+            inserted += 1
+            check_in += timedelta(days=nights + random.randint(0, 2))
+            if len(batch) >= batch_size:
+                await server.db.bookings.insert_many(batch)
+                batch = []
+    if batch:
+        await server.db.bookings.insert_many(batch)
+    return rooms
+
+
+async def time_property_queries(property_id, rooms, iterations):
+    """Latency of the availability conflict query and the occupancy count."""
+    in_property(property_id)
+    conflict_samples = []
+    count_samples = []
+    for _ in range(iterations):
+        room = random.choice(rooms)
+        check_in = datetime(2020, 1, 1) + timedelta(days=random.randint(0, 1500))
+        check_out = check_in + timedelta(days=3)
+
+        started = time.perf_counter()
+        await server.db.bookings.find({
+            "room_id": room["room_id"],
+            "status": {"$in": server.ACTIVE_BOOKING_STATUSES},
+            "check_in": {"$lt": check_out},
+            "check_out": {"$gt": check_in}
+        }).to_list(1000)
+        conflict_samples.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await server.db.bookings.count_documents({
+            "status": "checked_in",
+            "check_in": {"$lte": check_in},
+            "check_out": {"$gte": check_in}
+        })
+        count_samples.append(time.perf_counter() - started)
+    return conflict_samples, count_samples
+
+
+async def bench_tenancy(args):
+    """Show that one property's query latency does not depend on another's size."""
+    random.seed(args.seed)
+    await reset_database()
+    small_rooms = await seed_property("small", args.rooms, args.bookings)
+    print(f"Seeded property 'small' with {args.rooms} rooms and {args.bookings} bookings")
+
+    loaded = 0
+    for size in [int(value) for value in args.sizes.split(",")]:
+        if size > loaded:
+            started = time.perf_counter()
+            await seed_property(f"large-{size}", max(1, size // 400), size)
+            print(f"Seeded property 'large-{size}' with {size} bookings "
+                  f"in {time.perf_counter() - started:.1f}s")
+            loaded = size
+        conflict_samples, count_samples = await time_property_queries("small", small_rooms, args.iterations)
+        print_latency(f"small: conflict query (other={size})", conflict_samples)
+        print_latency(f"small: occupancy count (other={size})", count_samples)
+
+
+async def bench_groups(args):
+    """Time the availability view and allocation for a group booking."""
+    random.seed(args.seed)
+    await reset_database()
+    await seed_property(server.DEFAULT_PROPERTY_ID, args.rooms, args.bookings)
+    in_property(server.DEFAULT_PROPERTY_ID)
+    room_types = ["double", "triple"]
+    view_samples = []
+    allocate_samples = []
+    for _ in range(args.iterations):
+        check_in = datetime(2020, 1, 1) + timedelta(days=random.randint(0, 1500))
+        check_out = check_in + timedelta(days=3)
+
+        started = time.perf_counter()
+        free_rooms = await server.load_free_rooms(room_types, check_in, check_out)
+        view_samples.append(time.perf_counter() - started)
+
+        free_count = sum(len(rooms) for rooms in free_rooms.values())
+        wanted = min(args.group_size, free_count)
+        counts = {"double": min(wanted, len(free_rooms["double"]))}
+        counts["triple"] = wanted - counts["double"]
+        started = time.perf_counter()
+        server.allocate_rooms(free_rooms, counts)
+        allocate_samples.append(time.perf_counter() - started)
+    print_latency(f"availability view ({args.rooms} rooms)", view_samples)
+    print_latency(f"allocation ({args.group_size} rooms)", allocate_samples)
+
+
+def synthetic_bookings(room_count, booking_count):
+    """Booking documents shaped like db.bookings rows, without MongoDB."""
+    room_ids = [str(uuid.uuid4()) for _ in range(room_count)]
+    start = datetime(2020, 1, 1)
+    for number in range(booking_count):
+        check_in = start + timedelta(days=random.randint(0, 1500))
+        nights = random.randint(1, 5)
+        yield {
+            "booking_id": str(uuid.uuid4()),
+            "room_id": room_ids[number % room_count],
+            "guest_id": str(uuid.uuid4()),
+            "check_in": check_in,
+            "check_out": check_in + timedelta(days=nights),
+            "total_amount": 9000.0 * nights,
+            "advance_payment": 0.0,
+            "status": random.choice(["confirmed", "checked_in", "checked_out", "cancelled"]),
+            "guests_count": 2,
+            "special_requests": "",
+            "created_at": datetime.utcnow()
+        }
+
+
+def bench_memory(args):
+    """Compare memory and query time of the compact booking store with plain dicts."""
+    random.seed(args.seed)
+    server.np.zeros(0)  # load NumPy before measuring
+
+    tracemalloc.start()
+    documents = list(synthetic_bookings(args.rooms, args.bookings))
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    store = server.BookingStore(chunk_size=args.chunk_size)
+    for offset in range(0, len(documents), args.chunk_size):
+        store.append(documents[offset:offset + args.chunk_size])
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{'dicts':<40} {dict_bytes / 2**20:9.1f} MiB   {dict_bytes / args.bookings:7.0f} B/booking")
+    print(f"{'BookingStore':<40} {store_bytes / 2**20:9.1f} MiB   {store_bytes / args.bookings:7.0f} B/booking "
+          f"(columns {store.memory_bytes() / 2**20:.1f} MiB)")
+
+    start = datetime(2020, 1, 1).date() + timedelta(days=random.randint(0, 1400))
+    end = start + timedelta(days=30)
+    active = set(server.ACTIVE_BOOKING_STATUSES)
+
+    def dict_queries():
+        busy = {doc["room_id"] for doc in documents if doc["status"] in active
+                and doc["check_in"].date() < end and doc["check_out"].date() > start}
+        revenue = sum(doc["total_amount"] for doc in documents
+                      if doc["status"] != "cancelled" and start <= doc["check_in"].date() < end)
+        return busy, revenue
+
+    def store_queries():
+        return store.busy_room_ids(start, end), store.revenue(start, end)[1], store.nightly_occupancy(start, end)
+
+    for label, queries in [("dicts: overlap + revenue", dict_queries),
+                           ("store: overlap + revenue + occupancy", store_queries)]:
+        samples = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            queries()
+            samples.append(time.perf_counter() - started)
+        print_latency(label, samples)
+
+
+async def bench_housekeeping(args):
+    """Throughput of checkout events, task assignment and completion."""
+    random.seed(args.seed)
+    await reset_database()
+    in_property(server.DEFAULT_PROPERTY_ID)
+    rooms = await seed_property(server.DEFAULT_PROPERTY_ID, args.rooms, 0)
+    for number, room in enumerate(rooms):
+        room["room_number"] = f"{number // 50 + 1}{number % 50:02d}"
+        await server.db.rooms.update_one({"room_id": room["room_id"]}, {"$set": {"room_number": room["room_number"]}})
+
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    checkouts = []
+    for room in rooms:
+        booking = {"booking_id": str(uuid.uuid4()), "room_id": room["room_id"], "status": "checked_out"}
+        checkouts.append(booking)
+        if random.random() < 0.5:
+            await server.db.bookings.insert_one({
+                "booking_id": str(uuid.uuid4()), "room_id": room["room_id"], "guest_id": "", "status": "confirmed",
+                "check_in": today + timedelta(days=random.randint(0, 3)),
+                "check_out": today + timedelta(days=5), "total_amount": 0.0
+            })
+
+    samples = []
+    started = time.perf_counter()
+    for booking in checkouts:
+        event_started = time.perf_counter()
+        await server.update_housekeeping(booking, "checked_in")
+        samples.append(time.perf_counter() - event_started)
+    elapsed = time.perf_counter() - started
+    print(f"{len(checkouts)} checkout events in {elapsed:.2f}s ({len(checkouts) / elapsed:.0f}/s)")
+    print_latency("checkout event", samples)
+
+    samples = []
+    for floor in range(1, args.rooms // 50 + 1):
+        started = time.perf_counter()
+        await server.db.housekeeping_tasks.find({"floor": str(floor), "status": {"$in": server.OPEN_TASK_STATUSES}}).sort(
+            [("priority_at", 1), ("created_at", 1)]
+        ).to_list(None)
+        samples.append(time.perf_counter() - started)
+    print_latency("floor board", samples)
+
+    samples = []
+    started = time.perf_counter()
+    while True:
+        task_started = time.perf_counter()
+        task = await server.assign_next_task("bench", None)
+        if task is None:
+            break
+        await server.complete_task(task["task_id"])
+        samples.append(time.perf_counter() - task_started)
+    elapsed = time.perf_counter() - started
+    print(f"{len(samples)} tasks assigned and completed in {elapsed:.2f}s ({len(samples) / elapsed:.0f}/s)")
+    print_latency("assign + complete", samples)
+
+
+def synthetic_calendar(args):
+    """A RoomCalendar of back-to-back stays with random gaps, every stay movable."""
+    room_ids = [str(uuid.uuid4()) for _ in range(args.rooms)]
+    started = time.perf_counter()
+    calendar = server.RoomCalendar(room_ids)
+    movable = set()
+    for room_id in room_ids:
+        night = random.randint(0, 3)
+        while True:
+            nights = random.randint(1, 7)
+            if night + nights > args.nights:
+                break
+            key = str(uuid.uuid4())
+            calendar.add(room_id, night, night + nights, key)
+            movable.add(key)
+            night += nights + (random.randint(1, 3) if random.random() > args.occupancy else 0)
+    booked = sum(end - start for _, start, end in calendar.location.values())
+    print(f"{len(calendar.location)} stays on {args.rooms} rooms x {args.nights} nights "
+          f"({booked / (args.rooms * args.nights):.0%} occupied) built in {time.perf_counter() - started:.2f}s")
+    return calendar, movable
+
+
+def bench_waitlist(args):
+    """Reallocate waitlisted stays over an in-memory room calendar after cancellations."""
+    random.seed(args.seed)
+    calendar, movable = synthetic_calendar(args)
+
+    for key in random.sample(sorted(calendar.location), int(len(calendar.location) * args.cancel_rate)):
+        calendar.remove(key)
+        movable.discard(key)
+
+    samples = []
+    placed = 0
+    moves = 0
+    started = time.perf_counter()
+    for number in range(args.requests):
+        start = random.randint(0, args.nights - 8)
+        matcher = server.StayMatcher(calendar, movable)
+        request_started = time.perf_counter()
+        room_id = matcher.place(f"waitlist-{number}", start, start + random.randint(1, 7))
+        samples.append(time.perf_counter() - request_started)
+        if room_id is not None:
+            placed += 1
+            moves += len(matcher.moves())
+    elapsed = time.perf_counter() - started
+    print(f"{placed}/{args.requests} waitlisted stays placed with {moves} room moves "
+          f"in {elapsed:.2f}s ({args.requests / elapsed:.0f}/s)")
+    print_latency("match one request", samples)
+
+
+def bench_optimizer(args):
+    """Re-pack a year of stays to gather free nights into long runs."""
+    random.seed(args.seed)
+    calendar, movable = synthetic_calendar(args)
+    pinned = set(random.sample(sorted(movable), int(len(movable) * args.pinned_rate)))
+    movable -= pinned
+    before = server.fragmentation(calendar, 0, args.nights, args.min_stay)
+    started = time.perf_counter()
+    moves = server.compact_assignments(calendar, movable, args.min_stay,
+                                       keep_sellable=args.strategy == "close_gaps")
+    elapsed = time.perf_counter() - started
+    if moves is None:
+        print(f"no feasible re-packing around {len(pinned)} pinned stays ({elapsed:.2f}s)")
+        return
+    after = server.fragmentation(calendar, 0, args.nights, args.min_stay)
+    print(f"{len(movable)} movable stays re-packed in {elapsed:.2f}s, {len(moves)} moves")
+    for metric in before:
+        print(f"{metric:<20} {before[metric]:>10} -> {after[metric]:>10}")
+
+
+def bench_logging(args):
+    """Time logger.error calls through the queued pipeline against a synchronous handler."""
+    def run(label, handler):
+        bench_logger = logging.getLogger(f"benchmark.{label}")
+        bench_logger.propagate = False
+        bench_logger.handlers = [handler]
+        samples = []
+        started = time.perf_counter()
+        for number in range(args.records):
+            call_started = time.perf_counter()
+            bench_logger.error("Get booking error: %d", number)
+            samples.append(time.perf_counter() - call_started)
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {args.records} records in {elapsed:.2f}s ({args.records / elapsed:.0f}/s)")
+        print_latency(f"{label} logger.error", samples)
+
+    with open(os.devnull, "w") as sink:
+        direct = logging.StreamHandler(sink)
+        direct.setFormatter(server.JsonFormatter())
+        run("synchronous", direct)
+
+        queued = server.DroppingQueueHandler(queue.Queue(maxsize=args.queue_size))
+        sampler = server.ErrorSampler(args.burst, server.LOG_ERROR_WINDOW)
+        queued.addFilter(sampler)
+        output = logging.StreamHandler(sink)
+        output.setFormatter(server.JsonFormatter())
+        listener = logging.handlers.QueueListener(queued.queue, output)
+        listener.start()
+        run("queued", queued)
+        listener.stop()
+    print(f"queued: {queued.dropped} dropped, {sampler.suppressed} sampled out")
+
+
+def bench_load(args):
+    """Load generator: hammer one endpoint and report status codes and throughput."""
+    url = f"{args.url}{args.path}"
+    check_in = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+    check_out = (datetime.now() + timedelta(days=32)).strftime("%Y-%m-%d")
+    payload = {"check_in": check_in, "check_out": check_out}
+    deadline = time.perf_counter() + args.duration
+
+    def worker(client_number):
+        session = requests.Session()
+        # Distinct X-Real-IP values simulate many clients behind the proxy
+        headers = {"X-Real-IP": f"10.0.{client_number // 256}.{client_number % 256}"} if args.spread else {}
+        results = []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            if args.method == "POST":
+                response = session.post(url, json=payload, headers=headers)
+            else:
+                response = session.get(url, headers=headers)
+            results.append((response.status_code, time.perf_counter() - started))
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = [result for batch in executor.map(worker, range(args.concurrency)) for result in batch]
+    elapsed = time.perf_counter() - started
+
+    statuses = Counter(status_code for status_code, _ in results)
+    print(f"{len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed:.0f} req/s) "
+          f"with {args.concurrency} concurrent clients")
+    for status_code, count in sorted(statuses.items()):
+        samples = [latency for code, latency in results if code == status_code]
+        print_latency(f"status {status_code} x{count}", samples)
+
+
+def bench_startup(args):
+    """Report the import-time budget of the API process (python -X importtime)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    # Output is post-order: a module's imports are listed before the module
+    children = []
+    direct_imports = []
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == "server":
+                total_us = int(cumulative)
+                direct_imports = children
+            children = []
+
+    print(f"{'module':<40} {'cumulative':>12}")
+    for cumulative, name in sorted(direct_imports, reverse=True)[:args.top]:
+        print(f"{name:<40} {cumulative / 1000:9.1f} ms")
+    print(f"{'server (total)':<40} {total_us / 1000:9.1f} ms   budget {args.budget_ms:.0f} ms")
+    if total_us / 1000 > args.budget_ms:
+        print("Import time is over budget")
+        sys.exit(1)
+
+
+def poll(url, headers):
+    """GET url and return (status, bytes on the wire, latency, response headers)."""
+    started = time.perf_counter()
+    response = requests.get(url, headers=headers, stream=True)
+    body = response.raw.read(decode_content=False)
+    elapsed = time.perf_counter() - started
+    response.close()
+    return response.status_code, len(body), elapsed, response.headers
+
+
+def bench_polling(args):
+    """Bytes and latency per poll of the catalog endpoints against a running API."""
+    modes = [
+        ("plain", {"Accept-Encoding": "identity"}),
+        ("compressed", {"Accept-Encoding": "br, gzip"}),
+        ("conditional", {"Accept-Encoding": "br, gzip"}),
+    ]
+    print(f"{'endpoint':<28} {'mode':<12} {'status':>6} {'bytes/poll':>11} {'p50 ms':>8} {'p95 ms':>8}")
+    for path in ["/rooms", "/settings", "/dashboard/room-status"]:
+        url = f"{args.url}{path}"
+        for mode, headers in modes:
+            headers = dict(headers)
+            if mode == "conditional":
+                _, _, _, first_headers = poll(url, headers)
+                headers["If-None-Match"] = first_headers.get("ETag", "")
+            samples = []
+            sizes = []
+            for _ in range(args.polls):
+                status_code, size, elapsed, _ = poll(url, headers)
+                samples.append(elapsed)
+                sizes.append(size)
+            print(f"{path:<28} {mode:<12} {status_code:>6} {sum(sizes) / len(sizes):>11.0f} "
+                  f"{percentile(samples, 50) * 1000:>8.2f} {percentile(samples, 95) * 1000:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    tenancy = subparsers.add_parser("tenancy", help=bench_tenancy.__doc__)
+    tenancy.add_argument("--rooms", type=int, default=50)
+    tenancy.add_argument("--bookings", type=int, default=5000)
+    tenancy.add_argument("--sizes", default="0,100000,1000000",
+                         help="comma-separated booking counts for the other property")
+    tenancy.add_argument("--iterations", type=int, default=200)
+    tenancy.add_argument("--seed", type=int, default=42)
+    tenancy.set_defaults(func=bench_tenancy)
+
+    polling = subparsers.add_parser("polling", help=bench_polling.__doc__)
+    polling.add_argument("--url", default="http://localhost:8001/api")
+    polling.add_argument("--polls", type=int, default=200)
+    polling.set_defaults(func=bench_polling)
+
+    groups = subparsers.add_parser("groups", help=bench_groups.__doc__)
+    groups.add_argument("--rooms", type=int, default=500)
+    groups.add_argument("--bookings", type=int, default=50000)
+    groups.add_argument("--group-size", type=int, default=100)
+    groups.add_argument("--iterations", type=int, default=50)
+    groups.add_argument("--seed", type=int, default=42)
+    groups.set_defaults(func=bench_groups)
+
+    memory = subparsers.add_parser("memory", help=bench_memory.__doc__)
+    memory.add_argument("--rooms", type=int, default=500)
+    memory.add_argument("--bookings", type=int, default=1000000)
+    memory.add_argument("--chunk-size", type=int, default=50000)
+    memory.add_argument("--iterations", type=int, default=5)
+    memory.add_argument("--seed", type=int, default=42)
+    memory.set_defaults(func=bench_memory)
+
+    housekeeping = subparsers.add_parser("housekeeping", help=bench_housekeeping.__doc__)
+    housekeeping.add_argument("--rooms", type=int, default=1000)
+    housekeeping.add_argument("--seed", type=int, default=42)
+    housekeeping.set_defaults(func=bench_housekeeping)
+
+    waitlist = subparsers.add_parser("waitlist", help=bench_waitlist.__doc__)
+    waitlist.add_argument("--rooms", type=int, default=1000)
+    waitlist.add_argument("--nights", type=int, default=365)
+    waitlist.add_argument("--occupancy", type=float, default=0.9,
+                          help="chance that a stay is followed directly by the next one")
+    waitlist.add_argument("--cancel-rate", type=float, default=0.02)
+    waitlist.add_argument("--requests", type=int, default=2000)
+    waitlist.add_argument("--seed", type=int, default=42)
+    waitlist.set_defaults(func=bench_waitlist)
+
+    optimizer = subparsers.add_parser("optimizer", help=bench_optimizer.__doc__)
+    optimizer.add_argument("--rooms", type=int, default=1000)
+    optimizer.add_argument("--nights", type=int, default=365)
+    optimizer.add_argument("--occupancy", type=float, default=0.8,
+                           help="chance that a stay is followed directly by the next one")
+    optimizer.add_argument("--pinned-rate", type=float, default=0.05,
+                           help="share of stays that may not move (checked in, groups)")
+    optimizer.add_argument("--min-stay", type=int, default=2)
+    optimizer.add_argument("--strategy", default="close_gaps", choices=server.OPTIMIZER_STRATEGIES)
+    optimizer.add_argument("--seed", type=int, default=42)
+    optimizer.set_defaults(func=bench_optimizer)
+
+    logging_bench = subparsers.add_parser("logging", help=bench_logging.__doc__)
+    logging_bench.add_argument("--records", type=int, default=100000)
+    logging_bench.add_argument("--queue-size", type=int, default=server.LOG_QUEUE_SIZE)
+    logging_bench.add_argument("--burst", type=int, default=server.LOG_ERROR_BURST)
+    logging_bench.set_defaults(func=bench_logging)
+
+    load = subparsers.add_parser("load", help=bench_load.__doc__)
+    load.add_argument("--url", default="http://localhost:8001/api")
+    load.add_argument("--path", default="/rooms/availability")
+    load.add_argument("--method", default="POST", choices=["GET", "POST"])
+    load.add_argument("--concurrency", type=int, default=32)
+    load.add_argument("--duration", type=float, default=10.0)
+    load.add_argument("--spread", action="store_true",
+                      help="send each client from its own X-Real-IP address")
+    load.set_defaults(func=bench_load)
+
+    startup = subparsers.add_parser("startup", help=bench_startup.__doc__)
+    startup.add_argument("--budget-ms", type=float, default=1000.0)
+    startup.add_argument("--top", type=int, default=15)
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    if asyncio.iscoroutinefunction(args.func):
+        asyncio.run(args.func(args))
+    else:
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ import sys
 import os
 import time
 
+from mock_ota_server import deliver_reservations, start_mock_ota
+
 # Use the local backend URL for testing
 BACKEND_URL = "http://localhost:8001"
 API_URL = f"{BACKEND_URL}/api"
@@ -267,6 +269,398 @@ def test_dashboard_statistics():
         log_test("Dashboard Statistics", False, 
                 f"Failed to retrieve dashboard statistics. Status: {response.status_code}, Response: {response.text}")
 
+def test_rate_quote():
+    """Test that the rate quote prices every room type for a date range"""
+    print("\n=== Testing Rate Quotes ===")
+    
+    check_in = (datetime.now() + timedelta(days=10)).strftime("%Y-%m-%d")
+    check_out = (datetime.now() + timedelta(days=13)).strftime("%Y-%m-%d")
+    
+    response = requests.post(
+        f"{API_URL}/rates/quote",
+        json={"check_in": check_in, "check_out": check_out}
+    )
+    
+    if response.status_code == 200 and isinstance(response.json(), list):
+        quotes = response.json()
+        if all(quote["nights"] == 3 and quote["total_amount"] > 0 for quote in quotes):
+            log_test("Rate Quote", True, f"Quoted {len(quotes)} room types")
+        else:
+            log_test("Rate Quote", False, f"Unexpected quotes: {quotes}")
+    else:
+        log_test("Rate Quote", False, 
+                f"Failed to quote rates. Status: {response.status_code}, Response: {response.text}")
+    
+    # Check-out before check-in must be rejected
+    response = requests.post(
+        f"{API_URL}/rates/quote",
+        json={"check_in": check_out, "check_out": check_in}
+    )
+    
+    if response.status_code == 400:
+        log_test("Rate Quote - Invalid Range", True, "Correctly rejected an inverted date range")
+    else:
+        log_test("Rate Quote - Invalid Range", False, 
+                f"Failed to reject an inverted date range. Status: {response.status_code}, Response: {response.text}")
+
+def test_job_queue(token):
+    """Test that booking side effects are drained by the background job queue"""
+    print("\n=== Testing Background Job Queue ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    # Give the workers a moment to drain jobs enqueued by earlier tests
+    time.sleep(2)
+    response = requests.get(f"{API_URL}/jobs/stats", headers=headers)
+    
+    if response.status_code == 200:
+        stats = response.json()
+        if stats["failed"] == 0:
+            log_test("Job Queue Statistics", True, f"Queue stats: {stats}")
+        else:
+            log_test("Job Queue Statistics", False, f"Found failed jobs: {stats}")
+    else:
+        log_test("Job Queue Statistics", False, 
+                f"Failed to retrieve job statistics. Status: {response.status_code}, Response: {response.text}")
+
+def test_archive(token):
+    """Test that an archive run keeps dashboard totals unchanged"""
+    print("\n=== Testing Archival ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    before = requests.get(f"{API_URL}/dashboard/stats", headers=headers).json()
+    response = requests.post(f"{API_URL}/admin/archive", json={"months": 12}, headers=headers)
+    if response.status_code != 200:
+        log_test("Archive Run", False, 
+                f"Failed to start archive. Status: {response.status_code}, Response: {response.text}")
+        return
+    
+    time.sleep(2)
+    job = requests.get(f"{API_URL}/jobs/{response.json()['job_id']}", headers=headers).json()
+    after = requests.get(f"{API_URL}/dashboard/stats", headers=headers).json()
+    if (job["status"] == "succeeded" and after["total_revenue"] == before["total_revenue"]
+            and after["total_bookings"] == before["total_bookings"]):
+        log_test("Archive Run", True, f"Archive result: {job['result']}")
+    else:
+        log_test("Archive Run", False, f"Job: {job}, totals before: {before}, after: {after}")
+
+def test_group_booking(token):
+    """Test all-or-nothing allocation of a group booking"""
+    print("\n=== Testing Group Bookings ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    rooms = requests.get(f"{API_URL}/rooms").json()
+    room_type = rooms[0]["room_type"] if rooms else "double"
+    room_count = sum(1 for room in rooms if room["room_type"] == room_type)
+    group_data = {
+        "group_name": "Test Group",
+        "guest_name": "Group Lead",
+        "guest_email": "group.lead@example.com",
+        "check_in": (datetime.now() + timedelta(days=300)).strftime("%Y-%m-%d"),
+        "check_out": (datetime.now() + timedelta(days=302)).strftime("%Y-%m-%d"),
+        "rooms": {room_type: room_count + 1}
+    }
+    
+    # More rooms than the hotel has must be rejected without booking any
+    response = requests.post(f"{API_URL}/booking-groups", json=group_data)
+    if response.status_code == 409:
+        log_test("Group Booking - Shortage", True, response.json()["detail"])
+    else:
+        log_test("Group Booking - Shortage", False, 
+                f"Expected 409. Status: {response.status_code}, Response: {response.text}")
+    
+    group_data["rooms"] = {room_type: 1}
+    response = requests.post(f"{API_URL}/booking-groups", json=group_data)
+    if response.status_code == 200 and len(response.json()["booking_ids"]) == 1:
+        group = requests.get(f"{API_URL}/booking-groups/{response.json()['group_id']}", headers=headers)
+        log_test("Group Booking Creation", group.status_code == 200, f"Created group: {response.json()['group_id']}")
+        for booking_id in response.json()["booking_ids"]:
+            requests.put(f"{API_URL}/bookings/{booking_id}/status", json={"status": "cancelled"}, headers=headers)
+    else:
+        log_test("Group Booking Creation", False, 
+                f"Failed to create group booking. Status: {response.status_code}, Response: {response.text}")
+
+def test_housekeeping(token):
+    """Test that checkouts feed the housekeeping task board"""
+    print("\n=== Testing Housekeeping ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    response = requests.get(f"{API_URL}/housekeeping/board", headers=headers)
+    if response.status_code == 200:
+        open_tasks = sum(len(board["tasks"]) for board in response.json())
+        log_test("Housekeeping Board", True, f"{open_tasks} open tasks on {len(response.json())} floors")
+    else:
+        log_test("Housekeeping Board", False, 
+                f"Failed to retrieve board. Status: {response.status_code}, Response: {response.text}")
+        return
+    
+    response = requests.post(f"{API_URL}/housekeeping/tasks/next", json={"staff": "Test Staff"}, headers=headers)
+    if response.status_code == 404:
+        log_test("Housekeeping Assignment", True, "No pending tasks to assign")
+    elif response.status_code == 200:
+        task = response.json()
+        response = requests.put(f"{API_URL}/housekeeping/tasks/{task['task_id']}/complete", headers=headers)
+        log_test("Housekeeping Assignment", response.status_code == 200,
+                f"Assigned and completed {task['task_type']} for room {task['room_number']}")
+    else:
+        log_test("Housekeeping Assignment", False, 
+                f"Failed to assign a task. Status: {response.status_code}, Response: {response.text}")
+
+def test_delta_sync(token):
+    """Test that /sync returns only changes after the given version"""
+    print("\n=== Testing Delta Sync ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    response = requests.get(f"{API_URL}/sync", headers=headers)
+    if response.status_code != 200 or not response.json()["full"]:
+        log_test("Full Sync", False, 
+                f"Failed to sync. Status: {response.status_code}, Response: {response.text}")
+        return
+    version = response.json()["version"]
+    log_test("Full Sync", True, f"Version {version} with {len(response.json()['bookings'])} bookings")
+    
+    response = requests.get(f"{API_URL}/sync", params={"since": version}, headers=headers)
+    delta = response.json()
+    changed = len(delta["rooms"]) + len(delta["guests"]) + len(delta["bookings"]) + len(delta["deleted"])
+    if response.status_code == 200 and not delta["full"] and changed == 0:
+        log_test("Delta Sync", True, "No changes since the last version")
+    else:
+        log_test("Delta Sync", False, f"Expected an empty delta. Status: {response.status_code}, Response: {response.text}")
+
+def test_audit_log(token):
+    """Test that mutating requests leave audit events"""
+    print("\n=== Testing Audit Log ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    response = requests.get(f"{API_URL}/audit", params={"entity": "room", "limit": 10}, headers=headers)
+    if response.status_code == 200 and any(event["action"] == "create" for event in response.json()):
+        log_test("Audit Log Query", True, f"Found {len(response.json())} room events")
+    else:
+        log_test("Audit Log Query", False, 
+                f"Expected room creation events. Status: {response.status_code}, Response: {response.text}")
+
+def test_reports(token):
+    """Test the reporting query endpoint and its validation"""
+    print("\n=== Testing Reports ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    date_range = {
+        "start_date": (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d"),
+        "end_date": (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d")
+    }
+    
+    report = {"source": "sales", "filters": date_range, "group_by": ["month", "payment_method"]}
+    response = requests.post(f"{API_URL}/reports/query", json=report, headers=headers)
+    if response.status_code == 200:
+        log_test("Sales Report", True, f"{len(response.json()['rows'])} rows")
+    else:
+        log_test("Sales Report", False, 
+                f"Failed to run report. Status: {response.status_code}, Response: {response.text}")
+    
+    # Unbounded reports would scan the whole collection
+    response = requests.post(f"{API_URL}/reports/query", json={"source": "sales"}, headers=headers)
+    if response.status_code == 400:
+        log_test("Report Validation", True, response.json()["detail"])
+    else:
+        log_test("Report Validation", False, f"Expected 400. Status: {response.status_code}, Response: {response.text}")
+
+def test_invoices(token):
+    """Test month-end invoice runs and their validation"""
+    print("\n=== Testing Invoices ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    month = datetime.now().strftime("%Y-%m")
+    response = requests.post(f"{API_URL}/invoices/month-end", json={"month": month}, headers=headers)
+    if response.status_code == 200:
+        log_test("Month-End Invoices", True, f"Job {response.json()['job_id']} queued")
+    else:
+        log_test("Month-End Invoices", False, 
+                f"Failed to queue invoice run. Status: {response.status_code}, Response: {response.text}")
+    
+    response = requests.post(f"{API_URL}/invoices/month-end", json={"month": "2024-13"}, headers=headers)
+    if response.status_code == 400:
+        log_test("Invoice Month Validation", True, response.json()["detail"])
+    else:
+        log_test("Invoice Month Validation", False, f"Expected 400. Status: {response.status_code}, Response: {response.text}")
+
+def test_waitlist(token):
+    """Test that a sold-out room type queues the request and a cancellation fills it"""
+    print("\n=== Testing Waitlist ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    rooms = requests.get(f"{API_URL}/rooms").json()
+    room_type = rooms[0]["room_type"] if rooms else "double"
+    stay = {
+        "check_in": (datetime.now() + timedelta(days=320)).strftime("%Y-%m-%d"),
+        "check_out": (datetime.now() + timedelta(days=322)).strftime("%Y-%m-%d")
+    }
+    
+    # Fill every room of the type, then one more request has to wait
+    booking_ids = []
+    for room in rooms:
+        if room["room_type"] == room_type:
+            response = requests.post(f"{API_URL}/bookings", json={
+                "room_id": room["room_id"], "guest_name": "Waitlist Filler", **stay
+            })
+            if response.status_code == 200:
+                booking_ids.append(response.json()["booking_id"])
+    response = requests.post(f"{API_URL}/waitlist", json={
+        "room_type": room_type, "guest_name": "Waiting Guest", "guest_email": "waiting@example.com", **stay
+    })
+    if response.status_code == 200 and response.json()["status"] == "waiting":
+        entry = response.json()
+        log_test("Waitlist Entry", True, f"Waiting: {entry['waitlist_id']}")
+    else:
+        log_test("Waitlist Entry", False, 
+                f"Expected a waiting entry. Status: {response.status_code}, Response: {response.text}")
+        return
+    
+    if booking_ids:
+        requests.put(f"{API_URL}/bookings/{booking_ids[0]}/status", json={"status": "cancelled"}, headers=headers)
+    time.sleep(3)
+    entries = requests.get(f"{API_URL}/waitlist", params={"entry_status": "allocated"}, headers=headers).json()
+    allocated = [e for e in entries if e["waitlist_id"] == entry["waitlist_id"]]
+    if allocated and allocated[0]["booking_id"]:
+        log_test("Waitlist Reallocation", True, f"Allocated booking: {allocated[0]['booking_id']}")
+    else:
+        log_test("Waitlist Reallocation", False, f"Entry still waiting after cancellation: {entry['waitlist_id']}")
+    for booking_id in booking_ids[1:] + [e["booking_id"] for e in allocated]:
+        requests.put(f"{API_URL}/bookings/{booking_id}/status", json={"status": "cancelled"}, headers=headers)
+
+def test_room_optimizer(token):
+    """Test a dry run of the room assignment optimizer"""
+    print("\n=== Testing Room Optimizer ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    response = requests.post(f"{API_URL}/rooms/optimize", json={"dry_run": True, "days": 90}, headers=headers)
+    if response.status_code != 200:
+        log_test("Room Optimizer Dry Run", False, 
+                f"Failed to queue optimizer. Status: {response.status_code}, Response: {response.text}")
+        return
+    
+    time.sleep(2)
+    job = requests.get(f"{API_URL}/jobs/{response.json()['job_id']}", headers=headers).json()
+    if job["status"] == "succeeded" and not any(result["applied"] for result in job["result"]["room_types"]):
+        moves = sum(result["moves_total"] for result in job["result"]["room_types"])
+        log_test("Room Optimizer Dry Run", True, f"{moves} proposed moves, none applied")
+    else:
+        log_test("Room Optimizer Dry Run", False, f"Unexpected job state: {job}")
+
+def test_channels(token):
+    """Test ARI pushes to a mock OTA and a redelivered reservation batch"""
+    print("\n=== Testing Channel Manager ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    port = int(os.environ.get("MOCK_OTA_PORT", "8002"))
+    ota = start_mock_ota(port, api_key="ota-secret")
+    rooms = requests.get(f"{API_URL}/rooms").json()
+    room_type = rooms[0]["room_type"] if rooms else "double"
+    response = requests.post(f"{API_URL}/channels", json={
+        "name": "Mock OTA", "endpoint_url": f"http://127.0.0.1:{port}", "api_key": "ota-secret",
+        "room_type_codes": {room_type: "MOCK"}
+    }, headers=headers)
+    if response.status_code != 200:
+        log_test("Channel Full Push", False, 
+                f"Failed to create channel. Status: {response.status_code}, Response: {response.text}")
+        ota.should_exit = True
+        return
+    channel_id = response.json()["channel_id"]
+    
+    # A full push covers the horizon in a handful of ranges rather than one update per night
+    requests.post(f"{API_URL}/channels/{channel_id}/push", params={"full": True}, headers=headers)
+    time.sleep(3)
+    state = requests.get(f"http://127.0.0.1:{port}/ari").json()
+    nights = len(state["inventory"].get("MOCK", {}))
+    if state["pushes"] >= 1 and nights > 0 and state["updates"] < nights:
+        log_test("Channel Full Push", True, f"{nights} nights in {state['updates']} ranges")
+    else:
+        log_test("Channel Full Push", False, f"Unexpected OTA state: {state['pushes']} pushes, {nights} nights")
+    
+    stay = {
+        "check_in": (datetime.now() + timedelta(days=300)).strftime("%Y-%m-%d"),
+        "check_out": (datetime.now() + timedelta(days=303)).strftime("%Y-%m-%d")
+    }
+    reservations = [
+        {"reservation_id": "OTA-1", "room_code": "MOCK", "guest_name": "Channel Guest", **stay},
+        {"reservation_id": "OTA-1", "room_code": "MOCK", "guest_name": "Channel Guest", **stay},
+        {"reservation_id": "OTA-2", "room_code": "MOCK", "guest_name": "Channel Guest", **stay},
+        {"reservation_id": "OTA-2", "room_code": "MOCK", "guest_name": "Channel Guest", **stay, "status": "cancelled"}
+    ]
+    unauthenticated = requests.post(f"{API_URL}/channels/{channel_id}/reservations",
+                                    json={"reservations": reservations})
+    if unauthenticated.status_code == 401:
+        log_test("Channel Key Required", True, "Delivery without X-Channel-Key rejected")
+    else:
+        log_test("Channel Key Required", False, f"Status: {unauthenticated.status_code}")
+    
+    first = deliver_reservations(API_URL, channel_id, "ota-secret", reservations)
+    second = deliver_reservations(API_URL, channel_id, "ota-secret", reservations)
+    if (first.status_code == 200 and first.json()["created"] + first.json()["overbooked"] == 1
+            and first.json()["duplicates"] == 1 and first.json()["cancelled"] == 1
+            and second.status_code == 200 and second.json()["duplicates"] == len(reservations)):
+        log_test("Channel Reservations", True, f"First delivery: {first.json()}")
+    else:
+        log_test("Channel Reservations", False, f"First: {first.text}, redelivery: {second.text}")
+    
+    # Only the nights touched by the new booking go out on the next push
+    updates_before = requests.get(f"http://127.0.0.1:{port}/ari").json()["updates"]
+    requests.post(f"{API_URL}/channels/{channel_id}/push", headers=headers)
+    time.sleep(3)
+    delta = requests.get(f"http://127.0.0.1:{port}/ari").json()["updates"] - updates_before
+    if first.json().get("created") == 0 or 0 < delta <= 3:
+        log_test("Channel Delta Push", True, f"{delta} ranges sent after the booking")
+    else:
+        log_test("Channel Delta Push", False, f"Expected at most 3 ranges, got {delta}")
+    
+    deliver_reservations(API_URL, channel_id, "ota-secret", [{**reservations[0], "status": "cancelled"}])
+    requests.put(f"{API_URL}/channels/{channel_id}", json={
+        "name": "Mock OTA", "endpoint_url": f"http://127.0.0.1:{port}", "api_key": "ota-secret", "active": False
+    }, headers=headers)
+    ota.should_exit = True
+
+def test_guest_profile(token):
+    """Test that a completed stay shows up in the guest's profile"""
+    print("\n=== Testing Guest Profile ===")
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    rooms = requests.get(f"{API_URL}/rooms").json()
+    if not rooms:
+        log_test("Guest Profile", False, "No rooms available")
+        return
+    response = requests.post(f"{API_URL}/bookings", json={
+        "room_id": rooms[-1]["room_id"], "guest_name": "Profile Guest", "guest_email": "profile@example.com",
+        "check_in": (datetime.now() + timedelta(days=340)).strftime("%Y-%m-%d"),
+        "check_out": (datetime.now() + timedelta(days=343)).strftime("%Y-%m-%d")
+    })
+    if response.status_code != 200:
+        log_test("Guest Profile", False, 
+                f"Failed to create booking. Status: {response.status_code}, Response: {response.text}")
+        return
+    booking = response.json()
+    for booking_status in ("checked_in", "checked_out"):
+        requests.put(f"{API_URL}/bookings/{booking['booking_id']}/status", json={"status": booking_status}, headers=headers)
+    time.sleep(2)
+    
+    profile = requests.get(f"{API_URL}/guests/{booking['guest_id']}/profile", headers=headers).json()
+    if profile.get("stays", 0) >= 1 and profile["nights"] >= 3 and profile["total_spend"] > 0:
+        log_test("Guest Profile", True, f"{profile['stays']} stays, {profile['nights']} nights, spend {profile['total_spend']}")
+    else:
+        log_test("Guest Profile", False, f"Unexpected profile: {profile}")
+    
+    response = requests.post(f"{API_URL}/guests/profiles/rebuild", headers=headers)
+    time.sleep(2)
+    job = requests.get(f"{API_URL}/jobs/{response.json()['job_id']}", headers=headers).json()
+    rebuilt = requests.get(f"{API_URL}/guests/{booking['guest_id']}/profile", headers=headers).json()
+    if job["status"] == "succeeded" and rebuilt["stays"] == profile["stays"] and rebuilt["nights"] == profile["nights"]:
+        log_test("Guest Profile Rebuild", True, f"{job['result']['profiles']} profiles rebuilt")
+    else:
+        log_test("Guest Profile Rebuild", False, f"Job: {job}, rebuilt profile: {rebuilt}")
+
 def print_summary():
     """Print test summary"""
     print("\n=== Test Summary ===")
@@ -303,9 +697,28 @@ def main():
     # Test booking system
     booking_id = test_booking_system(room_id, guest_id)
     
+    # Test group bookings
+    test_group_booking(token)
+    
     # Test dashboard statistics
     test_dashboard_statistics()
     
+    # Test rate quotes
+    test_rate_quote()
+    
+    # Test background job queue
+    test_job_queue(token)
+    test_archive(token)
+    test_housekeeping(token)
+    test_delta_sync(token)
+    test_audit_log(token)
+    test_reports(token)
+    test_invoices(token)
+    test_waitlist(token)
+    test_room_optimizer(token)
+    test_channels(token)
+    test_guest_profile(token)
+    
     # Print summary
     print_summary()
 
@@ -4,6 +4,22 @@ import axios from "axios";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const SYNC_CACHE_KEY = 'hotel_sync_cache';
+const SYNC_ID_FIELDS = { rooms: 'room_id', guests: 'guest_id', bookings: 'booking_id' };
+
+// Merge a /sync response into the locally cached rooms, guests and bookings
+const applySync = (cache, delta) => {
+  const next = { version: delta.version };
+  Object.entries(SYNC_ID_FIELDS).forEach(([collection, idField]) => {
+    const byId = delta.full ? {} : { ...cache[collection] };
+    delta[collection].forEach((doc) => { byId[doc[idField]] = doc; });
+    delta.deleted
+      .filter((tombstone) => tombstone.collection === collection)
+      .forEach((tombstone) => { delete byId[tombstone.document_id]; });
+    next[collection] = byId;
+  });
+  return next;
+};
 
 const App = () => {
   const [currentView, setCurrentView] = useState('dashboard');
@@ -94,13 +110,35 @@ const App = () => {
     }
   }, []);
 
+  const syncData = async () => {
+    let cache = null;
+    try {
+      cache = JSON.parse(localStorage.getItem(SYNC_CACHE_KEY));
+    } catch (error) {
+      cache = null;
+    }
+    const since = cache ? cache.version : 0;
+    const response = await axios.get(`${API}/sync`, { params: { since } });
+    const next = applySync(cache || {}, response.data);
+    try {
+      localStorage.setItem(SYNC_CACHE_KEY, JSON.stringify(next));
+    } catch (error) {
+      // Storage full: keep working from memory and do a full sync next time
+      localStorage.removeItem(SYNC_CACHE_KEY);
+    }
+    return next;
+  };
+
   const loadDashboardData = async () => {
     try {
       const statsRes = await axios.get(`${API}/dashboard/stats`);
       setDashboardStats(statsRes.data);
       
-      const roomsRes = await axios.get(`${API}/rooms`);
-      setRooms(roomsRes.data);
+      // Rooms, guests and bookings arrive as deltas against the local cache
+      const synced = await syncData();
+      setRooms(Object.values(synced.rooms));
+      setGuests(Object.values(synced.guests));
+      setBookings(Object.values(synced.bookings));
       
       const settingsRes = await axios.get(`${API}/settings`);
       setSettings(settingsRes.data);
@@ -108,12 +146,6 @@ const App = () => {
       const roomStatusRes = await axios.get(`${API}/dashboard/room-status`);
       setRoomStatuses(roomStatusRes.data);
       
-      const guestsRes = await axios.get(`${API}/guests`);
-      setGuests(guestsRes.data);
-      
-      const bookingsRes = await axios.get(`${API}/bookings`);
-      setBookings(bookingsRes.data);
-      
       const expensesRes = await axios.get(`${API}/expenses`);
       setExpenses(expensesRes.data);
       
@@ -145,6 +177,7 @@ const App = () => {
 
   const handleLogout = () => {
     localStorage.removeItem('hotel_token');
+    localStorage.removeItem(SYNC_CACHE_KEY);
     setIsAuthenticated(false);
     setAdminData(null);
     delete axios.defaults.headers.common['Authorization'];
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""Generate a realistic multi-year workload for one property.
+
+    python generate_hotel_data.py --rooms 200 --years 3 --seed 42 --drop
+
+Writes rooms, guests, bookings with their room-night claims, folios and
+folio entries, sales and expenses, shaped like the documents the API
+writes. The same --seed and --as-of always produce the same documents.
+
+Bookings are simulated room by room from --years before --as-of until
+FORWARD_DAYS after it. Occupancy follows a yearly season peaking mid
+January plus a weekend lift. Lead times are exponential and longer in
+high season. Some bookings are walk-ins, made on the day of arrival.
+Others are cancelled, which frees the room again, or end as no-shows.
+Bookings are only kept if they were made by --as-of. Their status
+(confirmed, checked_in, checked_out) follows from --as-of.
+
+Documents are buffered per collection and written with insert_many, up to
+--workers batches in flight. Indexes are created after loading, and guest
+profiles are rebuilt at the end unless --no-profiles is given.
+"""
+import argparse
+import asyncio
+import itertools
+import math
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+load_dotenv(BACKEND_DIR / ".env")
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server  # noqa: E402
+
+# room_type: (share of rooms, price per night, max occupancy)
+ROOM_TYPES = {
+    "single": (0.20, 7000.0, 1),
+    "double": (0.45, 9000.0, 2),
+    "triple": (0.20, 12000.0, 3),
+    "suite": (0.15, 20000.0, 4),
+}
+ROOMS_PER_FLOOR = 20
+FORWARD_DAYS = 180
+PEAK_DAY_OF_YEAR = 15
+MAX_STAY = 21
+PAYMENT_METHODS = ["cash", "card", "card", "bank_transfer"]
+FIRST_NAMES = ["Amaya", "Nimal", "Kasun", "Ishara", "Dilini", "Ravi", "Sanduni", "Tharindu", "Emma", "Liam",
+               "Olivia", "Noah", "Mia", "Lucas", "Sofia", "Arjun", "Priya", "Chen", "Yuki", "Hannah"]
+LAST_NAMES = ["Perera", "Fernando", "Silva", "Jayawardena", "Bandara", "Smith", "Mueller", "Rossi", "Kumar",
+              "Tanaka", "Wang", "Garcia", "Brown", "Wilson", "Dubois", "Nielsen"]
+GENERATED_COLLECTIONS = ["rooms", "guests", "bookings", "room_nights", "folios", "folio_entries", "sales", "expenses"]
+
+
+def new_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def midnight(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def season(day: date) -> float:
+    """1.0 at the peak of the year, -1.0 half a year later."""
+    return math.cos(2 * math.pi * (day.timetuple().tm_yday - PEAK_DAY_OF_YEAR) / 365.25)
+
+
+class Workload:
+    """Deterministic document generator for one property."""
+
+    def __init__(self, args):
+        self.args = args
+        self.as_of = args.as_of
+        self.start = args.as_of - timedelta(days=round(365.25 * args.years))
+        self.end = args.as_of + timedelta(days=FORWARD_DAYS)
+        self.versions = itertools.count(1)
+        # Occupied rooms per day of the range, used to scale expenses
+        self.occupied = [0] * (self.end - self.start).days
+
+    def occupancy(self, day: date) -> float:
+        weekend = 0.08 if day.weekday() in (4, 5) else 0.0
+        return min(0.98, max(0.05, self.args.occupancy + self.args.seasonality * season(day) + weekend))
+
+    def rooms(self) -> list:
+        rng = random.Random(f"{self.args.seed}:rooms")
+        types = list(ROOM_TYPES)
+        rooms = []
+        for index in range(self.args.rooms):
+            room_type = rng.choices(types, weights=[ROOM_TYPES[t][0] for t in types])[0]
+            _, price, max_occupancy = ROOM_TYPES[room_type]
+            rooms.append({
+                "room_id": new_id(rng),
+                "room_number": f"{1 + index // ROOMS_PER_FLOOR}{index % ROOMS_PER_FLOOR + 1:02d}",
+                "room_type": room_type,
+                "price_per_night": price,
+                "amenities": ["WiFi", "TV", "AC"] + (["Mini Bar", "Bathtub"] if room_type == "suite" else []),
+                "status": "available",
+                "max_occupancy": max_occupancy,
+                "description": f"Generated {room_type} room",
+                "created_at": midnight(self.start),
+                "change_version": next(self.versions),
+            })
+        return rooms
+
+    def guests(self) -> list:
+        rng = random.Random(f"{self.args.seed}:guests")
+        guests = []
+        for number in range(self.args.guests):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            guests.append({
+                "guest_id": new_id(rng),
+                "name": f"{first} {last}",
+                "email": f"{first.lower()}.{last.lower()}{number}@example.com",
+                "phone": f"+94 7{rng.randrange(10 ** 8):08d}",
+                "address": f"{rng.randint(1, 400)} Galle Road, Colombo",
+                "id_proof": f"NIC{rng.randrange(10 ** 9):09d}",
+                "created_at": midnight(self.start),
+                "change_version": next(self.versions),
+            })
+        return guests
+
+    def stay_length(self, rng: random.Random) -> int:
+        # Geometric with mean --mean-stay
+        if self.args.mean_stay <= 1:
+            return 1
+        return min(MAX_STAY, 1 + int(rng.expovariate(-math.log(1 - 1 / self.args.mean_stay))))
+
+    def lead_days(self, rng: random.Random, check_in: date) -> int:
+        if rng.random() < self.args.walk_in_rate:
+            return 0
+        # Peak season sells further ahead
+        mean = self.args.mean_lead_days * (1 + 0.5 * season(check_in))
+        return max(1, int(rng.expovariate(1 / mean)))
+
+    def room_bookings(self, index: int, room: dict, guests: list) -> dict:
+        """Bookings of one room over the whole range and the documents that follow from them."""
+        args = self.args
+        rng = random.Random(f"{args.seed}:room:{index}")
+        documents = {"bookings": [], "room_nights": [], "folios": [], "folio_entries": [], "sales": []}
+        mean_stay = args.mean_stay
+        day = self.start
+        while day < self.end:
+            occupancy = self.occupancy(day)
+            # Chance that a free night starts a stay, so that occupied nights approach the target
+            if rng.random() >= occupancy / (occupancy + mean_stay * (1 - occupancy)):
+                day += timedelta(days=1)
+                continue
+            nights = min(self.stay_length(rng), (self.end - day).days)
+            lead = self.lead_days(rng, day)
+            created_at = midnight(day - timedelta(days=lead)) + timedelta(minutes=rng.randrange(24 * 60))
+            if lead == 0:
+                created_at = midnight(day) + timedelta(hours=rng.randint(10, 22))
+            if created_at.date() > self.as_of:
+                # Not booked yet
+                day += timedelta(days=1)
+                continue
+            check_out = day + timedelta(days=nights)
+            # Long lead bookings are cancelled more often; the cancelled night is offered again
+            cancel_chance = args.cancel_rate * min(2.5, 0.5 + lead / args.mean_lead_days) if lead else 0.0
+            if rng.random() < cancel_chance:
+                cancelled_at = created_at + (midnight(day) - created_at) * rng.random()
+                if cancelled_at.date() <= self.as_of:
+                    self.add_booking(documents, rng, room, guests, day, check_out, created_at, lead, "cancelled")
+                    continue
+            if check_out <= self.as_of:
+                status = "no_show" if rng.random() < args.no_show_rate else "checked_out"
+            elif day <= self.as_of:
+                status = "checked_in"
+                room["status"] = "occupied"
+            else:
+                status = "confirmed"
+            self.add_booking(documents, rng, room, guests, day, check_out, created_at, lead, status)
+            if status != "no_show":
+                for offset in range(nights):
+                    self.occupied[(day - self.start).days + offset] += 1
+            day = check_out
+        return documents
+
+    def add_booking(self, documents: dict, rng: random.Random, room: dict, guests: list, check_in: date,
+                    check_out: date, created_at: datetime, lead: int, status: str):
+        nights = (check_out - check_in).days
+        # Repeat guests: early guests in the pool are drawn far more often
+        guest = guests[int(len(guests) * rng.random() ** 2)]
+        total_amount = round(room["price_per_night"] * nights * (1 + 0.25 * season(check_in)), 2)
+        advance_payment = round(total_amount * 0.2, 2) if lead and rng.random() < 0.3 else 0.0
+        payment_method = rng.choice(PAYMENT_METHODS)
+        booking = {
+            "booking_id": new_id(rng),
+            "room_id": room["room_id"],
+            "guest_id": guest["guest_id"],
+            "check_in": midnight(check_in),
+            "check_out": midnight(check_out),
+            "total_amount": total_amount,
+            "advance_payment": advance_payment,
+            "status": status,
+            "guests_count": rng.randint(1, room["max_occupancy"]),
+            "special_requests": "Walk-in" if lead == 0 else "",
+            "group_id": None,
+            "created_at": created_at,
+            "change_version": next(self.versions),
+        }
+        documents["bookings"].append(booking)
+        if status in server.ACTIVE_BOOKING_STATUSES:
+            documents["room_nights"].extend(
+                {"room_id": room["room_id"], "night": night, "booking_id": booking["booking_id"]}
+                for night in server.stay_nights(booking["check_in"], booking["check_out"])
+            )
+
+        # The room is sold when the booking is made, as in place_booking
+        entries = []
+        balance = 0.0
+
+        def post(entry_type, category, amount, method, description, at):
+            nonlocal balance
+            balance = round(balance + (amount if entry_type == "charge" else -amount), 2)
+            entries.append({
+                "entry_id": new_id(rng), "booking_id": booking["booking_id"], "sequence": len(entries) + 1,
+                "entry_type": entry_type, "category": category, "amount": amount, "payment_method": method,
+                "description": description, "balance_after": balance, "created_at": at,
+            })
+
+        post("charge", "room", total_amount, "", "Room charges", created_at)
+        documents["sales"].append(self.sale(rng, booking, total_amount, payment_method, check_in, "room", created_at))
+        if advance_payment:
+            post("payment", "advance", advance_payment, "cash", "Advance payment", created_at)
+        if status in ("checked_in", "checked_out") and rng.random() < 0.35:
+            charged_on = check_in + timedelta(days=rng.randrange(nights))
+            if charged_on <= self.as_of:
+                amount = float(rng.randint(5, 120) * 100)
+                post("charge", "additional", amount, payment_method, "Restaurant and minibar", midnight(charged_on))
+                documents["sales"].append(
+                    self.sale(rng, booking, amount, payment_method, charged_on, "additional", midnight(charged_on))
+                )
+        if status == "checked_out" and balance > 0:
+            post("payment", "settlement", balance, payment_method, "Settlement at check-out", midnight(check_out))
+
+        charges = [entry for entry in entries if entry["entry_type"] == "charge"]
+        documents["folio_entries"].extend(entries)
+        documents["folios"].append({
+            "booking_id": booking["booking_id"],
+            "room_charges": total_amount,
+            "additional_charges": sum(entry["amount"] for entry in charges if entry["category"] == "additional"),
+            "charges_total": round(sum(entry["amount"] for entry in charges), 2),
+            "payments_total": round(sum(entry["amount"] for entry in entries if entry["entry_type"] == "payment"), 2),
+            "balance": balance,
+            "entry_count": len(entries),
+            "updated_at": entries[-1]["created_at"],
+        })
+
+    def sale(self, rng, booking: dict, amount: float, payment_method: str, sale_date: date, kind: str,
+             created_at: datetime) -> dict:
+        return {
+            "sale_id": new_id(rng), "booking_id": booking["booking_id"], "amount": amount,
+            "payment_method": payment_method, "date": midnight(sale_date), "kind": kind, "created_at": created_at,
+        }
+
+    def expenses(self) -> list:
+        """Monthly fixed costs plus running costs that follow occupancy, up to --as-of."""
+        rng = random.Random(f"{self.args.seed}:expenses")
+        rooms = self.args.rooms
+        expenses = []
+
+        def expense(category, amount, description, day):
+            expenses.append({
+                "expense_id": new_id(rng), "category": category, "amount": round(amount, 2),
+                "description": description, "date": midnight(day), "created_by": "generator",
+                "created_at": midnight(day) + timedelta(hours=rng.randint(8, 18)),
+            })
+
+        day = self.start
+        while day <= self.as_of:
+            occupied = self.occupied[(day - self.start).days]
+            if day.day == 1:
+                expense("salaries", rooms * 6000 * rng.uniform(0.97, 1.03), "Monthly payroll", day)
+                expense("utilities", rooms * 1500 * (1.1 + 0.2 * season(day)) * rng.uniform(0.9, 1.1),
+                        "Electricity and water", day)
+            if occupied:
+                expense("food_beverage", occupied * rng.uniform(800, 1400), "Kitchen purchases", day)
+            if day.weekday() == 0:
+                expense("supplies", max(1, occupied) * 7 * rng.uniform(100, 200), "Linen and amenities", day)
+            if rng.random() < 0.15:
+                expense("maintenance", rng.randint(20, 500) * 100, "Repairs", day)
+            day += timedelta(days=1)
+        return expenses
+
+
+class BulkLoader:
+    """Writes documents to a property's collections with concurrent insert_many batches."""
+
+    def __init__(self, database, property_id: str, batch_size: int, workers: int):
+        self.database = database
+        self.property_id = property_id
+        self.batch_size = batch_size
+        self.slots = asyncio.Semaphore(workers)
+        self.pending = {}
+        self.inserts = set()
+        self.counts = Counter()
+
+    async def insert(self, name: str, batch: list):
+        try:
+            await self.database[name].insert_many(batch, ordered=False)
+        finally:
+            self.slots.release()
+
+    async def send(self, name: str, batch: list):
+        await self.slots.acquire()
+        task = asyncio.create_task(self.insert(name, batch))
+        self.inserts.add(task)
+        task.add_done_callback(self.inserts.discard)
+
+    async def extend(self, name: str, documents: list):
+        pending = self.pending.setdefault(name, [])
+        for document in documents:
+            document["property_id"] = self.property_id
+        pending.extend(documents)
+        self.counts[name] += len(documents)
+        while len(pending) >= self.batch_size:
+            await self.send(name, pending[:self.batch_size])
+            del pending[:self.batch_size]
+
+    async def flush(self):
+        for name, pending in self.pending.items():
+            if pending:
+                await self.send(name, pending)
+        self.pending = {}
+        # Surface the first failed insert
+        while self.inserts:
+            await asyncio.gather(*list(self.inserts))
+
+
+async def generate(database, args) -> Counter:
+    """Generate and insert the workload; returns documents written per collection."""
+    if args.drop:
+        for name in GENERATED_COLLECTIONS:
+            await database[name].delete_many({"property_id": args.property})
+    workload = Workload(args)
+    loader = BulkLoader(database, args.property, args.batch_size, args.workers)
+    rooms = workload.rooms()
+    guests = workload.guests()
+    await loader.extend("guests", guests)
+    for index, room in enumerate(rooms):
+        for name, documents in workload.room_bookings(index, room, guests).items():
+            await loader.extend(name, documents)
+        if args.progress and (index + 1) % args.progress == 0:
+            print(f"{index + 1}/{len(rooms)} rooms, {sum(loader.counts.values()):,} documents")
+    # Rooms last, so their status reflects stays in progress on --as-of
+    await loader.extend("rooms", rooms)
+    await loader.extend("expenses", workload.expenses())
+    await loader.flush()
+    # Later API writes must get change versions above the generated ones
+    await database.counters.update_one(
+        {"name": "change_version", "property_id": args.property},
+        {"$max": {"value": next(workload.versions) - 1}},
+        upsert=True
+    )
+    return loader.counts
+
+
+async def run(args):
+    database = server.tenant_router.database(args.property)
+    started = time.perf_counter()
+    counts = await generate(database, args)
+    elapsed = time.perf_counter() - started
+    for name, count in sorted(counts.items()):
+        print(f"{name:<16} {count:>12,}")
+    total = sum(counts.values())
+    print(f"{total:,} documents in {elapsed:.1f}s ({total / elapsed:,.0f}/s)")
+
+    started = time.perf_counter()
+    await server.ensure_indexes()
+    print(f"Indexes built in {time.perf_counter() - started:.1f}s")
+    if args.profiles:
+        server.current_property.set(args.property)
+        started = time.perf_counter()
+        await server.rebuild_guest_profiles_job({})
+        print(f"Guest profiles rebuilt in {time.perf_counter() - started:.1f}s")
+    server.tenant_router.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--property", default=server.DEFAULT_PROPERTY_ID)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--years", type=float, default=3.0)
+    parser.add_argument("--guests", type=int, help="guest pool size (default: 25 per room and year)")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=date.today(),
+                        help="the generated 'today' (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--occupancy", type=float, default=0.7, help="average share of rooms sold per night")
+    parser.add_argument("--seasonality", type=float, default=0.18,
+                        help="occupancy swing between peak and low season")
+    parser.add_argument("--mean-stay", type=float, default=2.5)
+    parser.add_argument("--mean-lead-days", type=float, default=24.0)
+    parser.add_argument("--cancel-rate", type=float, default=0.12)
+    parser.add_argument("--no-show-rate", type=float, default=0.02)
+    parser.add_argument("--walk-in-rate", type=float, default=0.08)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=8, help="insert_many batches in flight")
+    parser.add_argument("--progress", type=int, default=100, help="report every N rooms (0: never)")
+    parser.add_argument("--drop", action="store_true",
+                        help="delete the property's generated collections first")
+    parser.add_argument("--no-profiles", dest="profiles", action="store_false",
+                        help="skip rebuilding guest profiles")
+    args = parser.parse_args()
+    if args.guests is None:
+        args.guests = max(50, int(args.rooms * args.years * 25))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
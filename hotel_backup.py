@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""Back up and restore one property's documents.
+
+    python hotel_backup.py backup --property default --out backups/2024-06-01
+    python hotel_backup.py restore backups/2024-06-01 --drop
+
+A backup is a directory with one gzip-compressed file per collection
+(<collection>.bson.gz, or <collection>.ndjson.gz with --format ndjson) and
+a manifest.json listing document counts and index definitions.
+
+Collections are dumped in parallel. Each dump pipes cursor batches to a
+thread that compresses and writes them, so memory stays bounded by
+--workers x (--batch-size + two --chunk-mb chunks) whatever the size of
+the collection. On a replica set every collection is read at one cluster
+time with readConcern "snapshot" (MongoDB 5.0+), giving a point-in-time
+consistent backup; a standalone server is read without a snapshot. Backups
+longer than the server's minSnapshotHistoryWindowInSeconds (300 by
+default) need that window raised.
+
+Restore inserts unordered insert_many batches, up to --workers at a time.
+Collections that are empty before loading lose their secondary indexes
+while loading and get the backed-up indexes rebuilt afterwards. Restoring
+with --property other than the backed-up one clones the documents into
+that property; the API serves it only once it is listed in TENANT_ROUTES
+(an empty route keeps it in the default database). Restart the API
+afterwards, since its caches do not see the restored documents.
+"""
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import bson
+from bson import json_util
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+load_dotenv(BACKEND_DIR / ".env")
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server  # noqa: E402
+
+FORMATS = ["bson", "ndjson"]
+MANIFEST = "manifest.json"
+# Index options that describe the index rather than configure it
+INDEX_INFO_KEYS = {"key", "v", "ns"}
+
+
+def print_throughput(label, documents, size, elapsed):
+    elapsed = max(elapsed, 1e-9)
+    print(f"{label:<24} {documents:>11,} docs {size / 2 ** 20:>9.1f} MB {elapsed:>8.2f}s "
+          f"{documents / elapsed:>10,.0f} docs/s {size / 2 ** 20 / elapsed:>7.1f} MB/s")
+
+
+def encode(document: dict, fmt: str) -> bytes:
+    if fmt == "bson":
+        return bson.encode(document)
+    return (json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n").encode()
+
+
+def decode(source, fmt: str):
+    if fmt == "bson":
+        return bson.decode_file_iter(source)
+    return (json_util.loads(line) for line in source)
+
+
+def take(documents, count: int) -> list:
+    return list(itertools.islice(documents, count))
+
+
+async def snapshot_time(database):
+    """Cluster time to read every collection at, or None on a standalone server."""
+    reply = await database.command("ping")
+    return reply.get("operationTime")
+
+
+async def read_batches(database, name: str, filter: dict, batch_size: int, at=None):
+    """Yield the matching documents of a collection, batch by batch."""
+    if at is None:
+        cursor = database[name].find(filter, batch_size=batch_size)
+        while batch := await cursor.to_list(batch_size):
+            yield batch
+        return
+    # getMore must run in the session that opened the cursor
+    async with await database.client.start_session(causal_consistency=False) as session:
+        reply = await database.command({
+            "find": name, "filter": filter, "batchSize": batch_size,
+            "readConcern": {"level": "snapshot", "atClusterTime": at}
+        }, session=session)
+        yield reply["cursor"]["firstBatch"]
+        while reply["cursor"]["id"]:
+            reply = await database.command({
+                "getMore": reply["cursor"]["id"], "collection": name, "batchSize": batch_size
+            }, session=session)
+            yield reply["cursor"]["nextBatch"]
+
+
+async def dump_collection(database, name: str, property_id: str, path: Path, args, at) -> dict:
+    """Stream one collection into a compressed file; compression runs in a thread."""
+    chunks = asyncio.Queue(maxsize=2)
+    chunk_bytes = int(args.chunk_mb * 2 ** 20)
+    documents = 0
+
+    async def read():
+        nonlocal documents
+        buffer = bytearray()
+        try:
+            async for batch in read_batches(database, name, {"property_id": property_id}, args.batch_size, at):
+                for document in batch:
+                    buffer += encode(document, args.format)
+                documents += len(batch)
+                if len(buffer) >= chunk_bytes:
+                    await chunks.put(bytes(buffer))
+                    buffer.clear()
+            await chunks.put(bytes(buffer))
+        finally:
+            await chunks.put(None)
+
+    async def write():
+        with gzip.open(path, "wb", compresslevel=args.compress_level) as target:
+            while (chunk := await chunks.get()) is not None:
+                await asyncio.to_thread(target.write, chunk)
+
+    started = time.perf_counter()
+    await asyncio.gather(read(), write())
+    elapsed = time.perf_counter() - started
+    indexes = await database[name].index_information()
+    return {
+        "file": path.name,
+        "documents": documents,
+        "bytes": path.stat().st_size,
+        "seconds": round(elapsed, 3),
+        "indexes": [{**info, "name": index_name} for index_name, info in indexes.items() if index_name != "_id_"],
+    }
+
+
+async def backup_property(database, property_id: str, out_dir: Path, args) -> dict:
+    """Dump every collection of a property and write the manifest."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = sorted(
+        name for name in await database.list_collection_names()
+        if not name.startswith("system.") and name not in server.GLOBAL_COLLECTIONS
+    )
+    at = await snapshot_time(database) if args.snapshot else None
+    if args.snapshot and at is None:
+        print("Server has no cluster time (standalone?); reading without a snapshot")
+
+    slots = asyncio.Semaphore(args.workers)
+
+    async def dump(name):
+        async with slots:
+            result = await dump_collection(database, name, property_id, out_dir / f"{name}.{args.format}.gz", args, at)
+            print_throughput(name, result["documents"], result["bytes"], result["seconds"])
+            return name, result
+
+    started = time.perf_counter()
+    collections = dict(await asyncio.gather(*[dump(name) for name in names]))
+    elapsed = time.perf_counter() - started
+    manifest = {
+        "property_id": property_id,
+        "format": args.format,
+        "created_at": datetime.utcnow(),
+        "cluster_time": at,
+        "collections": collections,
+    }
+    (out_dir / MANIFEST).write_text(json_util.dumps(manifest, indent=2, json_options=json_util.RELAXED_JSON_OPTIONS))
+    print_throughput("total", sum(c["documents"] for c in collections.values()),
+                     sum(c["bytes"] for c in collections.values()), elapsed)
+    return manifest
+
+
+def index_models(indexes: list) -> list:
+    return [
+        server.pymongo.IndexModel(
+            [tuple(key) for key in info["key"]],
+            **{option: value for option, value in info.items() if option not in INDEX_INFO_KEYS}
+        )
+        for info in indexes
+    ]
+
+
+async def load_collection(database, name: str, entry: dict, in_dir: Path, fmt: str,
+                          source_property: str, property_id: str, args, slots) -> int:
+    """Insert one collection's backup in batches; up to --workers batches are in flight."""
+    collection = database[name]
+    if args.drop:
+        await collection.delete_many({"property_id": property_id})
+    # Loading without secondary indexes and building them once is much faster
+    rebuild = await collection.estimated_document_count() == 0
+    if rebuild:
+        await collection.drop_indexes()
+
+    async def insert(batch):
+        try:
+            await collection.insert_many(batch, ordered=False, bypass_document_validation=True)
+        finally:
+            slots.release()
+
+    inserts = set()
+    documents = 0
+    with gzip.open(in_dir / entry["file"], "rb") as source:
+        reader = decode(source, fmt)
+        while batch := await asyncio.to_thread(take, reader, args.batch_size):
+            if property_id != source_property:
+                for document in batch:
+                    document.pop("_id", None)
+                    document["property_id"] = property_id
+            documents += len(batch)
+            await slots.acquire()
+            task = asyncio.create_task(insert(batch))
+            inserts.add(task)
+            task.add_done_callback(inserts.discard)
+    await asyncio.gather(*inserts)
+
+    if rebuild and entry["indexes"]:
+        await collection.create_indexes(index_models(entry["indexes"]))
+    return documents
+
+
+async def restore_property(database, in_dir: Path, property_id, args) -> dict:
+    """Load a backup directory into a property; returns documents per collection."""
+    manifest = json_util.loads((in_dir / MANIFEST).read_text())
+    source_property = manifest["property_id"]
+    property_id = property_id or source_property
+    slots = asyncio.Semaphore(args.workers)
+    loading = asyncio.Semaphore(args.workers)
+
+    async def load(name, entry):
+        async with loading:
+            started = time.perf_counter()
+            documents = await load_collection(
+                database, name, entry, in_dir, manifest["format"], source_property, property_id, args, slots
+            )
+            print_throughput(name, documents, (in_dir / entry["file"]).stat().st_size,
+                             time.perf_counter() - started)
+            return name, documents
+
+    started = time.perf_counter()
+    restored = dict(await asyncio.gather(*[load(name, entry) for name, entry in manifest["collections"].items()]))
+    elapsed = time.perf_counter() - started
+    print_throughput("total", sum(restored.values()),
+                     sum((in_dir / entry["file"]).stat().st_size for entry in manifest["collections"].values()),
+                     elapsed)
+    return restored
+
+
+async def run_backup(args):
+    database = server.tenant_router.database(args.property)
+    await backup_property(database, args.property, Path(args.out), args)
+    server.tenant_router.close()
+
+
+async def run_restore(args):
+    property_id = args.property or json.loads((Path(args.path) / MANIFEST).read_text())["property_id"]
+    database = server.tenant_router.database(property_id)
+    await restore_property(database, Path(args.path), property_id, args)
+    server.tenant_router.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(required=True)
+
+    backup = subparsers.add_parser("backup", help="dump a property to a backup directory")
+    backup.add_argument("--property", default=server.DEFAULT_PROPERTY_ID)
+    backup.add_argument("--out", required=True)
+    backup.add_argument("--format", default="bson", choices=FORMATS)
+    backup.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                        help="collections dumped at the same time")
+    backup.add_argument("--batch-size", type=int, default=1000)
+    backup.add_argument("--chunk-mb", type=float, default=4.0,
+                        help="encoded data handed to the compressor at a time")
+    backup.add_argument("--compress-level", type=int, default=6)
+    backup.add_argument("--no-snapshot", dest="snapshot", action="store_false",
+                        help="read each collection as of its own start")
+    backup.set_defaults(func=run_backup)
+
+    restore = subparsers.add_parser("restore", help="load a backup directory into a property")
+    restore.add_argument("path")
+    restore.add_argument("--property", help="target property (default: the backed-up one)")
+    restore.add_argument("--drop", action="store_true",
+                         help="delete the property's existing documents first")
+    restore.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                         help="insert_many batches in flight")
+    restore.add_argument("--batch-size", type=int, default=1000)
+    restore.set_defaults(func=run_restore)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -34,8 +34,9 @@ async def initialize_rooms():
     ]
     
     # Create rooms
+    rooms = []
     for room_data in rooms_data:
-        room = {
+        rooms.append({
             "room_id": str(uuid.uuid4()),
             "room_number": room_data["room_number"],
             "room_type": room_data["room_type"],
@@ -45,10 +46,9 @@ async def initialize_rooms():
             "max_occupancy": room_data["max_occupancy"],
             "description": f"Comfortable {room_data['room_type']} room with modern amenities",
             "created_at": datetime.utcnow()
-        }
-        
-        await db.rooms.insert_one(room)
+        })
         print(f"Created room {room_data['room_number']} - {room_data['room_type']} - LKR {room_data['price_per_night']}")
+    await db.rooms.insert_many(rooms)
     
     # Initialize default settings with LKR currency
     existing_settings = await db.settings.find_one()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Mock OTA for testing the channel manager without a real channel.
+
+It accepts availability and rate pushes on POST /ari, keeps the resulting
+inventory per room code and night, and counts pushes and updates so tests
+can check that deltas are coalesced. deliver_reservations() plays the
+OTA's side of the inbound flow.
+
+    python mock_ota_server.py --port 8002 --api-key secret
+"""
+import argparse
+import threading
+import time
+from datetime import date, timedelta
+
+import requests
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException
+
+
+def create_app(api_key: str = "") -> FastAPI:
+    app = FastAPI(title="Mock OTA")
+    app.state.inventory = {}
+    app.state.pushes = 0
+    app.state.updates = 0
+
+    @app.post("/ari")
+    async def receive_ari(payload: dict, authorization: str = Header("")):
+        if authorization != f"Bearer {api_key}":
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        app.state.pushes += 1
+        app.state.updates += len(payload["updates"])
+        for update in payload["updates"]:
+            night = date.fromisoformat(update["start"])
+            while night < date.fromisoformat(update["end"]):
+                app.state.inventory.setdefault(update["room_code"], {})[night.isoformat()] = {
+                    "available": update["available"], "rate": update["rate"]
+                }
+                night += timedelta(days=1)
+        return {"accepted": len(payload["updates"])}
+
+    @app.get("/ari")
+    async def get_ari():
+        return {"pushes": app.state.pushes, "updates": app.state.updates, "inventory": app.state.inventory}
+
+    return app
+
+
+def start_mock_ota(port: int, api_key: str = "") -> uvicorn.Server:
+    """Serve the mock OTA from a background thread; call server.should_exit = True to stop it."""
+    server = uvicorn.Server(uvicorn.Config(create_app(api_key), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def deliver_reservations(api_url: str, channel_id: str, api_key: str, reservations: list) -> requests.Response:
+    """Send a batch of reservations to the hotel the way the OTA would."""
+    return requests.post(
+        f"{api_url}/channels/{channel_id}/reservations",
+        json={"reservations": reservations},
+        headers={"X-Channel-Key": api_key}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--api-key", default="")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.api_key), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import server  # noqa: E402
+
+ADMIN = {"username": "tester", "password": "tester123"}
+
+
+class ApiClient(server.httpx.AsyncClient):
+    """ASGI client for the app, sending an admin's bearer token with every request."""
+
+    async def add_room(self, room_number: str, room_type: str = "double", price_per_night: float = 100.0) -> dict:
+        response = await self.post("/api/rooms", json={
+            "room_number": room_number, "room_type": room_type, "price_per_night": price_per_night,
+            "amenities": [], "max_occupancy": 2, "description": ""
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+
+
+@pytest.fixture
+def app_database(monkeypatch):
+    """Point the app at a database with empty in-process state and no rate limits.
+
+    Returns connect(client=None, db_name=None); client defaults to a fresh
+    mongomock client. Every change is undone when the test ends.
+    """
+    def connect(client=None, db_name=None):
+        if client is None:
+            mongomock_motor = pytest.importorskip("mongomock_motor")
+            client = mongomock_motor.AsyncMongoMockClient()
+        monkeypatch.setattr(server.tenant_router, "clients", {server.tenant_router.default_url: client})
+        if db_name is not None:
+            monkeypatch.setattr(server.tenant_router, "default_db_name", db_name)
+        monkeypatch.setattr(server.tenant_router, "collections", {})
+        for value in vars(server).values():
+            if isinstance(value, server.PerProperty):
+                monkeypatch.setattr(value, "instances", {})
+        monkeypatch.setattr(server.report_cache, "entries", type(server.report_cache.entries)())
+        monkeypatch.setattr(server.audit_log, "events", [])
+        monkeypatch.setattr(server, "RATE_LIMITS", {})
+        monkeypatch.setattr(server, "DEFAULT_RATE_LIMIT", (1e9, 10 ** 9))
+        monkeypatch.setattr(server, "rate_limiter", server.RateLimiter())
+        return client
+
+    return connect
+
+
+@pytest.fixture
+def mock_mongo(app_database):
+    """A fresh mongomock client behind the app."""
+    return app_database()
+
+
+@pytest.fixture
+def admin_api():
+    """Factory for `async with admin_api() as client`: indexes created and a new admin logged in.
+
+    Use it inside the test's event loop, once the database is set up.
+    """
+    @asynccontextmanager
+    async def connect():
+        await server.ensure_indexes()
+        transport = server.httpx.ASGITransport(app=server.app)
+        async with ApiClient(transport=transport, base_url="http://test") as client:
+            await client.post("/api/admin/create", json=ADMIN)
+            response = await client.post("/api/admin/login", json=ADMIN)
+            client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+            yield client
+
+    return connect
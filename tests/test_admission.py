@@ -0,0 +1,28 @@
+import asyncio
+
+import server
+
+SCOPE = {"client": ("203.0.113.7", 50000)}
+
+
+def test_only_valid_tokens_get_their_own_bucket():
+    token = server.create_access_token({"sub": "admin"})
+    assert server.client_key(SCOPE, {"authorization": f"Bearer {token}"}).startswith("token:")
+    # Forged or random bearer values share the caller's IP bucket
+    for forged in ["random-1", "random-2", token[:-2] + "xx"]:
+        assert server.client_key(SCOPE, {"authorization": f"Bearer {forged}"}) == "ip:203.0.113.7"
+
+
+async def request_random_paths():
+    transport = server.httpx.ASGITransport(app=server.app, client=SCOPE["client"])
+    async with server.httpx.AsyncClient(transport=transport, base_url="http://admission") as client:
+        for number in range(20):
+            await client.get(f"/api/no-such-route-{number}")
+
+
+def test_rate_limited_metrics_are_keyed_by_limit(monkeypatch):
+    monkeypatch.setattr(server, "DEFAULT_RATE_LIMIT", (0.001, 1))
+    monkeypatch.setattr(server, "rate_limiter", server.RateLimiter())
+    monkeypatch.setattr(server, "admission_metrics", server.AdmissionMetrics())
+    asyncio.run(request_random_paths())
+    assert dict(server.admission_metrics.rate_limited) == {"default": 19}
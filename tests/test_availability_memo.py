@@ -0,0 +1,83 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+import server
+
+WEEKEND = (date(2030, 6, 7), date(2030, 6, 9))
+
+
+def test_invalidation_only_evicts_overlapping_entries_of_the_type():
+    memo = server.AvailabilityMemo(bucket_days=7)
+    keys = [
+        (date(2030, 6, 7), date(2030, 6, 9), "suite"),
+        (date(2030, 6, 7), date(2030, 6, 9), "double"),
+        (date(2030, 6, 7), date(2030, 6, 9), None),
+        (date(2030, 6, 20), date(2030, 6, 22), "suite"),
+        (date(2030, 6, 9), date(2030, 6, 12), "suite"),
+    ]
+    for key in keys:
+        memo.put(key, [], memo.generation)
+
+    # Stays are half-open, so the search starting on the 9th shares no night with the 8th
+    memo.invalidate("suite", date(2030, 6, 8), date(2030, 6, 9))
+    assert set(memo.entries) == {keys[1], keys[3], keys[4]}
+    assert memo.invalidated == 2
+    assert all(memo.buckets.values())
+    assert {key for bucket in memo.buckets.values() for key in bucket} == set(memo.entries)
+
+
+def test_search_that_raced_an_invalidation_is_not_stored():
+    memo = server.AvailabilityMemo()
+    generation = memo.generation
+    memo.invalidate(None, *WEEKEND)
+    memo.put((*WEEKEND, None), [], generation)
+    assert not memo.entries
+
+
+async def scenario(admin_api):
+    async with admin_api() as client:
+        rooms = {}
+        for room_type in ["suite", "suite", "double"]:
+            room = await client.add_room(f"{room_type}-{len(rooms)}", room_type)
+            rooms[room["room_id"]] = room_type
+
+        async def search(room_type):
+            response = await client.post("/api/rooms/availability", json={
+                "check_in": WEEKEND[0].isoformat(), "check_out": WEEKEND[1].isoformat(), "room_type": room_type
+            })
+            return len(response.json())
+
+        async def book(room_type, check_in):
+            room_id = next(room_id for room_id, kind in rooms.items() if kind == room_type)
+            response = await client.post("/api/bookings", json={
+                "room_id": room_id, "guest_name": "Memo Guest", "check_in": check_in.isoformat(),
+                "check_out": (check_in + timedelta(days=2)).isoformat()
+            })
+            assert response.status_code == 200, response.text
+
+        assert await search("suite") == 2
+        assert await search("double") == 1
+        assert await search("suite") == 2
+
+        # A later stay and a stay of another type leave the suite search cached
+        await book("suite", date(2030, 7, 1))
+        await book("double", WEEKEND[0])
+        assert await search("suite") == 2
+        assert await search("double") == 0
+        # Checking in on the day the last guest checks out does not conflict
+        await book("double", WEEKEND[1])
+
+        await book("suite", WEEKEND[0])
+        assert await search("suite") == 1
+        stats = (await client.get("/api/metrics/availability")).json()
+    return stats
+
+
+def test_bookings_invalidate_matching_searches(mock_mongo, admin_api):
+    stats = asyncio.run(scenario(admin_api))
+    assert stats["hits"] == 2
+    assert stats["misses"] == 4
+    assert stats["hit_rate"] == pytest.approx(2 / 6, abs=1e-4)
+    assert stats["invalidated"] == 2
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import hotel_backup  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+BOOKINGS = 2500
+
+
+async def seed(database, bookings=BOOKINGS):
+    await database.bookings.insert_many([
+        {"booking_id": f"b{number}", "property_id": "north", "amount": number * 1.5,
+         "nights": number % 7, "check_in": datetime(2024, 1, 1 + number % 28)}
+        for number in range(bookings)
+    ])
+    await database.bookings.insert_one({"booking_id": "other", "property_id": "south"})
+    await database.rooms.insert_many([{"room_id": f"r{n}", "property_id": "north"} for n in range(10)])
+    await database.jobs.insert_one({"job_id": "j1", "property_id": "north"})
+    await database.bookings.create_index([("property_id", 1), ("booking_id", 1)], unique=True)
+
+
+def options(**overrides):
+    defaults = {"format": "bson", "workers": 4, "batch_size": 300, "chunk_mb": 0.05,
+                "compress_level": 1, "snapshot": True, "drop": False}
+    return argparse.Namespace(**{**defaults, **overrides})
+
+
+async def documents(database, name, property_id):
+    found = await database[name].find({"property_id": property_id}, {"_id": 0}).to_list(None)
+    return sorted(found, key=lambda document: str(document))
+
+
+@pytest.mark.parametrize("fmt", hotel_backup.FORMATS)
+def test_backup_restores_documents_and_indexes(tmp_path, fmt):
+    async def run():
+        source = mongomock_motor.AsyncMongoMockClient()["source"]
+        await seed(source)
+        manifest = await hotel_backup.backup_property(source, "north", tmp_path, options(format=fmt))
+        assert manifest["collections"]["bookings"]["documents"] == BOOKINGS
+        assert "jobs" not in manifest["collections"]
+
+        target = mongomock_motor.AsyncMongoMockClient()["target"]
+        restored = await hotel_backup.restore_property(target, tmp_path, None, options())
+        assert restored == {"bookings": BOOKINGS, "rooms": 10}
+        for name in restored:
+            assert await documents(target, name, "north") == await documents(source, name, "north")
+        indexes = await target.bookings.index_information()
+        assert indexes["property_id_1_booking_id_1"]["unique"]
+
+        # Restoring again with --drop replaces the property's documents
+        await hotel_backup.restore_property(target, tmp_path, None, options(drop=True))
+        assert await target.bookings.count_documents({}) == BOOKINGS
+
+    asyncio.run(run())
+
+
+def test_restore_into_another_property_clones_documents(tmp_path):
+    async def run():
+        database = mongomock_motor.AsyncMongoMockClient()["hotel"]
+        # mongomock checks unique indexes by scanning, so keep the populated collection small
+        await seed(database, bookings=200)
+        await hotel_backup.backup_property(database, "north", tmp_path, options())
+        await hotel_backup.restore_property(database, tmp_path, "east", options())
+        assert await database.bookings.count_documents({"property_id": "east"}) == 200
+        assert await database.bookings.count_documents({"property_id": "north"}) == 200
+
+    asyncio.run(run())
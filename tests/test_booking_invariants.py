@@ -0,0 +1,234 @@
+"""Concurrency stress test for booking invariants.
+
+Drives create_booking, update_booking_status and create_expense through
+the ASGI app in concurrent waves. Every database call first yields to the
+event loop a seeded random number of times, so each seed explores a
+different, reproducible interleaving. After draining the job queue it
+checks that:
+
+- no room is double booked, and room-night claims match active bookings;
+- each booking's room and additional sales equal its folio charges, and
+  folios agree with their ledger entries;
+- occupancy (in MongoDB and in the in-process caches) never exceeds the
+  room count;
+- recorded expenses match the accepted requests.
+
+STRESS_OPERATIONS and STRESS_SEEDS size the run. STRESS_MONGO_URL runs it
+against a real MongoDB instead of mongomock. Throughput per seed is printed
+(pytest -s).
+"""
+import asyncio
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+import pytest
+
+import server
+
+OPERATIONS = int(os.environ.get("STRESS_OPERATIONS", "1500"))
+SEEDS = [int(seed) for seed in os.environ.get("STRESS_SEEDS", "1,2").split(",")]
+MONGO_URL = os.environ.get("STRESS_MONGO_URL")
+ROOMS = {"deluxe": 4, "suite": 2}
+GUESTS = 12
+HORIZON_DAYS = 30
+MAX_WAVE = 16
+TARGET_STATUSES = ["checked_in", "checked_out", "cancelled", "confirmed", "no_show"]
+
+SCOPED_METHODS = [
+    "find_one", "count_documents", "distinct", "insert_one", "insert_many", "update_one", "update_many",
+    "find_one_and_update", "find_one_and_delete", "delete_one", "delete_many",
+]
+
+
+def interleave(monkeypatch, rng: random.Random):
+    """Yield to the event loop before every scoped database call."""
+    for name in SCOPED_METHODS:
+        method = getattr(server.ScopedCollection, name)
+
+        def wrapper(self, *args, __method=method, **kwargs):
+            async def call():
+                for _ in range(rng.randint(0, 3)):
+                    await asyncio.sleep(0)
+                return await __method(self, *args, **kwargs)
+            return call()
+
+        monkeypatch.setattr(server.ScopedCollection, name, wrapper)
+
+
+def connect_database(seed: int, app_database):
+    if MONGO_URL:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        return app_database(AsyncIOMotorClient(MONGO_URL), f"stress_{seed}")
+    return app_database(db_name=f"stress_{seed}")
+
+
+async def drain_jobs():
+    while True:
+        job = await server.job_queue.claim()
+        if job is None:
+            return
+        await server.job_queue.run_job(job)
+
+
+class Schedule:
+    """A seeded random workload and the outcomes the API reported."""
+
+    def __init__(self, rng: random.Random, client, rooms: list):
+        self.rng = rng
+        self.client = client
+        self.rooms = rooms
+        self.booking_ids = []
+        self.expenses = 0.0
+        self.outcomes = Counter()
+
+    async def create_booking(self):
+        check_in = date.today() + timedelta(days=self.rng.randrange(HORIZON_DAYS))
+        response = await self.client.post("/api/bookings", json={
+            "room_id": self.rng.choice(self.rooms)["room_id"],
+            "guest_name": "Stress Guest",
+            "guest_email": f"guest{self.rng.randrange(GUESTS)}@example.com",
+            "check_in": check_in.isoformat(),
+            "check_out": (check_in + timedelta(days=self.rng.randint(1, 5))).isoformat(),
+            "advance_payment": self.rng.choice([0.0, 0.0, 50.0])
+        })
+        # 400: the availability check saw a conflict; 409: a concurrent claim won the room
+        assert response.status_code in (200, 400, 409), response.text
+        if response.status_code == 200:
+            self.booking_ids.append(response.json()["booking_id"])
+        self.outcomes[f"create_booking {response.status_code}"] += 1
+
+    async def update_status(self):
+        if not self.booking_ids:
+            return await self.create_booking()
+        booking_id = self.rng.choice(self.booking_ids)
+        response = await self.client.put(f"/api/bookings/{booking_id}/status", json={
+            "status": self.rng.choice(TARGET_STATUSES),
+            "additional_charges": self.rng.choice([0.0, 0.0, 25.5]),
+            "advance_payment_received": self.rng.choice([0.0, 0.0, 40.0])
+        })
+        assert response.status_code in (200, 409), response.text
+        self.outcomes[f"update_status {response.status_code}"] += 1
+
+    async def create_expense(self):
+        amount = round(self.rng.uniform(1, 500), 2)
+        response = await self.client.post("/api/expenses", json={
+            "category": self.rng.choice(["supplies", "utilities", "maintenance"]),
+            "amount": amount,
+            "description": "Stress expense",
+            "date": date.today().isoformat()
+        })
+        assert response.status_code == 200, response.text
+        self.expenses += amount
+        self.outcomes["create_expense 200"] += 1
+
+    async def run(self, operations: int):
+        actions = [self.create_booking, self.update_status, self.create_expense]
+        done = 0
+        while done < operations:
+            wave = min(self.rng.randint(1, MAX_WAVE), operations - done)
+            await asyncio.gather(*[self.rng.choices(actions, weights=[5, 4, 1])[0]() for _ in range(wave)])
+            done += wave
+
+
+async def check_invariants(schedule: Schedule):
+    db = server.db
+    rooms = {room["room_id"]: room for room in await db.rooms.find().to_list(None)}
+    bookings = await db.bookings.find().to_list(None)
+    active = [booking for booking in bookings if booking["status"] in server.ACTIVE_BOOKING_STATUSES]
+
+    # No double booking, and claims cover exactly the active stays
+    by_room = defaultdict(list)
+    for booking in active:
+        by_room[booking["room_id"]].append(booking)
+    for stays in by_room.values():
+        stays.sort(key=lambda booking: booking["check_in"])
+        for before, after in zip(stays, stays[1:]):
+            assert before["check_out"] <= after["check_in"], f"double booking: {before} and {after}"
+    claims = {(claim["room_id"], claim["night"], claim["booking_id"]) for claim in await db.room_nights.find().to_list(None)}
+    expected = {
+        (booking["room_id"], night, booking["booking_id"])
+        for booking in active
+        for night in server.stay_nights(booking["check_in"], booking["check_out"])
+    }
+    assert claims == expected
+
+    # Sales match folio charges; folios match their ledgers
+    sales = defaultdict(float)
+    for sale in await db.sales.find().to_list(None):
+        if sale["kind"] in ("room", "additional"):
+            sales[sale["booking_id"]] += sale["amount"]
+    entries = defaultdict(lambda: {"charge": 0.0, "payment": 0.0, "count": 0})
+    for entry in await db.folio_entries.find().to_list(None):
+        entries[entry["booking_id"]][entry["entry_type"]] += entry["amount"]
+        entries[entry["booking_id"]]["count"] += 1
+    for folio in await db.folios.find().to_list(None):
+        ledger = entries[folio["booking_id"]]
+        assert folio["charges_total"] == pytest.approx(sales[folio["booking_id"]]), folio
+        assert folio["charges_total"] == pytest.approx(ledger["charge"])
+        assert folio["payments_total"] == pytest.approx(ledger["payment"])
+        assert folio["balance"] == pytest.approx(ledger["charge"] - ledger["payment"])
+        assert folio["entry_count"] == ledger["count"]
+    assert set(sales) <= {folio["booking_id"] for folio in await db.folios.find().to_list(None)}
+
+    # Occupancy never exceeds the rooms of a type, in MongoDB or the caches
+    start = date.today()
+    end = start + timedelta(days=HORIZON_DAYS + 5)
+    nightly = defaultdict(Counter)
+    for booking in active:
+        for night in server.stay_nights(booking["check_in"], booking["check_out"]):
+            nightly[rooms[booking["room_id"]]["room_type"]][night.date()] += 1
+    for room_type, count in ROOMS.items():
+        assert max(nightly[room_type].values(), default=0) <= count
+    await server.booking_store.ensure_fresh()
+    store_occupancy = server.booking_store.get().nightly_occupancy(start, end)
+    assert store_occupancy.max() <= len(rooms)
+    assert store_occupancy.tolist() == [
+        sum(nightly[room_type][start + timedelta(days=offset)] for room_type in ROOMS)
+        for offset in range((end - start).days)
+    ]
+    await server.rate_calendar.ensure_fresh()
+    calendar = server.rate_calendar.get()
+    first = (start - calendar.origin).days
+    for room_type, row in calendar.type_index.items():
+        occupancy = calendar.occupancy[row, first:first + (end - start).days]
+        assert occupancy.max() <= calendar.room_counts[row]
+        assert occupancy.tolist() == [
+            nightly[room_type][start + timedelta(days=offset)] for offset in range((end - start).days)
+        ]
+
+    # Every accepted expense was recorded once
+    total = 0.0
+    async for row in db.expenses.aggregate([{"$group": {"_id": None, "total": {"$sum": "$amount"}}}]):
+        total = row["total"]
+    assert total == pytest.approx(schedule.expenses)
+
+
+async def run_seed(seed: int, monkeypatch, app_database, admin_api) -> dict:
+    rng = random.Random(seed)
+    mongo_client = connect_database(seed, app_database)
+    async with admin_api() as client:
+        rooms = [
+            await client.add_room(f"{room_type}-{number}", room_type)
+            for room_type, count in ROOMS.items() for number in range(count)
+        ]
+
+        schedule = Schedule(rng, client, rooms)
+        interleave(monkeypatch, rng)
+        started = time.perf_counter()
+        await schedule.run(OPERATIONS)
+        elapsed = time.perf_counter() - started
+        await drain_jobs()
+        await check_invariants(schedule)
+    if MONGO_URL:
+        await mongo_client.drop_database(f"stress_{seed}")
+    return {"elapsed": elapsed, "outcomes": schedule.outcomes}
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_booking_invariants_hold_under_concurrency(seed, monkeypatch, app_database, admin_api):
+    result = asyncio.run(run_seed(seed, monkeypatch, app_database, admin_api))
+    print(f"seed {seed}: {OPERATIONS} operations in {result['elapsed']:.2f}s "
+          f"({OPERATIONS / result['elapsed']:.0f} ops/s) {dict(result['outcomes'])}")
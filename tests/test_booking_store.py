@@ -0,0 +1,31 @@
+import asyncio
+from datetime import datetime
+
+import server
+
+
+def booking(booking_id, status="confirmed"):
+    return {"booking_id": booking_id, "room_id": "r1", "check_in": datetime(2030, 1, 1),
+            "check_out": datetime(2030, 1, 3), "status": status, "total_amount": 200.0}
+
+
+async def rebuild_twice(store):
+    await server.db.bookings.insert_many([booking("b1"), booking("b2")])
+    await store.rebuild()
+    first = store.stale
+    await store.rebuild()
+    return first, store.stale, store.size
+
+
+def test_change_during_rebuild_keeps_store_stale(mock_mongo, monkeypatch):
+    store = server.BookingStore(chunk_size=1)
+    append = store.append
+
+    def cancelled_while_loading(chunk):
+        append(chunk)
+        # b1 was cancelled after the rebuild had already read it
+        if chunk[0]["booking_id"] == "b1" and store.generation == 0:
+            store.apply_booking_change(booking("b1", "cancelled"), "confirmed")
+
+    monkeypatch.setattr(store, "append", cancelled_while_loading)
+    assert asyncio.run(rebuild_twice(store)) == (True, False, 2)
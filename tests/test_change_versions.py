@@ -0,0 +1,23 @@
+import asyncio
+
+import server
+
+
+async def versions_seen():
+    versions = server.change_versions.get()
+    seen = []
+    async with versions.stamp() as version:
+        seen.append((version, await versions.current()))
+    seen.append(await versions.current())
+
+    # Another stamp has bumped the counter but its reply has not arrived yet
+    versions.in_flight += 1
+    await server.db.counters.update_one({"name": "change_version"}, {"$inc": {"value": 1}})
+    seen.append(await versions.current())
+    versions.in_flight -= 1
+    seen.append(await versions.current())
+    return seen
+
+
+def test_current_never_runs_ahead_of_an_unfinished_stamp(mock_mongo):
+    assert asyncio.run(versions_seen()) == [(1, 0), 1, 1, 2]
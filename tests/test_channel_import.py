@@ -0,0 +1,77 @@
+import asyncio
+from datetime import date, timedelta
+
+import server
+
+CHECK_IN = date.today() + timedelta(days=30)
+BATCH = {"reservations": [{
+    "reservation_id": "R-1", "room_code": "DBL", "guest_name": "Retry Guest",
+    "check_in": CHECK_IN.isoformat(), "check_out": (CHECK_IN + timedelta(days=2)).isoformat()
+}]}
+
+
+async def add_channel(client, room_numbers):
+    """Create double rooms and an OTA channel selling them; return the channel id."""
+    for room_number in room_numbers:
+        await client.add_room(room_number)
+    response = await client.post("/api/channels", json={
+        "name": "OTA", "endpoint_url": "http://127.0.0.1:1", "api_key": "secret",
+        "room_type_codes": {"double": "DBL"}
+    })
+    return response.json()["channel_id"]
+
+
+async def deliver_twice(admin_api):
+    async with admin_api() as client:
+        channel_id = await add_channel(client, ["101"])
+        unsigned = await client.post(f"/api/channels/{channel_id}/reservations", json=BATCH)
+        responses = await asyncio.gather(*[
+            client.post(f"/api/channels/{channel_id}/reservations", json=BATCH, headers={"X-Channel-Key": "secret"})
+            for _ in range(2)
+        ])
+        bookings = await server.db.bookings.count_documents({})
+        waitlisted = await server.db.waitlist.count_documents({})
+    return unsigned, responses, bookings, waitlisted
+
+
+def test_concurrent_redelivery_books_once(mock_mongo, admin_api):
+    # Admin credentials do not stand in for the channel key
+    unsigned, responses, bookings, waitlisted = asyncio.run(deliver_twice(admin_api))
+    assert unsigned.status_code == 401
+    assert [response.status_code for response in responses] == [200, 200]
+    results = sorted((response.json()["created"], response.json()["duplicates"]) for response in responses)
+    assert results == [(0, 1), (1, 0)]
+    assert bookings == 1
+    assert waitlisted == 0
+
+
+async def deliver_while_a_guest_books(monkeypatch, admin_api):
+    async with admin_api() as client:
+        channel_id = await add_channel(client, ["101", "102"])
+        place_booking = server.place_booking
+        direct = []
+
+        async def guest_books_first(room, *args, **kwargs):
+            # A walk-in takes the room the import picked after its calendar was loaded
+            if kwargs.get("payment_method") == "ota" and not direct:
+                direct.append(await client.post("/api/bookings", json={
+                    "room_id": room["room_id"], "guest_name": "Walk-in", "check_in": BATCH["reservations"][0]["check_in"],
+                    "check_out": BATCH["reservations"][0]["check_out"]
+                }))
+            return await place_booking(room, *args, **kwargs)
+
+        monkeypatch.setattr(server, "place_booking", guest_books_first)
+        response = await client.post(f"/api/channels/{channel_id}/reservations", json=BATCH,
+                                     headers={"X-Channel-Key": "secret"})
+        rooms = {booking["room_id"] for booking in await server.db.bookings.find({"status": "confirmed"}).to_list(None)}
+        waitlisted = await server.db.waitlist.count_documents({})
+    return direct[0], response, rooms, waitlisted
+
+
+def test_stale_calendar_is_reloaded_and_the_reservation_booked(mock_mongo, monkeypatch, admin_api):
+    direct, response, rooms, waitlisted = asyncio.run(deliver_while_a_guest_books(monkeypatch, admin_api))
+    assert direct.status_code == 200, direct.text
+    assert response.status_code == 200, response.text
+    assert (response.json()["created"], response.json()["overbooked"]) == (1, 0)
+    assert len(rooms) == 2
+    assert waitlisted == 0
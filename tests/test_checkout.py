@@ -0,0 +1,29 @@
+import asyncio
+from datetime import date, timedelta
+
+import server
+
+
+async def check_out(admin_api, payments):
+    async with admin_api() as client:
+        balances = []
+        for number, payment in enumerate(payments):
+            room = await client.add_room(str(101 + number))
+            response = await client.post("/api/bookings", json={
+                "room_id": room["room_id"], "guest_name": "Checkout Guest",
+                "check_in": date.today().isoformat(), "check_out": (date.today() + timedelta(days=2)).isoformat()
+            })
+            booking_id = response.json()["booking_id"]
+            await client.put(f"/api/bookings/{booking_id}/status", json={"status": "checked_in"})
+            response = await client.put(f"/api/bookings/{booking_id}/status", json={
+                "status": "checked_out", "payment_received": payment, "payment_method": "card"
+            })
+            assert response.status_code == 200, response.text
+            entries = await server.db.folio_entries.count_documents({"booking_id": booking_id, "entry_type": "payment"})
+            balances.append((response.json()["balance_due"], response.json()["payment_status"], entries))
+    return balances
+
+
+def test_checkout_leaves_the_balance_open_unless_paid(mock_mongo, admin_api):
+    total = 2 * 100.0
+    assert asyncio.run(check_out(admin_api, [0.0, total])) == [(total, "pending", 0), (0.0, "paid", 1)]
@@ -0,0 +1,31 @@
+import asyncio
+
+import server
+
+
+def test_preferred_encoding_follows_quality_values():
+    available = ["br", "gzip"]
+    assert server.preferred_encoding("gzip, deflate, br", available) == "br"
+    assert server.preferred_encoding("br;q=0.5, gzip", available) == "gzip"
+    assert server.preferred_encoding("br;q=0, gzip;q=0", available) is None
+    assert server.preferred_encoding("gzip;q=0, *", available) == "br"
+    assert server.preferred_encoding("*;q=0", available) is None
+    assert server.preferred_encoding("identity", available) is None
+    assert server.preferred_encoding("", available) is None
+
+
+async def fetch_rooms(admin_api, accept_encodings):
+    async with admin_api() as client:
+        for number in range(20):
+            await client.add_room(str(100 + number))
+        encodings = []
+        for accept_encoding in accept_encodings:
+            response = await client.get("/api/rooms", headers={"Accept-Encoding": accept_encoding})
+            assert len(response.json()) == 20
+            encodings.append(response.headers.get("content-encoding"))
+    return encodings
+
+
+def test_refused_encodings_are_not_sent(mock_mongo, admin_api):
+    encodings = asyncio.run(fetch_rooms(admin_api, ["gzip", "gzip;q=0", "gzip;q=0, identity", "br;q=0, gzip;q=0.5"]))
+    assert encodings == ["gzip", None, None, "gzip"]
@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import sys
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import generate_hotel_data  # noqa: E402
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+AS_OF = date(2024, 6, 1)
+
+
+def options(**overrides):
+    defaults = {
+        "property": "generated", "rooms": 12, "years": 1.0, "guests": 300, "as_of": AS_OF, "seed": 7,
+        "occupancy": 0.7, "seasonality": 0.18, "mean_stay": 2.5, "mean_lead_days": 24.0, "cancel_rate": 0.12,
+        "no_show_rate": 0.02, "walk_in_rate": 0.08, "batch_size": 500, "workers": 4, "progress": 0,
+        "drop": False, "profiles": False,
+    }
+    return argparse.Namespace(**{**defaults, **overrides})
+
+
+async def load(database, name):
+    return await database[name].find({"property_id": "generated"}, {"_id": 0}).to_list(None)
+
+
+def test_workload_is_consistent_and_deterministic():
+    async def run():
+        database = mongomock_motor.AsyncMongoMockClient()["generated"]
+        counts = await generate_hotel_data.generate(database, options())
+        bookings = await load(database, "bookings")
+        assert counts["bookings"] == len(bookings) > 1000
+        statuses = Counter(booking["status"] for booking in bookings)
+        assert set(statuses) == {"confirmed", "checked_in", "checked_out", "cancelled", "no_show"}
+        assert any(booking["special_requests"] == "Walk-in" for booking in bookings)
+        as_of = datetime.combine(AS_OF, datetime.min.time())
+        assert all(booking["created_at"].date() <= AS_OF for booking in bookings)
+        assert all(booking["check_out"] <= as_of for booking in bookings if booking["status"] == "checked_out")
+        assert all(booking["check_in"] > as_of for booking in bookings if booking["status"] == "confirmed")
+
+        # No room is double booked and claims cover exactly the active stays
+        active = [booking for booking in bookings if booking["status"] in ("confirmed", "checked_in")]
+        stays = defaultdict(list)
+        for booking in bookings:
+            if booking["status"] != "cancelled":
+                stays[booking["room_id"]].append(booking)
+        for room_stays in stays.values():
+            room_stays.sort(key=lambda booking: booking["check_in"])
+            for before, after in zip(room_stays, room_stays[1:]):
+                assert before["check_out"] <= after["check_in"]
+        claims = {(claim["room_id"], claim["night"]) for claim in await load(database, "room_nights")}
+        assert claims == {
+            (booking["room_id"], night)
+            for booking in active
+            for night in generate_hotel_data.server.stay_nights(booking["check_in"], booking["check_out"])
+        }
+
+        # Folios agree with their sales and ledger entries
+        sales = defaultdict(float)
+        for sale in await load(database, "sales"):
+            sales[sale["booking_id"]] += sale["amount"]
+        entries = defaultdict(list)
+        for entry in await load(database, "folio_entries"):
+            entries[entry["booking_id"]].append(entry)
+        for folio in await load(database, "folios"):
+            ledger = sorted(entries[folio["booking_id"]], key=lambda entry: entry["sequence"])
+            assert folio["charges_total"] == pytest.approx(sales[folio["booking_id"]])
+            assert folio["entry_count"] == len(ledger)
+            assert folio["balance"] == pytest.approx(ledger[-1]["balance_after"])
+        assert await load(database, "expenses")
+
+        # The same seed generates the same documents
+        again = mongomock_motor.AsyncMongoMockClient()["generated"]
+        await generate_hotel_data.generate(again, options())
+        assert await load(again, "bookings") == bookings
+        assert await load(again, "expenses") == await load(database, "expenses")
+
+    asyncio.run(run())
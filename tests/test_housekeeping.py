@@ -0,0 +1,21 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import server
+
+
+async def cancel_after_check_in(status, room_id):
+    await server.db.rooms.insert_one({"room_id": room_id, "room_number": "204", "room_type": "double",
+                                      "price_per_night": 100.0, "status": "occupied"})
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    booking = {"booking_id": f"b-{room_id}", "room_id": room_id, "status": status,
+               "check_in": today - timedelta(days=1), "check_out": today + timedelta(days=1)}
+    await server.update_housekeeping(booking, "checked_in")
+    room = await server.db.rooms.find_one({"room_id": room_id})
+    tasks = await server.db.housekeeping_tasks.find({"room_id": room_id}).to_list(None)
+    return room["status"], [(task["task_type"], task["booking_id"]) for task in tasks]
+
+
+def test_cancelling_a_checked_in_stay_turns_the_room_over(mock_mongo):
+    for status in ["cancelled", "no_show"]:
+        assert asyncio.run(cancel_after_check_in(status, status)) == ("dirty", [("checkout_clean", f"b-{status}")])
@@ -0,0 +1,18 @@
+import asyncio
+
+import server
+
+
+def sale(sale_id):
+    return {"sale_id": sale_id, "booking_id": "b1", "kind": "room", "amount": 100.0}
+
+
+async def record_twice():
+    first = await server.record_sales_job({"sales": [sale("s1")]})
+    # A retried job carries the sale it already recorded
+    second = await server.record_sales_job({"sales": [sale("s1"), sale("s2")]})
+    return first, second, await server.db.sales.count_documents({})
+
+
+def test_recorded_counts_only_newly_inserted_sales(mock_mongo):
+    assert asyncio.run(record_twice()) == ({"recorded": 1}, {"recorded": 1}, 2)
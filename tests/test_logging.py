@@ -0,0 +1,62 @@
+import json
+import logging
+import queue
+
+import server
+
+
+def make_handler(capacity: int, burst: int = 10):
+    handler = server.DroppingQueueHandler(queue.Queue(maxsize=capacity))
+    sampler = server.ErrorSampler(burst, window=60.0)
+    handler.addFilter(sampler)
+    test_logger = logging.getLogger(f"test_logging.{capacity}.{burst}")
+    test_logger.propagate = False
+    test_logger.handlers = [handler]
+    return test_logger, handler, sampler
+
+
+def test_full_queue_drops_and_counts_instead_of_blocking():
+    test_logger, handler, _ = make_handler(capacity=5)
+    for number in range(8):
+        test_logger.warning("record %d", number)
+    assert handler.queue.qsize() == 5
+    assert handler.dropped == 3
+
+
+def test_repeated_errors_from_one_call_site_are_sampled():
+    test_logger, handler, sampler = make_handler(capacity=100, burst=3)
+
+    def fail(count: int):
+        for number in range(count):
+            test_logger.error(f"Database error {number}")
+
+    fail(10)
+    test_logger.error("Another call site")
+    assert handler.queue.qsize() == 4
+    assert sampler.suppressed == 7
+
+    # The first error of the next window reports what was suppressed
+    for site in sampler.sites.values():
+        site[0] -= 60.0
+    fail(2)
+    records = [handler.queue.get_nowait() for _ in range(handler.queue.qsize())]
+    assert records[-2].suppressed == 7
+
+
+def test_records_carry_request_context_as_json():
+    test_logger, handler, _ = make_handler(capacity=10)
+    scope = {"path": "/api/bookings/abc", "method": "GET"}
+    token = server.log_context.set({"request_id": "req-1", "method": "GET", "scope": scope})
+    try:
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            test_logger.exception("Get booking error")
+    finally:
+        server.log_context.reset(token)
+
+    entry = json.loads(server.JsonFormatter().format(handler.queue.get_nowait()))
+    assert entry["request_id"] == "req-1"
+    assert entry["route"] == "/api/bookings/abc"
+    assert entry["level"] == "ERROR"
+    assert "ValueError: boom" in entry["exception"]
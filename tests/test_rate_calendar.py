@@ -0,0 +1,28 @@
+import asyncio
+from datetime import date
+
+import server
+
+
+async def rebuild_twice(calendar):
+    await server.db.rooms.insert_one({"room_id": "r1", "room_type": "double", "price_per_night": 100.0})
+    await calendar.rebuild(date(2030, 1, 1))
+    first = calendar.stale
+    await calendar.rebuild(date(2030, 1, 1))
+    return first, calendar.stale
+
+
+def test_invalidation_during_rebuild_keeps_calendar_stale(mock_mongo, monkeypatch):
+    calendar = server.RateCalendar(horizon_days=30)
+    base_rate_factors = server.base_rate_factors
+    calls = []
+
+    def invalidated_once(*args):
+        # A rule changes after the rebuild has read the rules
+        if not calls:
+            calendar.invalidate()
+        calls.append(args)
+        return base_rate_factors(*args)
+
+    monkeypatch.setattr(server, "base_rate_factors", invalidated_once)
+    assert asyncio.run(rebuild_twice(calendar)) == (True, False)
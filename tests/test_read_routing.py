@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).parent.parent / "backend"
+REPLICA_SET_URL = os.environ.get("MONGO_REPLICA_SET_URL")
+REQUESTS = 20
+
+OPTIONS_SCRIPT = """
+import server
+for name, secondary in [("bookings", False), ("folio_entries", False), ("rooms", False), ("sales", True)]:
+    collection = server.tenant_router.collection(server.DEFAULT_PROPERTY_ID, name, secondary)
+    print(name, collection.write_concern.document.get("w"), collection.read_preference.mongos_mode,
+          collection.read_preference.max_staleness)
+"""
+
+# Exercise the reporting endpoints through the full app against MONGO_URL
+REPORTS_SCRIPT = f"""
+import os
+import server
+from fastapi.testclient import TestClient
+with TestClient(server.app) as client:
+    for _ in range({REQUESTS}):
+        assert client.get("/api/dashboard/stats").status_code == 200
+        assert client.get("/api/sales").status_code == 200
+    os._exit(0)
+"""
+
+
+def test_collections_get_configured_write_concern_and_read_preference():
+    env = {**os.environ, "MONGO_URL": "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=500"}
+    result = subprocess.run(
+        [sys.executable, "-c", OPTIONS_SCRIPT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    options = {line.split()[0]: line.split()[1:] for line in result.stdout.splitlines()}
+    assert options["bookings"] == ["majority", "primary", "-1"], result.stderr
+    assert options["folio_entries"] == ["majority", "primary", "-1"]
+    assert options["rooms"] == ["None", "primary", "-1"]
+    assert options["sales"] == ["majority", "secondaryPreferred", "90"]
+
+
+def read_counters(url: str) -> dict:
+    """aggregate + find commands served by each replica set member."""
+    import pymongo
+
+    with pymongo.MongoClient(url) as client:
+        hosts = client.admin.command("hello")["hosts"]
+    counters = {}
+    for host in hosts:
+        with pymongo.MongoClient(f"mongodb://{host}/?directConnection=true") as member:
+            status = member.admin.command("serverStatus")
+            commands = status["metrics"]["commands"]
+            counters[host] = (status["repl"]["ismaster"],
+                              commands["aggregate"]["total"] + commands["find"]["total"])
+    return counters
+
+
+@pytest.mark.skipif(not REPLICA_SET_URL, reason="MONGO_REPLICA_SET_URL is not set")
+def test_reporting_reads_move_off_the_primary():
+    before = read_counters(REPLICA_SET_URL)
+    env = {**os.environ, "MONGO_URL": REPLICA_SET_URL, "DB_NAME": "read_routing_test"}
+    result = subprocess.run(
+        [sys.executable, "-c", REPORTS_SCRIPT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    after = read_counters(REPLICA_SET_URL)
+
+    primary_reads = sum(after[host][1] - before[host][1] for host in after if after[host][0])
+    secondary_reads = sum(after[host][1] - before[host][1] for host in after if not after[host][0])
+    # Each round trip reads several collections; warm-up reads stay on the primary
+    assert secondary_reads >= 2 * REQUESTS
+    assert primary_reads < REQUESTS
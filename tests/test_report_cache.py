@@ -0,0 +1,22 @@
+import server
+
+
+def test_secondary_results_are_cached_apart_and_briefly(monkeypatch):
+    cache = server.ReportCache(ttl=60.0, secondary_ttl=5.0)
+    report = server.ReportQuery(source="expenses")
+    primary_key = cache.key(report)
+    token = server.secondary_reads.set(True)
+    try:
+        secondary_key = cache.key(report)
+    finally:
+        server.secondary_reads.reset(token)
+    assert secondary_key != primary_key
+
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    cache.put(secondary_key, [{"count": 1}])
+    assert cache.get(primary_key) is None
+    cache.put(primary_key, [{"count": 2}])
+    now[0] += 10
+    assert cache.get(secondary_key) is None
+    assert cache.get(primary_key) == [{"count": 2}]
@@ -0,0 +1,41 @@
+from datetime import date
+
+import server
+
+RANGE = {"start_date": date(2030, 1, 1), "end_date": date(2030, 4, 1)}
+
+
+def lookups(pipeline):
+    return [stage["$lookup"] for stage in pipeline if "$lookup" in stage]
+
+
+def test_joins_stay_within_the_property():
+    report = server.ReportQuery(source="sales", filters=RANGE, group_by=["room_type"])
+    joined = lookups(server.compile_report(report))
+    assert [lookup["from"] for lookup in joined] == ["bookings", "rooms"]
+    for lookup in joined:
+        assert lookup["let"]["property_id"] == "$property_id"
+        assert {"$eq": ["$property_id", "$$property_id"]} in lookup["pipeline"][0]["$match"]["$expr"]["$and"]
+
+
+def test_ranges_before_the_cutoff_read_the_archive():
+    report = server.ReportQuery(source="sales", filters={**RANGE, "payment_method": ["card"]}, group_by=["room_type"])
+    pipeline = server.compile_report(report, archive_cutoff=server.datetime(2030, 2, 1))
+    union = pipeline[1]["$unionWith"]
+    assert union["coll"] == "sales_archive"
+    assert union["pipeline"][0]["$match"]["property_id"] == server.DEFAULT_PROPERTY_ID
+    assert union["pipeline"][0]["$match"]["payment_method"] == {"$in": ["card"]}
+    assert [lookup["from"] for lookup in lookups(pipeline)] == ["bookings_archive", "bookings", "rooms"]
+
+    # Ranges after the cutoff and unarchived sources read only the live collection
+    assert not any("$unionWith" in stage for stage in server.compile_report(report, server.datetime(2030, 1, 1)))
+    expenses = server.ReportQuery(source="expenses", filters=RANGE)
+    assert not any("$unionWith" in stage for stage in server.compile_report(expenses, server.datetime(2030, 2, 1)))
+
+
+def test_every_report_collection_is_indexed_on_its_date_field():
+    # The leading $match (and the archive union's) is bounded by the date field
+    leading_keys = {(collection, keys[0][0]) for collection, keys, _ in server.INDEXES}
+    for name, source in server.REPORT_SOURCES.items():
+        for collection in filter(None, [name, source["archive"]]):
+            assert (collection, source["date_field"]) in leading_keys
@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import server
+
+CHECK_IN = datetime(2030, 3, 4)
+
+
+async def book(booking_id, room_id, nights=2):
+    booking = {
+        "booking_id": booking_id, "room_id": room_id, "guest_name": booking_id, "status": "confirmed",
+        "check_in": CHECK_IN, "check_out": CHECK_IN + timedelta(days=nights)
+    }
+    await server.db.bookings.insert_one(dict(booking))
+    assert await server.claim_room_nights([booking])
+
+
+async def claims():
+    return sorted(
+        (claim["room_id"], claim["night"].day, claim["booking_id"])
+        for claim in await server.db.room_nights.find({}).to_list(None)
+    )
+
+
+async def swap_then_conflict():
+    await server.ensure_indexes()
+    await book("a", "101")
+    await book("b", "102")
+    assert await server.apply_room_moves({"a": ("101", "102"), "b": ("102", "101")})
+    swapped = await claims()
+    rooms = {booking["booking_id"]: booking["room_id"] for booking in await server.db.bookings.find({}).to_list(None)}
+
+    # Another booking already holds the second night of the target room
+    await server.db.room_nights.insert_one({"room_id": "103", "night": CHECK_IN + timedelta(days=1), "booking_id": "c"})
+    before = await claims()
+    moved = await server.apply_room_moves({"a": ("102", "103")})
+    return swapped, rooms, moved, before, await claims()
+
+
+def test_swap_hands_nights_over_and_conflicts_change_nothing(mock_mongo):
+    swapped, rooms, moved, before, after = asyncio.run(swap_then_conflict())
+    assert swapped == [("101", 4, "b"), ("101", 5, "b"), ("102", 4, "a"), ("102", 5, "a")]
+    assert rooms == {"a": "102", "b": "101"}
+    assert moved is False
+    assert after == before
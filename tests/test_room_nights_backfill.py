@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import server
+
+
+def booking(booking_id, room_id, check_in, nights=2, status="confirmed"):
+    return {"booking_id": booking_id, "room_id": room_id, "status": status,
+            "check_in": check_in, "check_out": check_in + timedelta(days=nights)}
+
+
+async def backfill():
+    await server.ensure_indexes()
+    soon = datetime.combine(datetime.utcnow().date(), datetime.min.time()) + timedelta(days=10)
+    claimed = booking("claimed", "101", soon)
+    await server.db.bookings.insert_many([
+        claimed,
+        booking("legacy", "102", soon),
+        booking("past", "103", soon - timedelta(days=30)),
+        booking("cancelled", "104", soon, status="cancelled"),
+    ])
+    await server.claim_room_nights([claimed])
+    await server.backfill_room_nights(batch_size=2)
+    # Running it again claims nothing twice
+    await server.backfill_room_nights(batch_size=2)
+    claims = await server.db.room_nights.find({}).to_list(None)
+    return sorted((claim["booking_id"], claim["room_id"]) for claim in claims)
+
+
+def test_backfill_claims_only_unclaimed_active_stays(mock_mongo):
+    assert asyncio.run(backfill()) == [
+        ("claimed", "101"), ("claimed", "101"), ("legacy", "102"), ("legacy", "102")
+    ]
+
+
+async def migrate_legacy_booking(database):
+    check_in = datetime.combine(datetime.utcnow().date(), datetime.min.time()) + timedelta(days=3)
+    # Written before multi-property support: no property_id and no claims
+    await database.bookings.insert_one(booking("legacy", "101", check_in))
+    assert await server.run_migrations()
+    found = await server.db.bookings.find_one({"booking_id": "legacy"})
+    claims = await server.db.room_nights.count_documents({"booking_id": "legacy"})
+    return found is not None, claims
+
+
+def test_migrations_expose_and_claim_legacy_bookings(mock_mongo):
+    database = mock_mongo[server.tenant_router.default_db_name]
+    assert asyncio.run(migrate_legacy_booking(database)) == (True, 2)
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent / "backend"
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", "3.0"))
+
+# Serve one request through the full lifespan, then exit without waiting for
+# background workers that may still be trying to reach MongoDB.
+CHILD_SCRIPT = """
+import os
+import time
+started = time.perf_counter()
+import server
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(server.app) as client:
+    response = client.get("/api/")
+    print(response.status_code, imported - started, time.perf_counter() - started, flush=True)
+    os._exit(0)
+"""
+
+
+def test_time_to_first_request_is_under_budget():
+    # An unreachable database must not delay the first request: startup migrations
+    # give up after one failed ping (bounded by serverSelectionTimeoutMS)
+    env = {**os.environ, "MONGO_URL": "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=500"}
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    elapsed = time.perf_counter() - started
+
+    status_code, import_seconds, first_request_seconds = result.stdout.split()
+    assert status_code == "200", result.stderr
+    assert elapsed < STARTUP_BUDGET_SECONDS, (
+        f"time to first request {elapsed:.2f}s (import {float(import_seconds):.2f}s, "
+        f"first response {float(first_request_seconds):.2f}s) exceeds {STARTUP_BUDGET_SECONDS}s"
+    )
+
+
+def test_heavy_modules_are_not_loaded_at_import():
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, server; print(type(sys.modules['numpy']).__name__)"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60
+    )
+    assert result.stdout.strip() == "_LazyModule", result.stderr
@@ -0,0 +1,20 @@
+import asyncio
+
+import server
+
+
+async def list_rooms(property_ids):
+    transport = server.httpx.ASGITransport(app=server.app)
+    async with server.httpx.AsyncClient(transport=transport, base_url="http://tenancy") as client:
+        return [
+            (await client.get("/api/rooms", headers={"X-Property-ID": property_id})).status_code
+            for property_id in property_ids
+        ]
+
+
+def test_only_registered_properties_are_served(mock_mongo, monkeypatch):
+    monkeypatch.setattr(server.tenant_router, "routes", {"harbour": {}})
+    statuses = asyncio.run(list_rooms([server.DEFAULT_PROPERTY_ID, "harbour", "made-up-1", "made-up-2"]))
+    assert statuses == [200, 200, 404, 404]
+    # Unknown properties get no caches
+    assert set(server.collection_versions.instances) == {server.DEFAULT_PROPERTY_ID, "harbour"}